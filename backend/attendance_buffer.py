@@ -0,0 +1,243 @@
+"""
+Buffer write-behind para /attendance/mark (opcional, ATTENDANCE_WRITE_BEHIND=true).
+Las marcas se validan contra la ventana de la reunión, se responden de inmediato y se encolan en memoria;
+un hilo las escribe cada ATTENDANCE_FLUSH_MS o cada ATTENDANCE_FLUSH_ROWS filas con un solo
+INSERT ... ON CONFLICT de varias filas. Así las escrituras escalan con los lotes y no con los usuarios.
+
+La respuesta lleva el id definitivo de la fila, igual que sin buffer: el de la fila existente (los invitados ya
+tienen una) o uno reservado de la secuencia de attendance, que el INSERT usa explícitamente.
+"""
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import Attendance, Meeting
+from crud import _auto_attendance_status, materialize_occurrence
+import log
+
+logger = log.get_logger(__name__)
+
+
+ENABLED = os.getenv("ATTENDANCE_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+FLUSH_MS = int(os.getenv("ATTENDANCE_FLUSH_MS", "200"))
+FLUSH_ROWS = int(os.getenv("ATTENDANCE_FLUSH_ROWS", "500"))
+BUFFER_MAX = int(os.getenv("ATTENDANCE_BUFFER_MAX", "10000"))
+# Cuánto espera una marca por espacio en la cola antes de responder 503 (backpressure)
+ENQUEUE_TIMEOUT_MS = int(os.getenv("ATTENDANCE_ENQUEUE_TIMEOUT_MS", "50"))
+MEETING_WINDOW_TTL_SECONDS = float(os.getenv("MEETING_WINDOW_TTL_SECONDS", "30"))
+MEETING_WINDOW_CACHE_SIZE = int(os.getenv("MEETING_WINDOW_CACHE_SIZE", "4096"))
+
+
+@dataclass
+class PendingMark:
+    id: int
+    user_id: int
+    meeting_id: int
+    status: str
+    marked_at: datetime
+
+
+_queue: "queue.Queue[PendingMark]" = queue.Queue(maxsize=BUFFER_MAX)
+# Última marca encolada por (user_id, meeting_id), para read-your-writes antes del flush
+_pending: dict[tuple[int, int], PendingMark] = {}
+_pending_lock = threading.Lock()
+
+# Ventanas de reunión cacheadas (LRU acotado, igual que user_cache): meeting_id -> (expira, (start_time,
+# end_time, repeat_weekly)). Las reuniones inexistentes no se cachean: ids inventados no llenan el cache.
+_windows: "OrderedDict[int, tuple[float, tuple[Optional[datetime], Optional[datetime], bool]]]" = OrderedDict()
+_windows_lock = threading.Lock()
+
+_thread: Optional[threading.Thread] = None
+_stopping = threading.Event()
+
+
+def _meeting_window(db: Session, meeting_id: int):
+    now = time.monotonic()
+    with _windows_lock:
+        entry = _windows.get(meeting_id)
+        if entry is not None:
+            if entry[0] > now:
+                _windows.move_to_end(meeting_id)
+                return entry[1]
+            del _windows[meeting_id]
+    row = db.query(Meeting.start_time, Meeting.end_time, Meeting.repeat_weekly).filter(Meeting.id == meeting_id).first()
+    if row is None:
+        return None
+    window = (row.start_time, row.end_time, row.repeat_weekly)
+    with _windows_lock:
+        _windows[meeting_id] = (now + MEETING_WINDOW_TTL_SECONDS, window)
+        _windows.move_to_end(meeting_id)
+        while len(_windows) > MEETING_WINDOW_CACHE_SIZE:
+            _windows.popitem(last=False)
+    return window
+
+
+def invalidate_meeting(meeting_id: int):
+    """Olvida la ventana cacheada de una reunión (llamar si cambian sus horarios)."""
+    with _windows_lock:
+        _windows.pop(meeting_id, None)
+
+
+def _reserve_id(db: Session, user_id: int, meeting_id: int) -> int:
+    """Id de la fila de la marca: el de la asistencia existente o uno nuevo de la secuencia (una sola consulta)."""
+    with _pending_lock:
+        previous = _pending.get((user_id, meeting_id))
+    if previous is not None:
+        return previous.id
+    existing = (
+        select(Attendance.id)
+        .where(Attendance.user_id == user_id, Attendance.meeting_id == meeting_id)
+        .scalar_subquery()
+    )
+    reserved = func.nextval(func.pg_get_serial_sequence("attendance", "id"))
+    return db.execute(select(func.coalesce(existing, reserved))).scalar()
+
+
+def mark(db: Session, user_id: int, meeting_id: int) -> PendingMark:
+    """Valida la marca, la encola y la devuelve sin esperar a la BD."""
+    window = _meeting_window(db, meeting_id)
+    if window is None:
+        raise HTTPException(status_code=404, detail="Meeting not found")
+    start_time, end_time, repeat_weekly = window
+    now = datetime.now(timezone.utc)
+    if repeat_weekly:
+        # Serie semanal: la marca va a la fila de la ocurrencia en curso (se crea aquí la primera vez)
+        instance_id = materialize_occurrence(db, meeting_id, now)
+        db.commit()
+        if instance_id is None:
+            raise HTTPException(status_code=400, detail="No occurrence of this meeting is in progress")
+        meeting_id = instance_id
+        start_time, end_time, _ = _meeting_window(db, meeting_id)
+    status = _auto_attendance_status(SimpleNamespace(start_time=start_time, end_time=end_time), now)
+
+    record = PendingMark(
+        id=_reserve_id(db, user_id, meeting_id), user_id=user_id, meeting_id=meeting_id, status=status, marked_at=now
+    )
+    key = (user_id, meeting_id)
+    # Se publica antes de encolar para que el flusher siempre encuentre (y limpie) su propia entrada
+    with _pending_lock:
+        previous = _pending.get(key)
+        _pending[key] = record
+    try:
+        _queue.put(record, timeout=ENQUEUE_TIMEOUT_MS / 1000)
+    except queue.Full:
+        with _pending_lock:
+            if _pending.get(key) is record:
+                if previous is not None:
+                    _pending[key] = previous
+                else:
+                    del _pending[key]
+        raise HTTPException(status_code=503, detail="Attendance buffer full, please retry", headers={"Retry-After": "1"})
+    return record
+
+
+def get_pending(user_id: int, meeting_id: int) -> Optional[PendingMark]:
+    with _pending_lock:
+        return _pending.get((user_id, meeting_id))
+
+
+def _upsert(db: Session, records: list[PendingMark]):
+    stmt = pg_insert(Attendance).values([
+        {"id": r.id, "user_id": r.user_id, "meeting_id": r.meeting_id, "status": r.status, "marked_at": r.marked_at}
+        for r in records
+    ])
+    # Si la fila ya existe conserva su id (el reservado solo se usa para filas nuevas)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_attendance_user_meeting",
+        set_={"status": stmt.excluded.status},
+    )
+    db.execute(stmt)
+
+
+def _write(records: list[PendingMark]):
+    """Escribe un lote; si una fila rompe una FK (usuario/reunión borrados) se reintenta fila a fila."""
+    # ON CONFLICT no admite dos filas con la misma clave en un mismo INSERT: gana la última
+    latest = {(r.user_id, r.meeting_id): r for r in records}
+    batch = list(latest.values())
+    db: Session = SessionLocal()
+    try:
+        try:
+            _upsert(db, batch)
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            for record in batch:
+                try:
+                    _upsert(db, [record])
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()
+                    logger.warning("Marca descartada (user=%s, meeting=%s)", record.user_id, record.meeting_id)
+    finally:
+        db.close()
+    with _pending_lock:
+        for key, record in latest.items():
+            if _pending.get(key) is record:
+                del _pending[key]
+
+
+def _drain(first: PendingMark) -> list[PendingMark]:
+    records = [first]
+    deadline = time.monotonic() + FLUSH_MS / 1000
+    while len(records) < FLUSH_ROWS:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            records.append(_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return records
+
+
+def _run():
+    while True:
+        try:
+            first = _queue.get(timeout=FLUSH_MS / 1000)
+        except queue.Empty:
+            if _stopping.is_set():
+                return
+            continue
+        records = _drain(first)
+        # Si la BD falla se reintenta el mismo lote: las marcas ya se confirmaron al cliente
+        while True:
+            try:
+                _write(records)
+                break
+            except Exception as e:
+                logger.exception("Error escribiendo %s marcas de asistencia: %s", len(records), e)
+                if _stopping.is_set():
+                    return
+                time.sleep(1)
+
+
+def start():
+    global _thread
+    if not ENABLED or (_thread is not None and _thread.is_alive()):
+        return
+    _stopping.clear()
+    _thread = threading.Thread(target=_run, name="attendance-write-behind", daemon=True)
+    _thread.start()
+
+
+def stop(timeout: float = 30):
+    """Vacía la cola y detiene el hilo (llamar desde el lifespan al apagar)."""
+    global _thread
+    if _thread is None:
+        return
+    _stopping.set()
+    _thread.join(timeout=timeout)
+    _thread = None
@@ -1,10 +1,15 @@
 from datetime import datetime, timedelta
+import os
 from jose import JWTError, jwt
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status
 from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
 import crud
-from db import get_db
+import crud_async
+import passwords
+import user_cache
+from db import get_db, get_async_db
 
 
 
@@ -12,6 +17,9 @@ SECRET_KEY = "supersecretkey"  # cámbialo por una variable de entorno
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+# Modo sin estado: la identidad sale de los claims del token (uid, adm, ver) y de un cache
+# en memoria, sin consultar la base de datos en cada request.
+JWT_STATELESS = os.getenv("JWT_STATELESS", "false").lower() in ("1", "true", "yes")
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -20,29 +28,102 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def create_user_token(user, expires_delta: timedelta | None = None):
+    """Emite el token de un usuario con los claims usados por el modo sin estado."""
+    return create_access_token(
+        data={
+            "sub": user.email,
+            "uid": user.id,
+            "adm": bool(user.is_admin),
+            "ver": user.token_version or 0,
+        },
+        expires_delta=expires_delta,
+    )
+
+
 
 
+async def authenticate_user(db: Session, email: str, password: str):
+    """Verifica credenciales; bcrypt corre en el pool de procesos y la BD en el threadpool.
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = crud.get_user_by_email(db, email)
-    if not user or not crud.verify_password(password, user.hashed_password):
+    Si el hash guardado usa un costo distinto a BCRYPT_ROUNDS se reemplaza de forma transparente.
+    """
+    user = await run_in_threadpool(crud.get_user_by_email, db, email)
+    if not user:
         return None
+    valid, new_hash = await passwords.verify_and_update_async(password, user.hashed_password)
+    if not valid:
+        return None
+    if new_hash:
+        await run_in_threadpool(crud.update_user_password_hash, db, user.id, new_hash)
     return user
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    user = crud.get_user_by_email(db, email)
+        raise _credentials_exception()
+    if payload.get("sub") is None:
+        raise _credentials_exception()
+    return payload
+
+
+def _is_stateless(payload: dict) -> bool:
+    return JWT_STATELESS and payload.get("uid") is not None
+
+
+def _cached_identity(payload: dict):
+    """Devuelve la identidad cacheada si sirve para este token; None si hay que ir a la BD."""
+    cached = user_cache.get(payload["uid"])
+    if cached is None or cached.token_version < payload.get("ver", 0):
+        return None
+    return cached
+
+
+def _check_token_version(payload: dict, cached):
+    """Un token con una versión anterior a la del usuario (cambio de email/contraseña) se rechaza."""
+    if cached.token_version != payload.get("ver", 0):
+        raise _credentials_exception()
+    return cached
+
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    payload = _decode_token(token)
+    if _is_stateless(payload):
+        # Identidad desde los claims; solo consulta la BD si el cache no la tiene
+        cached = _cached_identity(payload)
+        if cached is None:
+            user = crud.get_user(db, payload["uid"])
+            if user is None:
+                raise _credentials_exception()
+            cached = user_cache.put(user)
+        return _check_token_version(payload, cached)
+    user = crud.get_user_by_email(db, payload["sub"])
     if user is None:
-        raise credentials_exception
-    return user
\ No newline at end of file
+        raise _credentials_exception()
+    return user
+
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db=Depends(get_async_db)):
+    """Igual que get_current_user pero sobre AsyncSession (solo con DB_ASYNC habilitado)."""
+    payload = _decode_token(token)
+    if _is_stateless(payload):
+        cached = _cached_identity(payload)
+        if cached is None:
+            user = await crud_async.get_user(db, payload["uid"])
+            if user is None:
+                raise _credentials_exception()
+            cached = user_cache.put(user)
+        return _check_token_version(payload, cached)
+    user = await crud_async.get_user_by_email(db, payload["sub"])
+    if user is None:
+        raise _credentials_exception()
+    return user
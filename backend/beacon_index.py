@@ -0,0 +1,302 @@
+"""
+Índice en memoria beacon (major, minor) -> reuniones ordenadas por inicio.
+Permite resolver qué reunión está activa (o es la siguiente) en un beacon sin consultar la BD.
+Se carga una vez, se actualiza en cada alta/cambio de beacon o reunión de este proceso y se recarga
+periódicamente desde el scheduler para recoger cambios hechos por otros workers.
+
+Las series semanales se indexan expandidas en sus ocurrencias (recurrence.py) desde la retención hasta
+RECURRENCE_DEFAULT_WEEKS semanas; una ocurrencia no materializada lleva el id de la serie (series=True) y
+se reemplaza por su fila cuando se materializa.
+"""
+import bisect
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import Beacon, Meeting
+import log
+import recurrence
+
+logger = log.get_logger(__name__)
+
+
+BEACON_INDEX_REFRESH_SECONDS = int(os.getenv("BEACON_INDEX_REFRESH_SECONDS", "60"))
+# Las reuniones terminadas se conservan este tiempo, para resolver avistamientos que se suben tarde
+# (igual a la antigüedad máxima que acepta POST /sightings)
+BEACON_INDEX_RETENTION_SECONDS = int(
+    os.getenv("BEACON_INDEX_RETENTION_SECONDS", os.getenv("SIGHTINGS_MAX_AGE_SECONDS", "3600"))
+)
+
+
+@dataclass(frozen=True, order=True)
+class MeetingInterval:
+    start_time: datetime
+    end_time: datetime
+    meeting_id: int
+    title: str
+    # Ocurrencia no materializada: meeting_id es el id de la serie
+    series: bool = False
+
+
+def _as_utc(dt: datetime) -> datetime:
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+class BeaconIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._beacon_by_key: dict[tuple[int, int], str] = {}
+        self._key_by_beacon: dict[str, tuple[int, int]] = {}
+        # Por beacon: intervalos ordenados por inicio y la lista paralela de inicios (para bisect)
+        self._intervals: dict[str, list[MeetingInterval]] = {}
+        self._starts: dict[str, list[datetime]] = {}
+        self._beacon_of_meeting: dict[int, str] = {}
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self, db: Session):
+        """Reconstruye el índice: beacons + reuniones con beacon que no terminaron hace más de la retención."""
+        now = datetime.now(timezone.utc)
+        cutoff = now - timedelta(seconds=BEACON_INDEX_RETENTION_SECONDS)
+        horizon = now + timedelta(weeks=recurrence.RECURRENCE_DEFAULT_WEEKS)
+        beacons = db.query(Beacon.id, Beacon.major, Beacon.minor).all()
+        meetings = (
+            db.query(
+                Meeting.id, Meeting.title, Meeting.start_time, Meeting.end_time, Meeting.beacon_id,
+                Meeting.series_id, Meeting.occurrence_start,
+            )
+            .filter(
+                Meeting.beacon_id.isnot(None),
+                Meeting.start_time.isnot(None),
+                Meeting.end_time > cutoff,
+                # La fila de una serie es solo su primera ocurrencia: se expande abajo
+                Meeting.repeat_weekly.is_(False),
+            )
+            .all()
+        )
+        series = (
+            db.query(
+                Meeting.id, Meeting.title, Meeting.start_time, Meeting.end_time, Meeting.beacon_id,
+                Meeting.repeat_until,
+            )
+            .filter(
+                Meeting.beacon_id.isnot(None),
+                Meeting.repeat_weekly.is_(True),
+                Meeting.series_id.is_(None),
+                Meeting.start_time < horizon,
+                Meeting.end_time.isnot(None),
+                or_(
+                    Meeting.repeat_until.is_(None),
+                    Meeting.repeat_until + (Meeting.end_time - Meeting.start_time) > cutoff,
+                ),
+            )
+            .all()
+        )
+        # Ocurrencias que no se expanden: canceladas o ya materializadas (están en `meetings`)
+        skip = recurrence.cancelled_occurrences(db, [s.id for s in series])
+        for m in meetings:
+            if m.series_id is not None:
+                skip.setdefault(m.series_id, set()).add(_as_utc(m.occurrence_start))
+        beacon_by_key = {}
+        key_by_beacon = {}
+        for beacon_id, major, minor in beacons:
+            if major is not None and minor is not None:
+                beacon_by_key[(major, minor)] = beacon_id
+                key_by_beacon[beacon_id] = (major, minor)
+        intervals: dict[str, list[MeetingInterval]] = {}
+        beacon_of_meeting = {}
+        for m in meetings:
+            intervals.setdefault(m.beacon_id, []).append(
+                MeetingInterval(_as_utc(m.start_time), _as_utc(m.end_time), m.id, m.title)
+            )
+            beacon_of_meeting[m.id] = m.beacon_id
+        for s in series:
+            items = intervals.setdefault(s.beacon_id, [])
+            for occ_start, occ_end in recurrence.occurrences(
+                s.start_time, s.end_time, s.repeat_until, cutoff, horizon, skip.get(s.id, ())
+            ):
+                items.append(MeetingInterval(occ_start, occ_end, s.id, s.title, series=True))
+            beacon_of_meeting[s.id] = s.beacon_id
+        for items in intervals.values():
+            items.sort()
+        with self._lock:
+            self._beacon_by_key = beacon_by_key
+            self._key_by_beacon = key_by_beacon
+            self._intervals = intervals
+            self._starts = {b: [i.start_time for i in items] for b, items in intervals.items()}
+            self._beacon_of_meeting = beacon_of_meeting
+            self._loaded = True
+
+    # ----- Actualizaciones incrementales -----
+    def upsert_beacon(self, beacon_id: str, major: Optional[int], minor: Optional[int]):
+        with self._lock:
+            old_key = self._key_by_beacon.pop(beacon_id, None)
+            if old_key is not None and self._beacon_by_key.get(old_key) == beacon_id:
+                del self._beacon_by_key[old_key]
+            if major is not None and minor is not None:
+                self._beacon_by_key[(major, minor)] = beacon_id
+                self._key_by_beacon[beacon_id] = (major, minor)
+
+    def remove_beacon(self, beacon_id: str):
+        self.upsert_beacon(beacon_id, None, None)
+        with self._lock:
+            for interval in self._intervals.pop(beacon_id, []):
+                self._beacon_of_meeting.pop(interval.meeting_id, None)
+            self._starts.pop(beacon_id, None)
+
+    def _remove_meeting_locked(self, meeting_id: int):
+        beacon_id = self._beacon_of_meeting.pop(meeting_id, None)
+        if beacon_id is None:
+            return
+        # Una serie tiene un intervalo por ocurrencia
+        items = [i for i in self._intervals.get(beacon_id, []) if i.meeting_id != meeting_id]
+        self._intervals[beacon_id] = items
+        self._starts[beacon_id] = [i.start_time for i in items]
+
+    def _insert_locked(self, beacon_id: str, interval: MeetingInterval):
+        items = self._intervals.setdefault(beacon_id, [])
+        starts = self._starts.setdefault(beacon_id, [])
+        pos = bisect.bisect_left(items, interval)
+        items.insert(pos, interval)
+        starts.insert(pos, interval.start_time)
+        self._beacon_of_meeting[interval.meeting_id] = beacon_id
+
+    def _remove_occurrence_locked(self, series_id: int, occurrence_start: datetime):
+        beacon_id = self._beacon_of_meeting.get(series_id)
+        if beacon_id is None:
+            return
+        items = self._intervals.get(beacon_id, [])
+        for pos, interval in enumerate(items):
+            if interval.series and interval.meeting_id == series_id and interval.start_time == occurrence_start:
+                del items[pos]
+                del self._starts[beacon_id][pos]
+                break
+
+    def upsert_meeting(
+        self,
+        meeting_id: int,
+        title: str,
+        start_time,
+        end_time,
+        beacon_id: Optional[str],
+        series_id: Optional[int] = None,
+    ):
+        """Indexa una reunión simple; con `series_id` es una ocurrencia materializada y reemplaza a la
+        ocurrencia expandida de la serie que empieza a la misma hora."""
+        with self._lock:
+            self._remove_meeting_locked(meeting_id)
+            if series_id is not None and start_time is not None:
+                self._remove_occurrence_locked(series_id, _as_utc(start_time))
+            if beacon_id is None or start_time is None or end_time is None:
+                return
+            self._insert_locked(beacon_id, MeetingInterval(_as_utc(start_time), _as_utc(end_time), meeting_id, title))
+
+    def upsert_series(self, series_id: int, title: str, start_time, end_time, repeat_until, beacon_id: Optional[str]):
+        """Indexa las ocurrencias de una serie nueva hasta RECURRENCE_DEFAULT_WEEKS semanas."""
+        with self._lock:
+            self._remove_meeting_locked(series_id)
+            if beacon_id is None or start_time is None or end_time is None:
+                return
+            now = datetime.now(timezone.utc)
+            for occ_start, occ_end in recurrence.occurrences(
+                start_time, end_time, repeat_until, now, now + timedelta(weeks=recurrence.RECURRENCE_DEFAULT_WEEKS)
+            ):
+                self._insert_locked(beacon_id, MeetingInterval(occ_start, occ_end, series_id, title, series=True))
+            self._beacon_of_meeting[series_id] = beacon_id
+
+    def remove_occurrence(self, series_id: int, occurrence_start: datetime):
+        """Quita una ocurrencia cancelada de una serie."""
+        with self._lock:
+            self._remove_occurrence_locked(series_id, _as_utc(occurrence_start))
+
+    def remove_meeting(self, meeting_id: int):
+        with self._lock:
+            self._remove_meeting_locked(meeting_id)
+
+    # ----- Consulta -----
+    def beacon_id_for(self, beacon_id: Optional[str] = None, major: Optional[int] = None, minor: Optional[int] = None):
+        """Devuelve el id del beacon si es conocido, buscándolo por id o por (major, minor)."""
+        with self._lock:
+            if beacon_id is not None:
+                return beacon_id if beacon_id in self._key_by_beacon else None
+            return self._beacon_by_key.get((major, minor))
+
+    def snapshot(self, beacon_id: str) -> tuple[list[datetime], list[MeetingInterval]]:
+        """Copia de (inicios, intervalos) del beacon, para resolver muchos instantes sin tomar el lock."""
+        with self._lock:
+            return list(self._starts.get(beacon_id, [])), list(self._intervals.get(beacon_id, []))
+
+    def resolve(self, major: int, minor: int, now: Optional[datetime] = None):
+        """Devuelve (beacon_id, intervalo, activo) o None si el beacon no existe.
+
+        El intervalo es la reunión en curso en ese beacon o, si no hay, la siguiente (o None).
+        """
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            beacon_id = self._beacon_by_key.get((major, minor))
+            if beacon_id is None:
+                return None
+            items = self._intervals.get(beacon_id, [])
+            starts = self._starts.get(beacon_id, [])
+            pos = bisect.bisect_right(starts, now)
+            # Reuniones del mismo beacon no se solapan: solo la anterior puede estar en curso
+            if pos > 0 and items[pos - 1].end_time > now:
+                return beacon_id, items[pos - 1], True
+            # Descartar lo que terminó antes de la retención para que el índice no crezca con el historial
+            # (sin solapes, el orden por inicio es también el orden por fin)
+            cutoff = now - timedelta(seconds=BEACON_INDEX_RETENTION_SECONDS)
+            expired = 0
+            while expired < pos and items[expired].end_time <= cutoff:
+                if not items[expired].series:
+                    self._beacon_of_meeting.pop(items[expired].meeting_id, None)
+                expired += 1
+            if expired:
+                del items[:expired]
+                del starts[:expired]
+                pos -= expired
+            if pos < len(items):
+                return beacon_id, items[pos], False
+            return beacon_id, None, False
+
+
+index = BeaconIndex()
+
+
+def reload():
+    """Recarga completa desde la BD (job periódico del scheduler)."""
+    db: Session = SessionLocal()
+    try:
+        index.load(db)
+    except Exception as e:
+        logger.exception("Error recargando el indice de beacons: %s", e)
+    finally:
+        db.close()
+
+
+def ensure_loaded():
+    if not index.loaded:
+        reload()
+
+
+def interval_at(starts: list[datetime], intervals: list[MeetingInterval], at: datetime) -> Optional[MeetingInterval]:
+    """Reunión (u ocurrencia de una serie) en curso en el instante `at` dentro de un snapshot de un beacon."""
+    pos = bisect.bisect_right(starts, at)
+    if pos > 0 and intervals[pos - 1].end_time >= at:
+        return intervals[pos - 1]
+    return None
+
+
+def resolve(major: int, minor: int):
+    ensure_loaded()
+    return index.resolve(major, minor)
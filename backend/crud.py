@@ -1,14 +1,27 @@
-from models import User, Meeting, Attendance, Beacon, MeetingReport, GeneralReport
+from models import User, Meeting, MeetingException, Attendance, Beacon, MeetingReport, GeneralReport, AttendanceDailyCount
 from schemas import UserCreate, MeetingCreate, BeaconCreate, BeaconUpdate
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy import and_, or_, tuple_, select, literal, literal_column, case, func, cast, Date
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException
-from datetime import datetime, timezone, timedelta
+from dataclasses import dataclass, replace
+from datetime import date, datetime, timezone, timedelta
 from zoneinfo import ZoneInfo
+import user_cache
+import scheduler
+import beacon_index
+import intervals
+import report_triggers
+import recurrence
+import log
+from passwords import pwd_context
+from pagination import decode_cursor
 
 
 CHILE_TZ = ZoneInfo("America/Santiago")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+logger = log.get_logger(__name__)
 
 
 # User CRUD operations
@@ -16,8 +29,9 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 def get_user_by_email(db: Session, email: str):
     return db.query(User).filter(User.email == email).first()
 
-def create_user(db: Session, user: UserCreate):
-    hashed_pw = pwd_context.hash(user.password)
+def create_user(db: Session, user: UserCreate, hashed_password: str | None = None):
+    # hashed_password permite pasar un hash ya calculado fuera del request (ver passwords.py)
+    hashed_pw = hashed_password or pwd_context.hash(user.password)
     db_user = User(name=user.name, email=user.email, hashed_password=hashed_pw, is_admin=user.is_admin if hasattr(user, "is_admin") else False)
     db.add(db_user)
     db.commit()
@@ -28,12 +42,44 @@ def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def update_user_password_hash(db: Session, user_id: int, hashed_password: str):
+    """Reemplaza el hash almacenado (rehash al cambiar el costo de bcrypt); no invalida tokens."""
+    user_instance = db.query(User).filter(User.id == user_id).first()
+    if user_instance:
+        user_instance.hashed_password = hashed_password
+        db.commit()
+    return user_instance
+
+
+
+
 
 
+def get_users(db: Session, limit: int | None = None, cursor: str | None = None):
+    # Keyset por id (PK): cada página es un index range scan
+    query = db.query(User)
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        query = query.filter(User.id > last_id)
+    query = query.order_by(User.id)
+    if limit:
+        query = query.limit(limit)
+    return query.all()
 
+# Columnas de schemas.User, para las listas que se serializan directo desde las filas (ver serialization.py)
+USER_ROW_COLUMNS = (User.id, User.email, User.name, User.is_admin, User.onesignal_player_id)
 
-def get_users(db: Session):
-    return db.query(User).all()
+
+def get_users_rows(db: Session, limit: int | None = None, cursor: str | None = None) -> list[dict]:
+    """Igual que get_users, pero solo las columnas de la respuesta y como dicts (sin objetos ORM)."""
+    stmt = select(*USER_ROW_COLUMNS)
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        stmt = stmt.where(User.id > last_id)
+    stmt = stmt.order_by(User.id)
+    if limit:
+        stmt = stmt.limit(limit)
+    return [row._asdict() for row in db.execute(stmt)]
 
 def get_user(db: Session, user_id: int):
     return db.query(User).filter(User.id == user_id).first()
@@ -43,6 +89,7 @@ def delete_user(db: Session, user_id: int):
     if user_instance:
         db.delete(user_instance)
         db.commit()
+        user_cache.invalidate(user_id)
     return user_instance
 
 def update_user(db: Session, user_id: int, new_email: str = None, new_password: str = None):
@@ -52,8 +99,12 @@ def update_user(db: Session, user_id: int, new_email: str = None, new_password:
             user_instance.email = new_email
         if new_password:
             user_instance.hashed_password = pwd_context.hash(new_password)
+        if new_email or new_password:
+            # Los tokens emitidos con la versión anterior dejan de ser válidos
+            user_instance.token_version = (user_instance.token_version or 0) + 1
         db.commit()
         db.refresh(user_instance)
+        user_cache.invalidate(user_id)
     return user_instance
 
 
@@ -64,6 +115,7 @@ def update_user_player_id(db: Session, user_id: int, player_id: str):
         user_instance.onesignal_player_id = player_id
         db.commit()
         db.refresh(user_instance)
+        user_cache.invalidate(user_id)
     return user_instance
 
 
@@ -74,25 +126,97 @@ def update_user_player_id(db: Session, user_id: int, player_id: str):
 
 
 # ================= Meetings =================
-def _convert_meeting_to_chile(meeting: Meeting):
-    """Convert meeting datetime fields to America/Santiago for responses (non-persistent).
-    Assumes stored times are UTC (or naive treated as UTC).
+_OVERLAP_MESSAGES = {
+    "ex_meetings_beacon_during": (
+        "Overlap detected: another meeting is scheduled on the same beacon "
+        "within the selected time window"
+    ),
+    "ex_meetings_room_during": (
+        "Overlap detected: another meeting is scheduled in the same location "
+        "within the selected time window"
+    ),
+}
+
+
+def _raise_overlap_error(error: IntegrityError):
+    """Traduce una violación de las restricciones de solapamiento (SQLSTATE 23P01) al 400 de siempre."""
+    orig = error.orig
+    if getattr(orig, "pgcode", None) != "23P01":
+        return
+    constraint = getattr(getattr(orig, "diag", None), "constraint_name", None)
+    raise HTTPException(
+        status_code=400,
+        detail=_OVERLAP_MESSAGES.get(constraint, _OVERLAP_MESSAGES["ex_meetings_room_during"]),
+    )
+
+
+def _check_series_overlaps(
+    db: Session,
+    beacon_id: str | None,
+    room: str | None,
+    start_utc: datetime,
+    end_utc: datetime,
+    repeat_weekly: bool,
+    repeat_until: datetime | None,
+):
+    """Solapamientos en los que intervienen series semanales.
+
+    Las restricciones de exclusión solo ven la fila de cada reunión (la primera ocurrencia de una serie),
+    así que aquí se expanden las ocurrencias de las series del mismo beacon/sala dentro del rango
+    afectado y, si la reunión nueva es una serie, también las suyas.
+
+    Es leer y después insertar: un advisory lock por beacon y por sala (hasta el commit de la transacción)
+    serializa las altas que compiten por el mismo recurso, para que dos no pasen la validación a la vez.
     """
-    if not meeting:
-        return meeting
-    for attr in ("start_time", "end_time", "created_at"):
-        dt = getattr(meeting, attr, None)
-        if dt is None:
+    if repeat_weekly:
+        new_occurrences = list(recurrence.occurrences(
+            start_utc, end_utc, repeat_until, start_utc, recurrence.series_end(start_utc, repeat_until)
+        ))
+    else:
+        new_occurrences = [(start_utc, end_utc)]
+    if not new_occurrences:
+        return
+    range_end = new_occurrences[-1][1]
+
+    # Siempre en el mismo orden (beacon, sala) para no crear esperas cruzadas
+    for column, value, constraint, lock_key in (
+        (Meeting.beacon_id, beacon_id, "ex_meetings_beacon_during", f"meetings:beacon:{beacon_id}"),
+        (Meeting.room, room, "ex_meetings_room_during", f"meetings:room:{room}"),
+    ):
+        if not value:
             continue
-        # treat naive as UTC
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-        try:
-            setattr(meeting, attr, dt.astimezone(CHILE_TZ))
-        except Exception:
-            # fallback: leave as-is
-            setattr(meeting, attr, dt)
-    return meeting
+        db.execute(select(func.pg_advisory_xact_lock(func.hashtext(lock_key))))
+        # Series vigentes en el rango; si la nueva es una serie, también las reuniones simples
+        candidates = [and_(
+            Meeting.repeat_weekly.is_(True),
+            or_(
+                Meeting.repeat_until.is_(None),
+                Meeting.repeat_until + (Meeting.end_time - Meeting.start_time) > start_utc,
+            ),
+        )]
+        if repeat_weekly:
+            candidates.append(and_(Meeting.repeat_weekly.is_(False), Meeting.end_time > start_utc))
+        rows = (
+            db.query(Meeting.id, Meeting.start_time, Meeting.end_time, Meeting.repeat_weekly, Meeting.repeat_until)
+            .filter(
+                column == value,
+                Meeting.series_id.is_(None),
+                Meeting.start_time < range_end,
+                Meeting.end_time.isnot(None),
+                or_(*candidates),
+            )
+            .all()
+        )
+        cancelled = recurrence.cancelled_occurrences(db, [r.id for r in rows if r.repeat_weekly])
+        for row in rows:
+            if row.repeat_weekly:
+                existing = recurrence.occurrences(
+                    row.start_time, row.end_time, row.repeat_until, start_utc, range_end, cancelled.get(row.id, ())
+                )
+            else:
+                existing = [(row.start_time, row.end_time)]
+            if recurrence.overlaps(new_occurrences, existing):
+                raise HTTPException(status_code=400, detail=_OVERLAP_MESSAGES[constraint])
 
 
 def create_meeting(db: Session, meeting: MeetingCreate, coordinator_id: int | None = None) -> Meeting:
@@ -109,61 +233,20 @@ def create_meeting(db: Session, meeting: MeetingCreate, coordinator_id: int | No
         end_utc = start_utc + timedelta(minutes=meeting.duration_minutes)
     # If we don't have times, skip overlap validation and let it be created as-is
 
-    # ===== Overlap validation (only if we have a time window) =====
-    if start_utc and end_utc:
-        # If a beacon_id is provided, optionally validate it exists
-        beacon_obj = None
-        if meeting.beacon_id:
-            beacon_obj = db.query(Beacon).filter(Beacon.id == meeting.beacon_id).first()
-            if not beacon_obj:
-                raise HTTPException(status_code=404, detail="Beacon not found")
-
-        # 1) Same beacon overlap check
-        if meeting.beacon_id:
-            conflict_beacon = (
-                db.query(Meeting)
-                .filter(
-                    Meeting.beacon_id == meeting.beacon_id,
-                    Meeting.start_time != None,
-                    Meeting.end_time != None,
-                    Meeting.start_time < end_utc,
-                    Meeting.end_time > start_utc,
-                )
-                .first()
-            )
-            if conflict_beacon:
-                raise HTTPException(
-                    status_code=400,
-                    detail=(
-                        "Overlap detected: another meeting is scheduled on the same beacon "
-                        "within the selected time window"
-                    ),
-                )
+    # If a beacon_id is provided, validate it exists
+    beacon_obj = None
+    if meeting.beacon_id:
+        beacon_obj = db.query(Beacon).filter(Beacon.id == meeting.beacon_id).first()
+        if not beacon_obj:
+            raise HTTPException(status_code=404, detail="Beacon not found")
 
-        # 2) Same location (room) overlap check
-        # Determine the location to compare: payload location, otherwise beacon's location
-        location_key = meeting.location or (beacon_obj.location if beacon_obj else None)
-        if location_key:
-            conflict_location = (
-                db.query(Meeting)
-                .join(Beacon, Meeting.beacon_id == Beacon.id)
-                .filter(
-                    Beacon.location == location_key,
-                    Meeting.start_time != None,
-                    Meeting.end_time != None,
-                    Meeting.start_time < end_utc,
-                    Meeting.end_time > start_utc,
-                )
-                .first()
-            )
-            if conflict_location:
-                raise HTTPException(
-                    status_code=400,
-                    detail=(
-                        "Overlap detected: another meeting is scheduled in the same location "
-                        "within the selected time window"
-                    ),
-                )
+    # Room to book: payload location, otherwise beacon's location
+    location_key = meeting.location or (beacon_obj.location if beacon_obj else None)
+
+    repeat_weekly = bool(meeting.repeat_weekly) if meeting.repeat_weekly is not None else False
+    repeat_until = _as_utc(meeting.repeat_until) if repeat_weekly else None
+    if start_utc and end_utc:
+        _check_series_overlaps(db, meeting.beacon_id, location_key, start_utc, end_utc, repeat_weekly, repeat_until)
 
     db_meeting = Meeting(
         title=meeting.title,
@@ -171,14 +254,34 @@ def create_meeting(db: Session, meeting: MeetingCreate, coordinator_id: int | No
         start_time=start_utc,
         end_time=end_utc,
         topics=meeting.topics,
-        repeat_weekly=bool(meeting.repeat_weekly) if meeting.repeat_weekly is not None else False,
+        repeat_weekly=repeat_weekly,
+        repeat_until=repeat_until,
         note=meeting.note,
         coordinator_id=coordinator_id,
         beacon_id=meeting.beacon_id,
+        room=location_key,
     )
     db.add(db_meeting)
-    db.commit()
+    # ===== Overlap validation =====
+    # Las restricciones de exclusión (beacon/sala + intervalo) rechazan el INSERT de forma atómica
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        _raise_overlap_error(e)
+        raise
     db.refresh(db_meeting)
+    # Programar el recordatorio a su hora exacta en la cola del scheduler
+    scheduler.schedule_meeting(db_meeting.id, db_meeting.start_time)
+    if db_meeting.repeat_weekly:
+        beacon_index.index.upsert_series(
+            db_meeting.id, db_meeting.title, db_meeting.start_time, db_meeting.end_time,
+            db_meeting.repeat_until, db_meeting.beacon_id,
+        )
+    else:
+        beacon_index.index.upsert_meeting(
+            db_meeting.id, db_meeting.title, db_meeting.start_time, db_meeting.end_time, db_meeting.beacon_id
+        )
     # Si el creador/coordinador fue pasado, asegúrese de que exista una fila de Attendance
     # con status 'absent' para indicar que está invitado pero aún no confirmó.
     if coordinator_id is not None:
@@ -199,65 +302,392 @@ def create_meeting(db: Session, meeting: MeetingCreate, coordinator_id: int | No
         except Exception:
             # No queremos que la creación de la asistencia bloquee la creación de la reunión.
             db.rollback()
-    # convert for response
-    _convert_meeting_to_chile(db_meeting)
     return db_meeting
 
 
-def list_meetings(db: Session):
-    meetings = db.query(Meeting).order_by(Meeting.start_time.desc().nullslast()).all()
-    for m in meetings:
-        _convert_meeting_to_chile(m)
-    return meetings
+def _as_utc(dt: datetime | None) -> datetime | None:
+    """Normaliza un filtro de fecha: naive se interpreta como hora de Chile (igual que create_meeting)."""
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=CHILE_TZ)
+    return dt.astimezone(timezone.utc)
 
 
-def get_meeting(db: Session, meeting_id: int):
-    meeting = db.query(Meeting).filter(Meeting.id == meeting_id).first()
-    if meeting:
-        print(meeting.start_time)
-        _convert_meeting_to_chile(meeting)
-        print(meeting.start_time)
-    return meeting
+MEETING_ORDER_BY = (Meeting.start_time.desc().nullslast(), Meeting.id.desc())
 
 
-def list_meetings_for_user(db: Session, user_id: int):
-    # Reuniones donde es coordinador
-    coordinator_meetings = (
-        db.query(Meeting)
-        .filter(Meeting.coordinator_id == user_id)
-    )
+def meeting_cursor_key(meeting) -> tuple:
+    """Clave de orden (start_time, id) usada como cursor de las listas de reuniones."""
+    return (meeting.start_time, meeting.id)
 
-    # Reuniones donde fue agregado como asistente
-    attendee_meetings = (
-        db.query(Meeting)
-        .join(Attendance, Attendance.meeting_id == Meeting.id)
-        .filter(Attendance.user_id == user_id)
+
+def _meeting_list_filters(
+    cursor: str | None = None,
+    start_from: datetime | None = None,
+    start_to: datetime | None = None,
+    coordinator_id: int | None = None,
+    beacon_id: str | None = None,
+) -> list:
+    """Condiciones WHERE (filtros + keyset) para listas ordenadas por MEETING_ORDER_BY.
+
+    Se comparten entre las consultas sync (crud) y async (crud_async).
+    """
+    clauses = []
+    start_from = _as_utc(start_from)
+    start_to = _as_utc(start_to)
+    if start_from is not None:
+        clauses.append(Meeting.start_time >= start_from)
+    if start_to is not None:
+        clauses.append(Meeting.start_time < start_to)
+    if coordinator_id is not None:
+        clauses.append(Meeting.coordinator_id == coordinator_id)
+    if beacon_id is not None:
+        clauses.append(Meeting.beacon_id == beacon_id)
+    if cursor:
+        last_start, last_id = decode_cursor(cursor, (datetime, type(None)), int)
+        if last_start is None:
+            # Ya estamos en el tramo final (start_time NULL, ordenado por id desc)
+            clauses.append(Meeting.start_time.is_(None))
+            clauses.append(Meeting.id < last_id)
+        else:
+            clauses.append(or_(
+                tuple_(Meeting.start_time, Meeting.id) < tuple_(last_start, last_id),
+                Meeting.start_time.is_(None),
+            ))
+    return clauses
+
+
+def _meetings_for_user_clause(user_id: int):
+    """Reuniones donde el usuario es coordinador o fue agregado como asistente."""
+    attendee_meeting_ids = select(Attendance.meeting_id).where(Attendance.user_id == user_id)
+    return or_(Meeting.coordinator_id == user_id, Meeting.id.in_(attendee_meeting_ids))
+
+
+# Columnas de schemas.Meeting, en el orden de los campos de MeetingRecord
+MEETING_ROW_COLUMNS = (
+    Meeting.id,
+    Meeting.title,
+    Meeting.description,
+    Meeting.start_time,
+    Meeting.end_time,
+    Meeting.topics,
+    Meeting.repeat_weekly,
+    Meeting.repeat_until,
+    Meeting.note,
+    Meeting.beacon_id,
+    Meeting.created_at,
+    Meeting.coordinator_id,
+    Meeting.series_id,
+    Meeting.occurrence_start,
+)
+
+
+@dataclass(slots=True)
+class UserRecord:
+    """Usuario de solo lectura (columnas de USER_ROW_COLUMNS)."""
+    id: int
+    email: str
+    name: str
+    is_admin: bool
+    onesignal_player_id: str | None
+
+
+@dataclass(slots=True)
+class MeetingRecord:
+    """Reunión de solo lectura para las respuestas, armada desde MEETING_ROW_COLUMNS sin pasar por el ORM.
+    Los horarios quedan como vienen de la BD (UTC); la hora de Chile se aplica al serializar
+    (ver serialization.meeting_dict)."""
+    id: int
+    title: str
+    description: str | None
+    start_time: datetime | None
+    end_time: datetime | None
+    topics: str | None
+    repeat_weekly: bool
+    repeat_until: datetime | None
+    note: str | None
+    beacon_id: str | None
+    created_at: datetime
+    coordinator_id: int | None
+    series_id: int | None
+    occurrence_start: datetime | None
+    location: str | None = None  # del beacon, solo en el detalle
+    coordinator: UserRecord | None = None  # solo en el detalle
+
+
+def _meeting_records(rows) -> list[MeetingRecord]:
+    return [MeetingRecord(*row) for row in rows]
+
+
+def _meetings_stmt(*where):
+    return select(*MEETING_ROW_COLUMNS).where(*where)
+
+
+def list_meetings(db: Session, limit: int | None = None, cursor: str | None = None, **filters) -> list[MeetingRecord]:
+    stmt = _meetings_stmt(*_meeting_list_filters(cursor=cursor, **filters)).order_by(*MEETING_ORDER_BY)
+    if limit:
+        stmt = stmt.limit(limit)
+    return _meeting_records(db.execute(stmt))
+
+
+def get_meeting(db: Session, meeting_id: int) -> MeetingRecord | None:
+    row = db.execute(_meetings_stmt(Meeting.id == meeting_id)).first()
+    return MeetingRecord(*row) if row else None
+
+
+def _meeting_detail_stmt(meeting_id: int):
+    """Reunión + ubicación del beacon + coordinador en una sola consulta (LEFT JOIN)."""
+    return (
+        select(*MEETING_ROW_COLUMNS, Beacon.location, *USER_ROW_COLUMNS)
+        .outerjoin(Beacon, Beacon.id == Meeting.beacon_id)
+        .outerjoin(User, User.id == Meeting.coordinator_id)
+        .where(Meeting.id == meeting_id)
     )
 
-    # Unir ambas sin duplicados
-    meetings = coordinator_meetings.union(attendee_meetings) \
-        .order_by(Meeting.start_time.desc().nullslast()) \
-        .all()
 
-    # Convertir a horario de Chile
-    for m in meetings:
-        _convert_meeting_to_chile(m)
+def _meeting_detail_record(row) -> MeetingRecord | None:
+    if row is None:
+        return None
+    n = len(MEETING_ROW_COLUMNS)
+    user = row[n + 1:]
+    meeting = MeetingRecord(*row[:n], location=row[n])
+    if user[0] is not None:
+        meeting.coordinator = UserRecord(*user)
+    return meeting
 
-    return meetings
 
+def get_meeting_detail(db: Session, meeting_id: int) -> MeetingRecord | None:
+    """Detalle de una reunión (con coordinador y ubicación del beacon) para GET /meeting/{id}."""
+    return _meeting_detail_record(db.execute(_meeting_detail_stmt(meeting_id)).first())
+
+
+def get_meetings_by_ids(db: Session, meeting_ids: list[int]) -> dict[int, Meeting]:
+    """Reuniones por id en una sola consulta (sin convertir horarios), para operaciones en lote."""
+    return {m.id: m for m in db.query(Meeting).filter(Meeting.id.in_(meeting_ids)).all()}
+
+
+def _series_filters(
+    start_from: datetime,
+    start_to: datetime,
+    coordinator_id: int | None = None,
+    beacon_id: str | None = None,
+) -> list:
+    """Series semanales con alguna ocurrencia posible en [start_from, start_to)."""
+    clauses = [
+        Meeting.repeat_weekly.is_(True),
+        Meeting.series_id.is_(None),
+        Meeting.start_time < start_to,
+        Meeting.end_time.isnot(None),
+        or_(
+            Meeting.repeat_until.is_(None),
+            Meeting.repeat_until + (Meeting.end_time - Meeting.start_time) > start_from,
+        ),
+    ]
+    if coordinator_id is not None:
+        clauses.append(Meeting.coordinator_id == coordinator_id)
+    if beacon_id is not None:
+        clauses.append(Meeting.beacon_id == beacon_id)
+    return clauses
+
+
+def _occurrence_view(series: MeetingRecord, occ_start: datetime, occ_end: datetime) -> MeetingRecord:
+    """Ocurrencia virtual (no materializada) de una serie."""
+    return replace(series, start_time=occ_start, end_time=occ_end, series_id=series.id, occurrence_start=occ_start)
+
+
+def _merge_occurrences(
+    meetings: list[MeetingRecord],
+    series: list[MeetingRecord],
+    skip: dict[int, set[datetime]],
+    start_from: datetime,
+    start_to: datetime,
+    cursor: str | None,
+    limit: int | None,
+) -> list:
+    """Intercala las ocurrencias de las series (expandidas con el generador) con la página de reuniones
+    simples, respetando el orden y el cursor de MEETING_ORDER_BY."""
+    after = decode_cursor(cursor, (datetime, type(None)), int) if cursor else None
+    occurrences = []
+    for s in series:
+        for occ_start, occ_end in recurrence.occurrences(
+            s.start_time, s.end_time, s.repeat_until, start_from, start_to, skip.get(s.id, ())
+        ):
+            # Mismo rango que el filtro de las reuniones simples: por hora de inicio
+            if occ_start < start_from:
+                continue
+            if after is not None and (after[0] is None or (occ_start, s.id) >= (after[0], after[1])):
+                continue
+            occurrences.append(_occurrence_view(s, occ_start, occ_end))
+    if not occurrences:
+        return meetings
+    # Las reuniones simples con start_time NULL van al final (NULLS LAST)
+    merged = sorted(
+        meetings + occurrences,
+        key=lambda m: (m.start_time is not None, m.start_time.timestamp() if m.start_time else 0, m.id),
+        reverse=True,
+    )
+    return merged[:limit] if limit else merged
+
+
+def _meetings_for_user_stmt(user_id: int, limit: int | None, cursor: str | None, **filters):
+    stmt = _meetings_stmt(_meetings_for_user_clause(user_id), *_meeting_list_filters(cursor=cursor, **filters))
+    # Las series se agregan expandidas en sus ocurrencias
+    stmt = stmt.where(Meeting.repeat_weekly.is_(False))
+    stmt = stmt.order_by(*MEETING_ORDER_BY)
+    if limit:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def _series_for_user_stmt(
+    user_id: int,
+    start_from: datetime,
+    start_to: datetime,
+    coordinator_id: int | None = None,
+    beacon_id: str | None = None,
+):
+    return _meetings_stmt(
+        _meetings_for_user_clause(user_id),
+        *_series_filters(start_from, start_to, coordinator_id, beacon_id),
+    )
 
 
-# ================= Attendance =================
-def mark_attendance(db: Session, user_id: int, meeting_id: int, status: str = "absent") -> Attendance:
-    # Get raw meeting from DB (UTC) for time comparison
-    meeting = db.query(Meeting).filter(Meeting.id == meeting_id).first()
-    if not meeting:
+def _series_window(start_from: datetime | None, start_to: datetime | None) -> tuple[datetime, datetime]:
+    """Rango en que se expanden las series: el pedido, completando lo que falte con ahora y
+    RECURRENCE_DEFAULT_WEEKS semanas (las series sin repeat_until no tienen fin)."""
+    start_from = _as_utc(start_from) if start_from is not None else datetime.now(timezone.utc)
+    start_to = _as_utc(start_to) if start_to is not None else start_from + timedelta(weeks=recurrence.RECURRENCE_DEFAULT_WEEKS)
+    return start_from, start_to
+
+
+def list_meetings_for_user(db: Session, user_id: int, limit: int | None = None, cursor: str | None = None, **filters):
+    """Reuniones del usuario. Las series semanales se expanden en sus ocurrencias dentro del rango pedido
+    (start_from/start_to) o, si falta, desde ahora hasta RECURRENCE_DEFAULT_WEEKS semanas; las reuniones
+    simples se filtran solo por lo pedido."""
+    # Un solo SELECT con OR (coordinador / asistente) en vez de UNION, para poder paginar por keyset
+    meetings = _meeting_records(db.execute(_meetings_for_user_stmt(user_id, limit, cursor, **filters)))
+
+    start_from, start_to = _series_window(filters.get("start_from"), filters.get("start_to"))
+    stmt = _series_for_user_stmt(user_id, start_from, start_to, filters.get("coordinator_id"), filters.get("beacon_id"))
+    series = _meeting_records(db.execute(stmt))
+    skip = _occurrences_to_skip(db, user_id, [s.id for s in series])
+    return _merge_occurrences(meetings, series, skip, start_from, start_to, cursor, limit)
+
+
+def _occurrences_to_skip(db: Session, user_id: int, series_ids: list[int]) -> dict[int, set[datetime]]:
+    """Ocurrencias que no se expanden: las canceladas y las materializadas que el usuario ya ve como fila."""
+    skip = recurrence.cancelled_occurrences(db, series_ids)
+    if series_ids:
+        rows = (
+            db.query(Meeting.series_id, Meeting.occurrence_start)
+            .filter(Meeting.series_id.in_(series_ids), _meetings_for_user_clause(user_id))
+            .all()
+        )
+        for series_id, occurrence_start in rows:
+            skip.setdefault(series_id, set()).add(occurrence_start)
+    return skip
+
+
+def materialize_occurrence(db: Session, meeting_id: int, at: datetime) -> int | None:
+    """Crea (o encuentra) la fila de la ocurrencia en curso de una serie; None si no es serie o no hay
+    ocurrencia en curso. No hace commit."""
+    series = (
+        db.query(Meeting)
+        .filter(Meeting.id == meeting_id, Meeting.repeat_weekly.is_(True), Meeting.series_id.is_(None))
+        .first()
+    )
+    if series is None or series.start_time is None or series.end_time is None:
+        return None
+    occurrence = recurrence.occurrence_at(
+        series.start_time, series.end_time, series.repeat_until, at,
+        recurrence.cancelled_occurrences(db, [series.id]).get(series.id, ()),
+    )
+    if occurrence is None:
+        return None
+    occ_start, occ_end = occurrence
+    stmt = pg_insert(Meeting).values(
+        title=series.title,
+        description=series.description,
+        start_time=occ_start,
+        end_time=occ_end,
+        topics=series.topics,
+        repeat_weekly=False,
+        note=series.note,
+        coordinator_id=series.coordinator_id,
+        beacon_id=series.beacon_id,
+        room=series.room,
+        series_id=series.id,
+        occurrence_start=occ_start,
+    ).on_conflict_do_nothing(constraint="uq_meetings_series_occurrence").returning(Meeting.id)
+    instance_id = db.execute(stmt).scalar()
+    if instance_id is not None:
+        # Los invitados de la serie quedan invitados (absent) a la ocurrencia, así su reporte cuenta a
+        # todos los invitados y no solo a quienes marcaron
+        invitees = select(Attendance.user_id, literal(instance_id), literal("absent")).where(
+            Attendance.meeting_id == series.id
+        )
+        db.execute(
+            pg_insert(Attendance)
+            .from_select(["user_id", "meeting_id", "status"], invitees)
+            .on_conflict_do_nothing(constraint="uq_attendance_user_meeting")
+        )
+    else:
+        instance_id = (
+            db.query(Meeting.id)
+            .filter(Meeting.series_id == series.id, Meeting.occurrence_start == occ_start)
+            .scalar()
+        )
+    # La fila reemplaza en el índice de beacons a la ocurrencia expandida de la serie
+    beacon_index.index.upsert_meeting(instance_id, series.title, occ_start, occ_end, series.beacon_id, series.id)
+    return instance_id
+
+
+def delete_meeting(db: Session, meeting_id: int) -> bool:
+    """Elimina una reunión (y, si es una serie, sus ocurrencias materializadas); False si no existe."""
+    occurrence_ids = [mid for (mid,) in db.query(Meeting.id).filter(Meeting.series_id == meeting_id)]
+    # DELETE directo: la asistencia, los reportes y las ocurrencias los borra la BD (ON DELETE CASCADE y el
+    # trigger meetings_delete_attendance), sin cargar las filas en la sesión
+    if not db.query(Meeting).filter(Meeting.id == meeting_id).delete(synchronize_session=False):
+        db.rollback()
+        return False
+    db.commit()
+    scheduler.cancel_meeting(meeting_id)
+    for mid in [meeting_id, *occurrence_ids]:
+        beacon_index.index.remove_meeting(mid)
+    return True
+
+
+def cancel_occurrence(db: Session, meeting_id: int, occurrence_start: datetime) -> None:
+    """Cancela una ocurrencia de una serie (excepción); 400 si no corresponde a una ocurrencia."""
+    series = db.query(Meeting).filter(Meeting.id == meeting_id).first()
+    if not series:
         raise HTTPException(status_code=404, detail="Meeting not found")
+    if not series.repeat_weekly or series.start_time is None or series.end_time is None:
+        raise HTTPException(status_code=400, detail="Meeting is not a weekly series")
+    occ_start = _as_utc(occurrence_start)
+    matches = recurrence.occurrences(
+        series.start_time, series.end_time, series.repeat_until, occ_start, occ_start + timedelta(microseconds=1)
+    )
+    if not any(start == occ_start for start, _ in matches):
+        raise HTTPException(status_code=400, detail="No occurrence of this meeting starts at that time")
+    stmt = pg_insert(MeetingException).values(series_id=series.id, occurrence_start=occ_start, cancelled=True)
+    db.execute(stmt.on_conflict_do_update(
+        constraint="uq_meeting_exceptions_occurrence", set_={"cancelled": True}
+    ))
+    db.commit()
+    beacon_index.index.remove_occurrence(series.id, occ_start)
+    # El recordatorio pendiente de la serie puede ser el de esta ocurrencia; la recarga periódica del
+    # scheduler (load_upcoming_meetings) programa el de la siguiente
+    scheduler.cancel_meeting(series.id)
+
 
+# ================= Attendance =================
+def _auto_attendance_status(meeting: Meeting, now_utc: datetime) -> str:
+    """Valida la ventana de tiempo de la reunión y calcula el estado automático (present/late)."""
     if meeting.start_time is None or meeting.end_time is None:
         raise HTTPException(status_code=400, detail="Meeting time window not configured")
 
-    now_utc = datetime.now(timezone.utc)
     start_utc = meeting.start_time
     end_utc = meeting.end_time
     # treat naive DB datetimes as UTC
@@ -275,31 +705,83 @@ def mark_attendance(db: Session, user_id: int, meeting_id: int, status: str = "a
     duration_seconds = (end_utc - start_utc).total_seconds()
     half_time = start_utc + timedelta(seconds=duration_seconds / 2)
     if now_utc <= half_time:
-        auto_status = "present"
-    else:
-        auto_status = "late"
+        return "present"
+    return "late"
 
-    # Find existing attendance
-    existing = (
-        db.query(Attendance)
-        .filter(Attendance.user_id == user_id, Attendance.meeting_id == meeting_id)
-        .first()
-    )
-    if existing:
-        existing.status = auto_status
-        db.commit()
-        db.refresh(existing)
-        return existing
 
-    att = Attendance(user_id=user_id, meeting_id=meeting_id, status=auto_status)
-    db.add(att)
-    db.commit()
-    db.refresh(att)
-    return att
+def _mark_attendance_stmt(user_id: int, meeting_id: int):
+    """INSERT ... SELECT ... ON CONFLICT DO UPDATE ... RETURNING que marca la asistencia en un solo viaje.
 
+    La ventana de tiempo y la regla present/late (mitad de la reunión) se evalúan en SQL con now();
+    si la reunión no existe o no está en curso no se inserta nada y RETURNING viene vacío.
+    Dos marcas simultáneas del mismo usuario convergen en la misma fila (sin violar la unique).
+    """
+    now = func.now()
+    half_time = Meeting.start_time + (Meeting.end_time - Meeting.start_time) / 2
+    auto_status = case((now <= half_time, "present"), else_="late")
+    source = select(literal(user_id), Meeting.id, auto_status).where(
+        Meeting.id == meeting_id,
+        # Las series se marcan en la fila de la ocurrencia (ver materialize_occurrence)
+        Meeting.repeat_weekly.is_(False),
+        Meeting.start_time <= now,
+        Meeting.end_time >= now,
+    )
+    stmt = pg_insert(Attendance).from_select(["user_id", "meeting_id", "status"], source)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_attendance_user_meeting",
+        set_={"status": stmt.excluded.status},
+    )
+    return stmt.returning(
+        Attendance.id, Attendance.user_id, Attendance.meeting_id, Attendance.status, Attendance.marked_at
+    )
 
-def list_attendance_for_user(db: Session, user_id: int):
-    return db.query(Attendance).filter(Attendance.user_id == user_id).all()
+
+def _raise_mark_error(meeting: Meeting | None):
+    """Camino frío: explica por qué el upsert no marcó nada (404/400)."""
+    if not meeting:
+        raise HTTPException(status_code=404, detail="Meeting not found")
+    if meeting.repeat_weekly:
+        raise HTTPException(status_code=400, detail="No occurrence of this meeting is in progress")
+    _auto_attendance_status(meeting, datetime.now(timezone.utc))
+    # La ventana se cerró/abrió justo entre el upsert y esta verificación
+    raise HTTPException(status_code=409, detail="Attendance could not be marked, please retry")
+
+
+def mark_attendance(db: Session, user_id: int, meeting_id: int, status: str = "absent"):
+    row = db.execute(_mark_attendance_stmt(user_id, meeting_id)).first()
+    if row is None:
+        db.rollback()
+        # Si es una serie, se marca en la ocurrencia en curso (creando su fila la primera vez)
+        instance_id = materialize_occurrence(db, meeting_id, datetime.now(timezone.utc))
+        if instance_id is not None:
+            row = db.execute(_mark_attendance_stmt(user_id, instance_id)).first()
+    if row is None:
+        db.rollback()
+        _raise_mark_error(db.query(Meeting).filter(Meeting.id == meeting_id).first())
+    db.commit()
+    return row
+
+
+def list_attendance_for_user(
+    db: Session,
+    user_id: int,
+    limit: int | None = None,
+    cursor: str | None = None,
+    status: str | None = None,
+    meeting_id: int | None = None,
+):
+    query = db.query(Attendance).filter(Attendance.user_id == user_id)
+    if status is not None:
+        query = query.filter(Attendance.status == status)
+    if meeting_id is not None:
+        query = query.filter(Attendance.meeting_id == meeting_id)
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        query = query.filter(Attendance.id > last_id)
+    query = query.order_by(Attendance.id)
+    if limit:
+        query = query.limit(limit)
+    return query.all()
 
 
 def add_attendance(db: Session, user_id: int, meeting_id: int, status: str = "absent") -> Attendance:
@@ -329,6 +811,53 @@ def add_attendance(db: Session, user_id: int, meeting_id: int, status: str = "ab
     db.refresh(att)
     return att
 
+def bulk_add_attendance(
+    db: Session,
+    meeting_id: int,
+    user_ids: list[int] | None = None,
+    emails: list[str] | None = None,
+    status: str = "absent",
+) -> list[dict]:
+    """Invita (upsert) a muchos usuarios a la vez: una consulta para validarlos y un solo
+    INSERT ... ON CONFLICT (user_id, meeting_id) para todas las filas.
+
+    Devuelve un resultado por cada id/email pedido: invited, updated o not_found.
+    """
+    user_ids = list(dict.fromkeys(user_ids or []))
+    emails = list(dict.fromkeys(emails or []))
+    if not user_ids and not emails:
+        return []
+
+    found = db.query(User.id, User.email).filter(or_(User.id.in_(user_ids), User.email.in_(emails))).all()
+    id_by_email = {email: uid for uid, email in found}
+    found_ids = {uid for uid, _ in found}
+
+    outcome: dict[int, str] = {}
+    if found_ids:
+        stmt = pg_insert(Attendance).values(
+            [{"user_id": uid, "meeting_id": meeting_id, "status": status} for uid in sorted(found_ids)]
+        )
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_attendance_user_meeting",
+            set_={"status": stmt.excluded.status},
+        ).returning(
+            Attendance.user_id,
+            # xmax = 0 solo en filas recién insertadas (no en las que resolvió ON CONFLICT)
+            literal_column("(xmax = 0)").label("inserted"),
+        )
+        for uid, inserted in db.execute(stmt):
+            outcome[uid] = "invited" if inserted else "updated"
+        db.commit()
+
+    results = [
+        {"user_id": uid, "email": None, "result": outcome.get(uid, "not_found")}
+        for uid in user_ids
+    ]
+    for email in emails:
+        uid = id_by_email.get(email)
+        results.append({"user_id": uid, "email": email, "result": outcome.get(uid, "not_found") if uid else "not_found"})
+    return results
+
 # Remove attendance record
 # Used to uninvite a user from a meeting
 def remove_attendance(db: Session, user_id: int, meeting_id: int):
@@ -351,6 +880,31 @@ def list_attendance_for_meeting(db: Session, meeting_id: int):
     return db.query(Attendance).filter(Attendance.meeting_id == meeting_id).all()
 
 
+def list_attendance_rows_for_meeting(db: Session, meeting_id: int) -> list[dict]:
+    """Same as list_attendance_for_meeting, as plain dicts with the schemas.Attendance fields."""
+    rows = db.execute(
+        select(
+            Attendance.id,
+            Attendance.user_id,
+            Attendance.meeting_id,
+            Attendance.status,
+            Attendance.marked_at,
+            Attendance.seconds_present,
+        ).where(Attendance.meeting_id == meeting_id)
+    )
+    return [
+        {
+            "id": row.id,
+            "user_id": row.user_id,
+            "meeting_id": row.meeting_id,
+            "status": row.status,
+            "marked_at": row.marked_at,
+            "minutes_present": round((row.seconds_present or 0) / 60, 1),
+        }
+        for row in rows
+    ]
+
+
 
 def list_attendance_for_meeting_with_name_user(db: Session, meeting_id: int):
     """Return all attendance rows for a given meeting id and the users names."""
@@ -370,6 +924,7 @@ def list_attendance_for_meeting_with_name_user(db: Session, meeting_id: int):
             "meeting_id": att.meeting_id,
             "status": att.status,
             "marked_at": att.marked_at,
+            "minutes_present": att.minutes_present,
             "user_name": user_name,
         })
 
@@ -389,6 +944,24 @@ def get_attendance_for_user(db: Session, user_id: int, meeting_id: int):
     return attendance
 
 
+def record_heartbeat(db: Session, user_id: int, meeting_id: int) -> dict:
+    """Registra un heartbeat del usuario en la reunión y devuelve sus tramos de presencia.
+
+    En una serie el heartbeat va a la ocurrencia en curso (creando su fila la primera vez, igual que
+    mark_attendance): los tramos se miden desde el inicio de la ocurrencia, no desde el de la serie.
+    """
+    now = datetime.now(timezone.utc)
+    meeting_id = materialize_occurrence(db, meeting_id, now) or meeting_id
+    intervals.record_presence(db, user_id, {meeting_id: [now]})
+    db.commit()
+    attendance = get_attendance_for_user(db, user_id=user_id, meeting_id=meeting_id)
+    return {
+        "meeting_id": meeting_id,
+        "minutes_present": attendance.minutes_present,
+        "runs": intervals.to_pairs(attendance.presence_runs),
+    }
+
+
 
 # ================= Beacon =================
 def create_beacon(db: Session, beacon: BeaconCreate):
@@ -402,12 +975,21 @@ def create_beacon(db: Session, beacon: BeaconCreate):
     db.add(db_beacon)
     db.commit()
     db.refresh(db_beacon)
+    beacon_index.index.upsert_beacon(db_beacon.id, db_beacon.major, db_beacon.minor)
     return db_beacon
 
-def get_beacons(db: Session):
-    beacons = db.query(Beacon).all()
-    for b in beacons:
-        print(f"Beacon desde DB: id={b.id[:20]}..., name={b.name}, location={b.location}", flush=True)
+def get_beacons(db: Session, limit: int | None = None, cursor: str | None = None, location: str | None = None):
+    query = db.query(Beacon)
+    if location is not None:
+        query = query.filter(Beacon.location == location)
+    if cursor:
+        (last_id,) = decode_cursor(cursor, str)
+        query = query.filter(Beacon.id > last_id)
+    query = query.order_by(Beacon.id)
+    if limit:
+        query = query.limit(limit)
+    beacons = query.all()
+    logger.debug("Beacons desde DB: %s (location=%s)", len(beacons), location)
     return beacons
 
 def get_beacon(db: Session, beacon_id: str):
@@ -420,6 +1002,7 @@ def delete_beacon(db: Session, beacon_id: str):
     if beacon:
         db.delete(beacon)
         db.commit()
+        beacon_index.index.remove_beacon(beacon_id)
     return beacon
 
 def update_beacon(db: Session, beacon_id: str, beacon_data: BeaconUpdate):
@@ -440,6 +1023,7 @@ def update_beacon(db: Session, beacon_id: str, beacon_data: BeaconUpdate):
 
     db.commit()
     db.refresh(beacon)
+    beacon_index.index.upsert_beacon(beacon.id, beacon.major, beacon.minor)
     return beacon
 
 def update_beacon_last_used(db: Session, beacon_id: str):
@@ -452,36 +1036,36 @@ def update_beacon_last_used(db: Session, beacon_id: str):
 
 
 # ================= Meeting Report =================
-def generate_meeting_report(db: Session, meeting_id: int) -> MeetingReport:
-    """Genera (o devuelve si ya existe) el reporte de una reunión específica.
-
-    - fecha: se toma de start_time (en formato YYYY-MM-DD) o created_at si no hay start_time.
-    - nombre_reunion: título de la reunión.
-    - asistencias_totales: total de registros de asistencia (present/late/absent).
-    - porcentaje_asistencias: porcentaje de present + late sobre total.
-    - porcentaje_ausencias: porcentaje de absent sobre total.
+def _attendance_counts(db: Session, group_col, ids: list):
+    """Conteos por estado (y permanencia) agrupados por `group_col`, con una sola consulta.
 
-    Los campos cantidad_asistencias y cantidad_reuniones quedan definidos pero sin lógica aún.
+    Usa COUNT(*) FILTER (WHERE status = ...) en vez de un COUNT por estado.
     """
-    meeting = db.query(Meeting).filter(Meeting.id == meeting_id).first()
-    if not meeting:
-        raise HTTPException(status_code=404, detail="Meeting not found")
-
-    # Si ya existe un reporte para esta reunión, lo devolvemos
-    existing = db.query(MeetingReport).filter(MeetingReport.meeting_id == meeting_id).first()
-    if existing:
-        return existing
+    rows = (
+        db.query(
+            group_col.label("key"),
+            func.count().label("total"),
+            func.count().filter(Attendance.status == "present").label("present"),
+            func.count().filter(Attendance.status == "late").label("late"),
+            func.count().filter(Attendance.status == "absent").label("absent"),
+            func.count().filter(Attendance.seconds_present > 0).label("with_seconds"),
+            func.coalesce(func.sum(Attendance.seconds_present), 0).label("sum_seconds"),
+        )
+        .filter(group_col.in_(ids))
+        .group_by(group_col)
+        .all()
+    )
+    return {row.key: row for row in rows}
 
-    # Calcular datos de asistencia
-    attendance_qs = db.query(Attendance).filter(Attendance.meeting_id == meeting_id)
 
+def _build_meeting_report(meeting: Meeting, counts) -> MeetingReport:
     # Invitados totales: cantidad de registros de attendance (todos los que fueron agregados)
-    invitados_totales = attendance_qs.count()
-
-    # Clasificación por estado
-    present_count = attendance_qs.filter(Attendance.status == "present").count()
-    late_count = attendance_qs.filter(Attendance.status == "late").count()
-    absent_count = attendance_qs.filter(Attendance.status == "absent").count()
+    invitados_totales = counts.total if counts else 0
+    present_count = counts.present if counts else 0
+    late_count = counts.late if counts else 0
+    absent_count = counts.absent if counts else 0
+    sum_seconds = int(counts.sum_seconds) if counts else 0
+    with_seconds = counts.with_seconds if counts else 0
 
     asistentes_totales = present_count #+ late_count # considerar solo present como asistentes, no late
 
@@ -492,6 +1076,10 @@ def generate_meeting_report(db: Session, meeting_id: int) -> MeetingReport:
     else:
         porcentaje_asistencias = 0.0
         porcentaje_ausencias = 0.0
+        porcentaje_tarde = 0.0
+
+    # Promedio de permanencia entre quienes tienen presencia registrada
+    minutos_presencia_promedio = round(sum_seconds / with_seconds / 60, 1) if with_seconds else None
 
     # Fecha como string (usar start_time si existe, si no created_at)
     base_dt = meeting.start_time or meeting.created_at
@@ -503,7 +1091,7 @@ def generate_meeting_report(db: Session, meeting_id: int) -> MeetingReport:
             base_dt = base_dt.replace(tzinfo=timezone.utc)
         fecha_str = base_dt.astimezone(CHILE_TZ).strftime("%Y-%m-%d")
 
-    report = MeetingReport(
+    return MeetingReport(
         meeting_id=meeting.id,
         fecha=fecha_str,
         nombre_reunion=meeting.title,
@@ -514,49 +1102,248 @@ def generate_meeting_report(db: Session, meeting_id: int) -> MeetingReport:
         porcentaje_asistencias=porcentaje_asistencias,
         porcentaje_ausencias=porcentaje_ausencias,
         porcentaje_tarde=porcentaje_tarde,
+        minutos_presencia_promedio=minutos_presencia_promedio,
+        segundos_presencia_total=sum_seconds,
+        registros_presencia=with_seconds,
         # Campos * quedan sin lógica aún
         cantidad_asistencias=None,
         cantidad_reuniones=None,
     )
 
+
+def _check_reportable(meeting: Meeting) -> None:
+    """Una serie semanal no tiene reporte propio: la asistencia se marca en la fila de cada ocurrencia."""
+    if meeting.repeat_weekly and meeting.series_id is None:
+        raise HTTPException(status_code=400, detail="Weekly series have no report; request the report of an occurrence")
+
+
+def generate_meeting_report(db: Session, meeting_id: int) -> MeetingReport:
+    """Genera (o devuelve si ya existe) el reporte de una reunión específica.
+
+    - fecha: se toma de start_time (en formato YYYY-MM-DD) o created_at si no hay start_time.
+    - nombre_reunion: título de la reunión.
+    - asistencias_totales: total de registros de asistencia (present/late/absent).
+    - porcentaje_asistencias: porcentaje de present + late sobre total.
+    - porcentaje_ausencias: porcentaje de absent sobre total.
+
+    Una vez creado, el trigger de attendance (report_triggers.py) lo mantiene al día en cada cambio.
+    Los campos cantidad_asistencias y cantidad_reuniones quedan definidos pero sin lógica aún.
+    """
+    meeting = db.query(Meeting).filter(Meeting.id == meeting_id).first()
+    if not meeting:
+        raise HTTPException(status_code=404, detail="Meeting not found")
+    _check_reportable(meeting)
+
+    # Si ya existe un reporte para esta reunión, lo devolvemos
+    existing = db.query(MeetingReport).filter(MeetingReport.meeting_id == meeting_id).first()
+    if existing:
+        return existing
+
+    report_triggers.lock_meeting_report(db, meeting_id)
+    # Otro request pudo generarlo mientras esperábamos el lock
+    existing = db.query(MeetingReport).filter(MeetingReport.meeting_id == meeting_id).first()
+    if existing:
+        db.commit()
+        return existing
+
+    counts = _attendance_counts(db, Attendance.meeting_id, [meeting_id]).get(meeting_id)
+    report = _build_meeting_report(meeting, counts)
+
     db.add(report)
     db.commit()
     db.refresh(report)
     return report
 
 
+def generate_meeting_reports(db: Session, meetings: list[Meeting]) -> list[MeetingReport]:
+    """Variante en lote: genera los reportes que falten con una sola consulta de conteos para todas
+    las reuniones y devuelve los reportes en el mismo orden que `meetings`."""
+    for meeting in meetings:
+        _check_reportable(meeting)
+    meeting_ids = [m.id for m in meetings]
+    missing_ids = set(meeting_ids) - {
+        mid for (mid,) in db.query(MeetingReport.meeting_id).filter(MeetingReport.meeting_id.in_(meeting_ids))
+    }
+    if missing_ids:
+        # Orden fijo de locks para que dos lotes no se bloqueen mutuamente
+        for meeting_id in sorted(missing_ids):
+            report_triggers.lock_meeting_report(db, meeting_id)
+        missing_ids -= {
+            mid for (mid,) in db.query(MeetingReport.meeting_id).filter(MeetingReport.meeting_id.in_(missing_ids))
+        }
+        counts = _attendance_counts(db, Attendance.meeting_id, list(missing_ids))
+        for meeting in meetings:
+            if meeting.id in missing_ids:
+                db.add(_build_meeting_report(meeting, counts.get(meeting.id)))
+        db.commit()
+    reports = {
+        r.meeting_id: r
+        for r in db.query(MeetingReport).filter(MeetingReport.meeting_id.in_(meeting_ids)).all()
+    }
+    return [reports[mid] for mid in meeting_ids]
+
+
 def get_meeting_report(db: Session, meeting_id: int) -> MeetingReport | None:
     """Obtiene el reporte de una reunión si existe, sin generarlo."""
     return db.query(MeetingReport).filter(MeetingReport.meeting_id == meeting_id).first()
 
 
-def generate_general_report(db: Session, user_id: int):
-
-    attendance_qs = db.query(Attendance).filter(Attendance.user_id == user_id)
-
-    total_reuniones = attendance_qs.count()
-    if total_reuniones == 0:
+def _build_general_report(total: int, present: int, late: int, absent: int, seconds: int) -> dict:
+    if total == 0:
         return {
             "cantidad_asistencias": 0,
             "cantidad_reuniones": 0,
             "cantidad_atrasados": 0,
+            "cantidad_ausencias": 0,
             "porcentaje_asistencias": 0.0,
             "porcentaje_ausencias": 0.0,
             "porcentaje_atrasados": 0.0,
+            "minutos_presencia_total": 0.0,
         }
 
-    asistencias = attendance_qs.filter(Attendance.status == "present").count()
-    ausencias = attendance_qs.filter(Attendance.status == "absent").count()
-    atrasados = attendance_qs.filter(Attendance.status == "late").count()
-
     return {
-        "cantidad_asistencias": asistencias,
-        "cantidad_reuniones": total_reuniones,
-        "cantidad_atrasados": atrasados,
-        "porcentaje_asistencias": (asistencias / total_reuniones) * 100,
-        "porcentaje_ausencias": (ausencias / total_reuniones) * 100,
-        "porcentaje_atrasados": (atrasados / total_reuniones) * 100,
+        "cantidad_asistencias": present,
+        "cantidad_reuniones": total,
+        "cantidad_atrasados": late,
+        "cantidad_ausencias": absent,
+        "porcentaje_asistencias": (present / total) * 100,
+        "porcentaje_ausencias": (absent / total) * 100,
+        "porcentaje_atrasados": (late / total) * 100,
+        "minutos_presencia_total": round(seconds / 60, 1),
+    }
+
+
+def _window_start(window: str, today: date) -> date | None:
+    """Primer día incluido en la ventana del reporte general (None = todo el historial)."""
+    if window == "30d":
+        return today - timedelta(days=29)
+    if window == "90d":
+        return today - timedelta(days=89)
+    if window == "semester":
+        # Semestres académicos: marzo-julio y agosto-febrero
+        if 3 <= today.month <= 7:
+            return date(today.year, 3, 1)
+        if today.month >= 8:
+            return date(today.year, 8, 1)
+        return date(today.year - 1, 8, 1)
+    return None
+
+
+def _attendance_day():
+    """Día de cada asistencia = día de inicio de la reunión en hora de Chile (igual que el trigger)."""
+    return cast(
+        func.timezone(literal_column("'America/Santiago'"), func.coalesce(Meeting.start_time, Meeting.created_at)),
+        Date,
+    )
+
+
+def _create_general_reports(db: Session, user_ids: set[int]) -> None:
+    """Crea el reporte general (y los conteos diarios) de usuarios que aún no lo tienen.
+
+    Después de esto el trigger de attendance los mantiene al día; no hace commit.
+    """
+    # Orden fijo de locks para que dos lotes no se bloqueen mutuamente
+    for user_id in sorted(user_ids):
+        report_triggers.lock_general_report(db, user_id)
+    user_ids = user_ids - {
+        uid for (uid,) in db.query(GeneralReport.user_id).filter(GeneralReport.user_id.in_(user_ids))
     }
+    if not user_ids:
+        return
+
+    counts = _attendance_counts(db, Attendance.user_id, list(user_ids))
+    for user_id in user_ids:
+        c = counts.get(user_id)
+        total = c.total if c else 0
+        db.add(GeneralReport(
+            user_id=user_id,
+            cantidad_reuniones=total,
+            cantidad_asistencias=c.present if c else 0,
+            cantidad_atrasados=c.late if c else 0,
+            cantidad_ausencias=c.absent if c else 0,
+            segundos_presencia=c.sum_seconds if c else 0,
+            porcentaje_asistencias=(c.present / total) * 100 if total else 0.0,
+            porcentaje_ausencias=(c.absent / total) * 100 if total else 0.0,
+        ))
+
+    day = _attendance_day()
+    daily = (
+        select(
+            Attendance.user_id,
+            day,
+            func.count(),
+            func.count().filter(Attendance.status == "present"),
+            func.count().filter(Attendance.status == "late"),
+            func.count().filter(Attendance.status == "absent"),
+            func.coalesce(func.sum(Attendance.seconds_present), 0),
+        )
+        .join(Meeting, Meeting.id == Attendance.meeting_id)
+        .where(Attendance.user_id.in_(user_ids))
+        .group_by(Attendance.user_id, day)
+    )
+    db.execute(
+        pg_insert(AttendanceDailyCount).from_select(
+            ["user_id", "day", "total", "present", "late", "absent", "seconds_present"], daily
+        )
+    )
 
 
+def generate_general_reports(db: Session, user_ids: list[int], window: str = "all") -> list[dict]:
+    """Reporte general de varios usuarios, leído de general_reports (o de los conteos diarios si hay ventana).
 
+    El reporte de un usuario se crea la primera vez que se pide (también desde GET); desde ahí lo mantiene
+    el trigger de attendance, así que leerlo es una lectura por clave sin importar el largo del historial.
+    """
+    reports = {r.user_id: r for r in db.query(GeneralReport).filter(GeneralReport.user_id.in_(user_ids)).all()}
+    missing = set(user_ids) - set(reports)
+    if missing:
+        # Solo usuarios que existen (user_id es FK)
+        missing = {uid for (uid,) in db.query(User.id).filter(User.id.in_(missing))}
+        if missing:
+            _create_general_reports(db, missing)
+            db.commit()
+            reports = {r.user_id: r for r in db.query(GeneralReport).filter(GeneralReport.user_id.in_(user_ids)).all()}
+
+    today = datetime.now(CHILE_TZ).date()
+    start = _window_start(window, today)
+    if start is None:
+        results = {
+            r.user_id: _build_general_report(
+                r.cantidad_reuniones, r.cantidad_asistencias, r.cantidad_atrasados, r.cantidad_ausencias,
+                r.segundos_presencia,
+            )
+            for r in reports.values()
+        }
+    else:
+        rows = (
+            db.query(
+                AttendanceDailyCount.user_id,
+                func.sum(AttendanceDailyCount.total).label("total"),
+                func.sum(AttendanceDailyCount.present).label("present"),
+                func.sum(AttendanceDailyCount.late).label("late"),
+                func.sum(AttendanceDailyCount.absent).label("absent"),
+                func.sum(AttendanceDailyCount.seconds_present).label("seconds"),
+            )
+            .filter(
+                AttendanceDailyCount.user_id.in_(list(reports)),
+                AttendanceDailyCount.day >= start,
+                AttendanceDailyCount.day <= today,
+            )
+            .group_by(AttendanceDailyCount.user_id)
+            .all()
+        )
+        results = {
+            row.user_id: _build_general_report(
+                int(row.total), int(row.present), int(row.late), int(row.absent), int(row.seconds)
+            )
+            for row in rows
+        }
+
+    empty = _build_general_report(0, 0, 0, 0, 0)
+    return [{"user_id": uid, "window": window, **results.get(uid, empty)} for uid in user_ids]
+
+
+def generate_general_report(db: Session, user_id: int, window: str = "all"):
+    report = generate_general_reports(db, [user_id], window)[0]
+    del report["user_id"]
+    return report
@@ -0,0 +1,70 @@
+"""
+Versiones asíncronas (AsyncSession / asyncpg) de las operaciones CRUD más usadas.
+Solo se usan cuando DB_ASYNC está habilitado (ver db.py); la lógica de negocio se comparte con crud.py.
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import User, Meeting
+from crud import (
+    _meeting_detail_record,
+    _meeting_detail_stmt,
+    _meeting_records,
+    _meetings_for_user_stmt,
+    _merge_occurrences,
+    _occurrences_to_skip,
+    _series_for_user_stmt,
+    _series_window,
+    _mark_attendance_stmt,
+    _raise_mark_error,
+    materialize_occurrence,
+)
+
+
+# User
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(User).where(User.email == email).limit(1))
+    return result.scalars().first()
+
+
+async def get_user(db: AsyncSession, user_id: int):
+    return await db.get(User, user_id)
+
+
+# ================= Meetings =================
+async def get_meeting_detail(db: AsyncSession, meeting_id: int):
+    # coordinador y beacon en la misma consulta: no hay lazy loading en sesiones async
+    result = await db.execute(_meeting_detail_stmt(meeting_id))
+    return _meeting_detail_record(result.first())
+
+
+async def list_meetings_for_user(db: AsyncSession, user_id: int, limit: int | None = None, cursor: str | None = None, **filters):
+    result = await db.execute(_meetings_for_user_stmt(user_id, limit, cursor, **filters))
+    meetings = _meeting_records(result)
+
+    start_from, start_to = _series_window(filters.get("start_from"), filters.get("start_to"))
+    stmt = _series_for_user_stmt(user_id, start_from, start_to, filters.get("coordinator_id"), filters.get("beacon_id"))
+    series = _meeting_records(await db.execute(stmt))
+    skip = await db.run_sync(_occurrences_to_skip, user_id, [s.id for s in series])
+    return _merge_occurrences(meetings, series, skip, start_from, start_to, cursor, limit)
+
+
+# ================= Attendance =================
+async def mark_attendance(db: AsyncSession, user_id: int, meeting_id: int, status: str = "absent"):
+    result = await db.execute(_mark_attendance_stmt(user_id, meeting_id))
+    row = result.first()
+    if row is None:
+        await db.rollback()
+        # Si es una serie, se marca en la ocurrencia en curso (creando su fila la primera vez)
+        instance_id = await db.run_sync(materialize_occurrence, meeting_id, datetime.now(timezone.utc))
+        if instance_id is not None:
+            result = await db.execute(_mark_attendance_stmt(user_id, instance_id))
+            row = result.first()
+    if row is None:
+        await db.rollback()
+        _raise_mark_error(await db.get(Meeting, meeting_id))
+    await db.commit()
+    return row
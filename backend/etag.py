@@ -0,0 +1,226 @@
+"""
+ETag y GET condicional para las lecturas que el app repite en cada pantalla (/meetings/my, /meeting/{id},
+/beacons, /attendance/meeting_named_user/{id}).
+
+Cada tabla cacheada tiene un contador en resource_versions que un trigger por sentencia incrementa en la
+misma transacción que la escritura, así la versión nueva se ve recién con el commit. La asistencia y el
+detalle de reunión llevan además un contador por reunión (attendance:<meeting_id> y meeting:<id>,
+triggers por fila), para que escribir en una reunión no invalide las respuestas de las demás. El ETag de
+una respuesta es un hash de la URL (y el usuario, si la respuesta depende de él) y las versiones de las tablas
+que la componen: si el cliente manda el mismo ETag en If-None-Match se responde 304 sin cargar ni
+serializar filas, con una sola lectura por clave primaria.
+
+La versión se lee antes que los datos: si una escritura entra entre ambas lecturas el cliente recibe
+datos nuevos con la etiqueta vieja y en la siguiente visita simplemente los vuelve a descargar. Si no se
+pueden leer las versiones (p. ej. falta la tabla en una BD sin migrar) se responde sin ETag.
+"""
+import hashlib
+import os
+from typing import Iterable, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import DDL, BigInteger, column, event, func, select, table
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import log
+
+logger = log.get_logger(__name__)
+
+
+# Filas por recurso; escrituras de transacciones distintas suelen caer en slots distintos
+RESOURCE_VERSION_SLOTS = int(os.getenv("RESOURCE_VERSION_SLOTS", "8"))
+# El cliente puede guardar la respuesta pero debe revalidarla (If-None-Match) antes de usarla
+CACHE_CONTROL = "private, no-cache"
+
+# Tablas de las que depende cada lectura cacheada
+MEETINGS_FOR_USER = ("meetings", "meeting_exceptions", "attendance_membership")
+BEACONS = ("beacons",)
+
+
+def meeting_detail(meeting_id: int) -> tuple[str, ...]:
+    """Recursos del detalle de una reunión (la reunión, su beacon y su coordinador; ver _ROW_BUMPS)."""
+    return (f"meeting:{meeting_id}", "meetings_truncate")
+
+
+def attendance_with_users(meeting_id: int) -> tuple[str, ...]:
+    """Recursos de la lista de asistencia de una reunión ("attendance" solo cambia con TRUNCATE)."""
+    return (f"attendance:{meeting_id}", "attendance", "users")
+
+
+# Sin importar models (models registra los triggers de este módulo)
+_versions = table(
+    "resource_versions",
+    column("resource"),
+    column("version", BigInteger),
+)
+
+# DDL formatea el texto con `statement % context` al compilar: el módulo de SQL se escribe %%
+_BUMP_FUNCTION = DDL(f"""
+CREATE OR REPLACE FUNCTION bump_version(p_resource text)
+RETURNS void AS $$
+BEGIN
+    INSERT INTO resource_versions AS v (resource, slot, version)
+    VALUES (p_resource, (txid_current() %% {RESOURCE_VERSION_SLOTS})::smallint, 1)
+    ON CONFLICT (resource, slot) DO UPDATE SET version = v.version + 1;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bump_resource_version()
+RETURNS trigger AS $$
+BEGIN
+    PERFORM bump_version(TG_ARGV[0]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+""")
+
+# Contadores por fila, porque un trigger por sentencia no sabe qué filas tocó:
+#   - attendance:<meeting_id>: la lista de asistencia de la reunión (un cambio de meeting_id invalida
+#     la reunión de origen y la de destino);
+#   - meeting:<id>: el detalle de la reunión, que incluye la ubicación de su beacon y su coordinador.
+#     Borrar el beacon o el usuario pone NULL en meetings (ON DELETE SET NULL) y eso ya la invalida.
+_ROW_BUMPS = DDL("""
+CREATE OR REPLACE FUNCTION bump_meeting_attendance_version()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_version('attendance:' || OLD.meeting_id);
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.meeting_id <> OLD.meeting_id) THEN
+        PERFORM bump_version('attendance:' || NEW.meeting_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS attendance_meeting_version ON attendance;
+CREATE TRIGGER attendance_meeting_version
+    AFTER INSERT OR UPDATE OR DELETE ON attendance
+    FOR EACH ROW EXECUTE FUNCTION bump_meeting_attendance_version();
+
+CREATE OR REPLACE FUNCTION bump_meeting_detail_version()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'meetings' THEN
+        PERFORM bump_version('meeting:' || COALESCE(NEW.id, OLD.id));
+    ELSIF TG_TABLE_NAME = 'beacons' THEN
+        PERFORM bump_version('meeting:' || m.id) FROM meetings m WHERE m.beacon_id = NEW.id;
+    ELSE
+        PERFORM bump_version('meeting:' || m.id) FROM meetings m WHERE m.coordinator_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS meeting_detail_version ON meetings;
+CREATE TRIGGER meeting_detail_version
+    AFTER INSERT OR UPDATE OR DELETE ON meetings
+    FOR EACH ROW EXECUTE FUNCTION bump_meeting_detail_version();
+
+DROP TRIGGER IF EXISTS beacon_meeting_detail_version ON beacons;
+CREATE TRIGGER beacon_meeting_detail_version
+    AFTER UPDATE OF location ON beacons
+    FOR EACH ROW EXECUTE FUNCTION bump_meeting_detail_version();
+
+DROP TRIGGER IF EXISTS user_meeting_detail_version ON users;
+CREATE TRIGGER user_meeting_detail_version
+    AFTER UPDATE OF name, email, is_admin, onesignal_player_id ON users
+    FOR EACH ROW EXECUTE FUNCTION bump_meeting_detail_version();
+""")
+
+# (nombre del trigger, tabla, eventos, recurso). La pertenencia a reuniones (attendance_membership)
+# no cambia con los heartbeats ni con el estado, así /meetings/my no se invalida en cada marca.
+_TRIGGERS = (
+    ("meetings_version", "meetings", "INSERT OR UPDATE OR DELETE OR TRUNCATE", "meetings"),
+    ("meeting_exceptions_version", "meeting_exceptions", "INSERT OR UPDATE OR DELETE OR TRUNCATE", "meeting_exceptions"),
+    # Las filas se cuentan por reunión (_ROW_BUMPS); TRUNCATE no pasa por los triggers por fila
+    ("attendance_version", "attendance", "TRUNCATE", "attendance"),
+    ("meetings_truncate_version", "meetings", "TRUNCATE", "meetings_truncate"),
+    (
+        "attendance_membership_version",
+        "attendance",
+        "INSERT OR DELETE OR TRUNCATE OR UPDATE OF user_id, meeting_id",
+        "attendance_membership",
+    ),
+    ("beacons_version", "beacons", "INSERT OR UPDATE OR DELETE OR TRUNCATE", "beacons"),
+    ("users_version", "users", "DELETE OR TRUNCATE OR UPDATE OF name, email, is_admin", "users"),
+)
+
+
+def register(metadata):
+    """Instala la función y los triggers después de cada create_all (solo en PostgreSQL)."""
+    event.listen(metadata, "after_create", _BUMP_FUNCTION.execute_if(dialect="postgresql"))
+    for name, table_name, events, resource in _TRIGGERS:
+        ddl = DDL(f"""
+DROP TRIGGER IF EXISTS {name} ON {table_name};
+CREATE TRIGGER {name}
+    AFTER {events} ON {table_name}
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('{resource}');
+""")
+        event.listen(metadata, "after_create", ddl.execute_if(dialect="postgresql"))
+    event.listen(metadata, "after_create", _ROW_BUMPS.execute_if(dialect="postgresql"))
+
+
+def _versions_stmt(resources: Iterable[str]):
+    return (
+        select(_versions.c.resource, func.sum(_versions.c.version))
+        .where(_versions.c.resource.in_(list(resources)))
+        .group_by(_versions.c.resource)
+    )
+
+
+def make_etag(request: Request, versions: dict, resources: Iterable[str], scope: str = "") -> str:
+    """ETag de la URL pedida con las versiones actuales de `resources`.
+
+    Es débil (W/): el mismo contenido sale comprimido o no según Accept-Encoding (serialization.py), así
+    que la etiqueta no identifica los bytes exactos de la respuesta.
+    """
+    parts = [request.url.path, request.url.query, scope]
+    parts.extend(f"{resource}={versions.get(resource, 0)}" for resource in resources)
+    return 'W/"%s"' % hashlib.blake2b("|".join(parts).encode(), digest_size=16).hexdigest()
+
+
+def if_none_match(request: Request, tag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match compara en forma débil: W/"x" equivale a "x"
+    tag = tag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == tag for candidate in header.split(","))
+
+
+def conditional(request: Request, response: Response, tag: str) -> Optional[Response]:
+    """Publica `tag` en la respuesta; si el cliente ya lo tiene devuelve el 304 que se debe responder."""
+    headers = {"ETag": tag, "Cache-Control": CACHE_CONTROL}
+    if if_none_match(request, tag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def check(db: Session, request: Request, response: Response, resources: Iterable[str], scope: str = "") -> Optional[Response]:
+    """Calcula el ETag de la lectura y devuelve el 304 si corresponde (None = responder normalmente)."""
+    try:
+        versions = dict(db.execute(_versions_stmt(resources)).all())
+    except DBAPIError:
+        # Sin versiones no hay ETag confiable: se responde completo y sin ETag
+        db.rollback()
+        logger.exception("No se pudieron leer las versiones de %s", ", ".join(resources))
+        return None
+    return conditional(request, response, make_etag(request, versions, resources, scope))
+
+
+async def check_async(db: AsyncSession, request: Request, response: Response, resources: Iterable[str], scope: str = "") -> Optional[Response]:
+    """Igual que check, para los endpoints con AsyncSession."""
+    try:
+        result = await db.execute(_versions_stmt(resources))
+        versions = dict(result.all())
+    except DBAPIError:
+        await db.rollback()
+        logger.exception("No se pudieron leer las versiones de %s", ", ".join(resources))
+        return None
+    return conditional(request, response, make_etag(request, versions, resources, scope))
@@ -0,0 +1,111 @@
+"""
+Permanencia por usuario y reunión guardada como tramos [entrada, salida) ya fusionados.
+Cada ping (avistamiento cercano o heartbeat) cubre PRESENCE_RUN_GAP_SECONDS desde su instante; los pings
+seguidos se fusionan en un solo tramo, así un evento de todo el día con un heartbeat cada 10 s ocupa un
+tramo mientras el usuario no salga. Los tramos se guardan aplanados en attendance.presence_runs
+([e0, s0, e1, s1, ...], segundos desde el inicio de la reunión) y nunca pasan de PRESENCE_MAX_RUNS:
+si se excede, se cierran los huecos más cortos.
+
+attendance.seconds_present es la suma de los tramos reales, sin los huecos cerrados al compactar: cada
+lote de pings suma solo los segundos que agrega a los tramos guardados antes de compactar.
+"""
+import os
+from datetime import datetime, timezone
+from typing import Iterable
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from models import Attendance, Meeting
+
+
+PRESENCE_RUN_GAP_SECONDS = int(os.getenv("PRESENCE_RUN_GAP_SECONDS", "30"))
+PRESENCE_MAX_RUNS = int(os.getenv("PRESENCE_MAX_RUNS", "32"))
+
+
+def to_pairs(flat: list[int] | None) -> list[tuple[int, int]]:
+    if not flat:
+        return []
+    return list(zip(flat[0::2], flat[1::2]))
+
+
+def total_seconds(flat: list[int] | None) -> int:
+    return sum(end - start for start, end in to_pairs(flat))
+
+
+def merge_runs(
+    flat: list[int] | None, offsets: Iterable[int], span: int, limit: int, max_runs: int
+) -> tuple[list[int], int]:
+    """Agrega pings (segundos desde el inicio) a los tramos existentes.
+
+    Cada ping cubre [t, t + span) recortado a [0, limit]; tramos que se tocan o se solapan se unen.
+    Devuelve (lista aplanada fusionada y compactada a max_runs, segundos nuevos cubiertos por los pings).
+    """
+    runs = to_pairs(flat)
+    for t in offsets:
+        start = max(0, t)
+        end = min(limit, t + span)
+        if end > start:
+            runs.append((start, end))
+    if not runs:
+        return [], 0
+    runs.sort()
+
+    merged = [list(runs[0])]
+    for start, end in runs[1:]:
+        last = merged[-1]
+        if start <= last[1]:
+            if end > last[1]:
+                last[1] = end
+        else:
+            merged.append([start, end])
+
+    # Segundos nuevos, medidos antes de compactar (los huecos cerrados no son permanencia)
+    added = sum(end - start for start, end in merged) - total_seconds(flat)
+
+    # Acotar el almacenamiento: cerrar el hueco más corto hasta quedar en max_runs tramos
+    while len(merged) > max_runs:
+        gap_pos = min(range(len(merged) - 1), key=lambda i: merged[i + 1][0] - merged[i][1])
+        merged[gap_pos][1] = merged[gap_pos + 1][1]
+        del merged[gap_pos + 1]
+
+    return [value for run in merged for value in run], added
+
+
+def record_presence(db: Session, user_id: int, pings: dict[int, list[datetime]]) -> int:
+    """Actualiza los tramos de presencia del usuario en cada reunión de `pings` ({meeting_id: [instantes]}).
+
+    Solo se actualizan asistencias que ya existen (invitado o marcado); no hace commit. La fila de una serie
+    semanal no acumula tramos: su inicio es el de la primera ocurrencia, así que los pings deben venir ya
+    resueltos a la ocurrencia materializada (crud.materialize_occurrence).
+    Devuelve cuántas filas se actualizaron.
+    """
+    if not pings:
+        return 0
+    rows = (
+        db.query(
+            Attendance.id, Attendance.meeting_id, Attendance.presence_runs, Attendance.seconds_present,
+            Meeting.start_time, Meeting.end_time,
+        )
+        .join(Meeting, Meeting.id == Attendance.meeting_id)
+        .filter(
+            Attendance.user_id == user_id,
+            Attendance.meeting_id.in_(list(pings)),
+            Meeting.repeat_weekly.is_(False),
+        )
+        .with_for_update(of=Attendance)
+        .all()
+    )
+    updates = []
+    for attendance_id, meeting_id, runs, seconds, start_time, end_time in rows:
+        if start_time is None or end_time is None:
+            continue
+        start_time = start_time.astimezone(timezone.utc)
+        limit = int((end_time.astimezone(timezone.utc) - start_time).total_seconds())
+        offsets = [int((at - start_time).total_seconds()) for at in pings[meeting_id]]
+        merged, added = merge_runs(runs, offsets, PRESENCE_RUN_GAP_SECONDS, limit, PRESENCE_MAX_RUNS)
+        if merged != (runs or []):
+            updates.append({"id": attendance_id, "presence_runs": merged, "seconds_present": (seconds or 0) + added})
+    if updates:
+        db.execute(update(Attendance), updates)
+    return len(updates)
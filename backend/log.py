@@ -0,0 +1,125 @@
+"""
+Logging estructurado sin I/O en el camino del request.
+Los módulos piden su logger con get_logger(__name__). Cada registro se encola (QueueHandler) y un hilo
+aparte (QueueListener) lo formatea como una línea JSON (o texto con LOG_FORMAT=text) y lo escribe en
+stdout. Si la cola se llena, el registro se descarta en vez de bloquear al llamador.
+
+Los eventos DEBUG de alto volumen se muestrean: pasa una fracción LOG_DEBUG_SAMPLE_RATE, o la que indique
+el propio evento con extra={"sample_rate": ...}. Los campos pasados en extra salen como claves del JSON.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+# Se importa antes que main.py cargue el .env: LOG_LEVEL y compañía tienen que leerse de ahí también
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # json | text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.01"))
+
+ROOT_LOGGER = "beassistant"
+
+# Atributos propios de LogRecord; el resto viene de extra y se agrega al JSON (QueueHandler ya dejó el
+# traceback de logger.exception dentro del mensaje)
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key != "sample_rate":
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Deja pasar solo una fracción de los eventos DEBUG (los demás niveles pasan siempre)."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = getattr(record, "sample_rate", self.rate)
+        return rate >= 1 or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que nunca bloquea: con la cola llena cuenta el registro como descartado."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: logging.handlers.QueueListener | None = None
+_handler: DroppingQueueHandler | None = None
+_setup_lock = threading.Lock()
+
+
+def setup() -> None:
+    """Configura el logger raíz de la app y arranca el hilo escritor (idempotente)."""
+    global _listener, _handler
+    with _setup_lock:
+        if _handler is not None:
+            return
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(
+            JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        )
+        log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _handler = DroppingQueueHandler(log_queue)
+        _handler.addFilter(SamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(_handler)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, stream)
+        _listener.start()
+        atexit.register(shutdown)
+
+
+def shutdown() -> None:
+    """Escribe lo que quede en la cola, detiene el hilo escritor y quita el handler (setup() puede volver
+    a arrancarlo, p. ej. entre pruebas o al recargar la app)."""
+    global _listener, _handler
+    with _setup_lock:
+        if _handler is not None:
+            logging.getLogger(ROOT_LOGGER).removeHandler(_handler)
+            _handler = None
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        atexit.unregister(shutdown)
+
+
+def get_logger(name: str) -> logging.Logger:
+    setup()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
@@ -1,40 +1,58 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-import crud, models, schemas, auth
-from db import get_db, engine
+from fastapi.responses import ORJSONResponse
+import crud, crud_async, models, schemas, auth
+from db import get_db, get_async_db, get_pool_stats, engine, DB_ASYNC
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordBearer
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+from datetime import datetime, timezone
 from fastapi import Query
 import scheduler
+import passwords
+import notification_service
+import attendance_buffer
+import beacon_index
+import sightings
+import etag
+import serialization
+import log
+from pagination import PageParams, set_next_cursor, NEXT_CURSOR_HEADER
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
 import sys
+import os
 
 # Cargar variables de entorno
 load_dotenv()
 
+logger = log.get_logger(__name__)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    print("=" * 60, flush=True)
-    print("INICIANDO APLICACION", flush=True)
-    print("=" * 60, flush=True)
+    logger.info("Iniciando aplicacion")
+    attendance_buffer.start()
     try:
         scheduler.start_scheduler()
-        print("Scheduler iniciado correctamente", flush=True)
+        logger.info("Scheduler iniciado correctamente")
     except Exception as e:
-        print(f"Error iniciando scheduler: {e}", flush=True)
-        import traceback
-        traceback.print_exc()
-    print("=" * 60, flush=True)
+        logger.exception("Error iniciando scheduler: %s", e)
     yield
     # Shutdown
-    print("DETENIENDO APLICACION", flush=True)
+    logger.info("Deteniendo aplicacion")
+    # Escribir las marcas de asistencia que sigan en el buffer antes de salir
+    attendance_buffer.stop()
     scheduler.stop_scheduler()
     scheduler.stop_scheduler()
+    passwords.shutdown()
+    notification_service.shutdown()
+    # Último: escribe los registros que sigan en la cola del logger
+    log.shutdown()
 
 
 
@@ -51,7 +69,7 @@ async def lifespan(app: FastAPI):
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 # Crear la aplicación
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 
 app.add_middleware(
@@ -60,7 +78,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # ← IMPORTANTE para OPTIONS
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
+serialization.add_compression(app)
 
 
 # Al iniciar, eliminar y recrear todas las tablas (destructivo, solo para desarrollo)
@@ -78,12 +98,22 @@ def read_root():
     return {"message": "FastAPI"}
 
 
+@app.get("/metrics/db-pool")
+def db_pool_metrics(current_user=Depends(auth.get_current_user)):
+    """Estado del pool de conexiones de este worker (solo administradores)."""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can view metrics")
+    return {"pid": os.getpid(), "pools": get_pool_stats()}
+
+
 @app.post("/register", response_model=schemas.User)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, user.email)
+async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    # El hash de bcrypt se calcula en el pool de procesos; la BD sigue en el threadpool
+    db_user = await run_in_threadpool(crud.get_user_by_email, db, user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db, user)
+    hashed_password = await passwords.hash_password_async(user.password)
+    return await run_in_threadpool(crud.create_user, db, user, hashed_password)
 
 
 
@@ -94,11 +124,11 @@ class LoginRequest(BaseModel):
     password: str
 
 @app.post("/login")
-def login(data: LoginRequest, db: Session = Depends(get_db)):
-    user = auth.authenticate_user(db, data.email, data.password)
+async def login(data: LoginRequest, db: Session = Depends(get_db)):
+    user = await auth.authenticate_user(db, data.email, data.password)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
-    access_token = auth.create_access_token(data={"sub": user.email})
+    access_token = auth.create_user_token(user)
     return {"access_token": access_token, "token_type": "bearer"}
 
 #para perfil
@@ -118,38 +148,116 @@ def register_device(payload: schemas.RegisterDeviceRequest, db: Session = Depend
 
 # ================= Users =================
 @app.get("/users", response_model=List[schemas.User])
-def list_users(db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
-    return crud.get_users(db)
+def list_users(response: Response, page: PageParams = Depends(), db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
+    users = crud.get_users_rows(db, limit=page.limit, cursor=page.cursor)
+    set_next_cursor(response, users, page.limit, key=lambda u: (u["id"],))
+    return serialization.json_response(users, response)
 
 
 # ================= Meetings =================
 @app.post("/meetings", response_model=schemas.Meeting)
 def create_meeting(meeting: schemas.MeetingCreate, db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
     # Nota: en un escenario real, validar rol/admin aquí
-    return crud.create_meeting(db, meeting, coordinator_id=current_user.id)
+    return serialization.meeting_response(crud.create_meeting(db, meeting, coordinator_id=current_user.id))
+
+@app.delete("/meetings/{meeting_id}/occurrences")
+def cancel_meeting_occurrence(meeting_id: int, occurrence_start: datetime, db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
+    """Cancela una ocurrencia de una serie semanal (solo el coordinador)."""
+    meeting = crud.get_meeting(db, meeting_id)
+    if not meeting:
+        raise HTTPException(status_code=404, detail="Meeting not found")
+    if meeting.coordinator_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Only the coordinator can cancel occurrences")
+    crud.cancel_occurrence(db, meeting_id, occurrence_start)
+    attendance_buffer.invalidate_meeting(meeting_id)
+    return {"message": "Occurrence cancelled"}
+
+@app.delete("/meetings/{meeting_id}")
+def delete_meeting(meeting_id: int, db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
+    """Elimina una reunión o una serie completa (solo el coordinador)."""
+    meeting = crud.get_meeting(db, meeting_id)
+    if not meeting:
+        raise HTTPException(status_code=404, detail="Meeting not found")
+    if meeting.coordinator_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Only the coordinator can delete the meeting")
+    crud.delete_meeting(db, meeting_id)
+    # Sin esto el buffer write-behind aceptaría marcas hasta que venza la ventana cacheada
+    attendance_buffer.invalidate_meeting(meeting_id)
+    return {"message": "Meeting deleted successfully"}
+
+class MeetingFilters:
+    """Filtros opcionales de las listas de reuniones (?start_from=&start_to=&coordinator_id=&beacon_id=)."""
+
+    def __init__(
+        self,
+        start_from: Optional[datetime] = None,
+        start_to: Optional[datetime] = None,
+        coordinator_id: Optional[int] = None,
+        beacon_id: Optional[str] = None,
+    ):
+        self.start_from = start_from
+        self.start_to = start_to
+        self.coordinator_id = coordinator_id
+        self.beacon_id = beacon_id
+
+    def as_kwargs(self) -> dict:
+        return dict(vars(self))
+
 
 @app.get("/meetings", response_model=List[schemas.Meeting])
-def list_meetings(db: Session = Depends(get_db)):
-    return crud.list_meetings(db)
+def list_meetings(response: Response, page: PageParams = Depends(), filters: MeetingFilters = Depends(), db: Session = Depends(get_db)):
+    meetings = crud.list_meetings(db, limit=page.limit, cursor=page.cursor, **filters.as_kwargs())
+    set_next_cursor(response, meetings, page.limit, key=crud.meeting_cursor_key)
+    return serialization.meetings_response(meetings, response)
+
+def _meetings_for_user_scope(user_id: int) -> str:
+    """Scope del ETag de /meetings/my: sin rango las series se expanden desde ahora, así que la lista
+    también cambia con la hora aunque no cambie ninguna tabla."""
+    return f"{user_id}:{datetime.now(timezone.utc):%Y-%m-%dT%H}"
+
 
 #endpoint para obtener reuniones del usuario actual
-@app.get("/meetings/my", response_model=List[schemas.Meeting])
-def list_meetings_for_user(db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
-    return crud.list_meetings_for_user(db, user_id=current_user.id)
+if DB_ASYNC:
+    @app.get("/meetings/my", response_model=List[schemas.Meeting])
+    async def list_meetings_for_user(request: Request, response: Response, page: PageParams = Depends(), filters: MeetingFilters = Depends(), db: AsyncSession = Depends(get_async_db), current_user=Depends(auth.get_current_user_async)):
+        not_modified = await etag.check_async(db, request, response, etag.MEETINGS_FOR_USER, scope=_meetings_for_user_scope(current_user.id))
+        if not_modified:
+            return not_modified
+        meetings = await crud_async.list_meetings_for_user(db, user_id=current_user.id, limit=page.limit, cursor=page.cursor, **filters.as_kwargs())
+        set_next_cursor(response, meetings, page.limit, key=crud.meeting_cursor_key)
+        return serialization.meetings_response(meetings, response)
+else:
+    @app.get("/meetings/my", response_model=List[schemas.Meeting])
+    def list_meetings_for_user(request: Request, response: Response, page: PageParams = Depends(), filters: MeetingFilters = Depends(), db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
+        not_modified = etag.check(db, request, response, etag.MEETINGS_FOR_USER, scope=_meetings_for_user_scope(current_user.id))
+        if not_modified:
+            return not_modified
+        meetings = crud.list_meetings_for_user(db, user_id=current_user.id, limit=page.limit, cursor=page.cursor, **filters.as_kwargs())
+        set_next_cursor(response, meetings, page.limit, key=crud.meeting_cursor_key)
+        return serialization.meetings_response(meetings, response)
+
 
 #endpoint para obtener una reunion por id del usuario actual
-@app.get("/meeting/{meeting_id}", response_model=schemas.MeetingDetail, status_code=status.HTTP_200_OK)
-def get_meeting_for_user(meeting_id: int, db: Session = Depends(get_db)):
-    meeting = crud.get_meeting(db, meeting_id)
-    if not meeting:
-        raise HTTPException(status_code=404, detail="Meeting not found")
-    
-    response = schemas.MeetingDetail.model_validate(meeting)
-    # Asignar location del beacon si existe
-    if meeting.beacon:
-        response.location = meeting.beacon.location
-    
-    return response
+if DB_ASYNC:
+    @app.get("/meeting/{meeting_id}", response_model=schemas.MeetingDetail, status_code=status.HTTP_200_OK)
+    async def get_meeting_for_user(meeting_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+        not_modified = await etag.check_async(db, request, response, etag.meeting_detail(meeting_id))
+        if not_modified:
+            return not_modified
+        meeting = await crud_async.get_meeting_detail(db, meeting_id)
+        if not meeting:
+            raise HTTPException(status_code=404, detail="Meeting not found")
+        return serialization.meeting_detail_response(meeting, response)
+else:
+    @app.get("/meeting/{meeting_id}", response_model=schemas.MeetingDetail, status_code=status.HTTP_200_OK)
+    def get_meeting_for_user(meeting_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+        not_modified = etag.check(db, request, response, etag.meeting_detail(meeting_id))
+        if not_modified:
+            return not_modified
+        meeting = crud.get_meeting_detail(db, meeting_id)
+        if not meeting:
+            raise HTTPException(status_code=404, detail="Meeting not found")
+        return serialization.meeting_detail_response(meeting, response)
 
 
 # ================= Meeting Reports =================
@@ -171,6 +279,22 @@ def generate_meeting_report_endpoint(meeting_id: int, db: Session = Depends(get_
     return crud.generate_meeting_report(db, meeting_id=meeting_id)
 
 
+@app.post("/meetings/reports", response_model=List[schemas.MeetingReport])
+def generate_meeting_reports_endpoint(payload: schemas.MeetingReportBatch, db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
+    """Genera (o devuelve si ya existen) los reportes de varias reuniones con una sola consulta de conteos.
+
+    Solo el coordinador de todas las reuniones indicadas puede pedirlos.
+    """
+    meeting_ids = list(dict.fromkeys(payload.meeting_ids))
+    meetings = crud.get_meetings_by_ids(db, meeting_ids)
+    if len(meetings) != len(meeting_ids):
+        raise HTTPException(status_code=404, detail="Meeting not found")
+    if any(m.coordinator_id != current_user.id for m in meetings.values()):
+        raise HTTPException(status_code=403, detail="Only the coordinator can generate the report")
+
+    return crud.generate_meeting_reports(db, [meetings[mid] for mid in meeting_ids])
+
+
 @app.get("/meetings/{meeting_id}/report", response_model=schemas.MeetingReport)
 def get_meeting_report(meeting_id: int, db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
     """Obtiene el reporte ya generado de una reunión.
@@ -194,24 +318,68 @@ def get_meeting_report(meeting_id: int, db: Session = Depends(get_db), current_u
 
 # ================= General Reports =================
 
+@app.post("/report/general", response_model=schemas.GeneralReport)
+def generate_general_report(window: schemas.ReportWindow = "all", db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
+    """Genera (o devuelve si ya existe) el reporte general del usuario; desde ahí lo mantiene el trigger."""
+    return crud.generate_general_report(db, user_id=current_user.id, window=window)
+
+
 @app.get("/report/general", response_model=schemas.GeneralReport)
-def generate_general_report(db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
-    return crud.generate_general_report(db, user_id=current_user.id)
+def get_general_report(window: schemas.ReportWindow = "all", db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
+    """Obtiene el reporte general del usuario. La primera vez lo crea (igual que POST), así las lecturas
+    siguientes son una lectura por clave en vez de agregar todo el historial."""
+    return crud.generate_general_report(db, user_id=current_user.id, window=window)
+
+
+@app.post("/report/general/batch", response_model=List[schemas.UserGeneralReport])
+def generate_general_reports(payload: schemas.GeneralReportBatch, db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
+    """Reporte general de varios usuarios en una sola consulta (solo administradores)."""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can view other users' reports")
+    return crud.generate_general_reports(db, list(dict.fromkeys(payload.user_ids)), window=payload.window)
 
 
 # ================= Attendance =================
-@app.post("/attendance/mark", response_model=schemas.Attendance)
-def mark_attendance(payload: schemas.AttendanceCreate, db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
-    """Marca la asistencia del usuario autenticado a la reunión indicada.
-    Valida que la reunión esté en curso (ventana de tiempo) y actualiza o crea el registro.
-    """
-    return crud.mark_attendance(db, user_id=current_user.id, meeting_id=payload.meeting_id, status=payload.status or "present")
+if attendance_buffer.ENABLED:
+    @app.post("/attendance/mark", response_model=schemas.Attendance)
+    def mark_attendance(payload: schemas.AttendanceCreate, db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
+        """Marca la asistencia en modo write-behind: valida la ventana, encola y responde sin esperar a la BD.
+        La respuesta es la misma que sin buffer, con el id que tendrá la fila (ver attendance_buffer)."""
+        return attendance_buffer.mark(db, user_id=current_user.id, meeting_id=payload.meeting_id)
+elif DB_ASYNC:
+    @app.post("/attendance/mark", response_model=schemas.Attendance)
+    async def mark_attendance(payload: schemas.AttendanceCreate, db: AsyncSession = Depends(get_async_db), current_user=Depends(auth.get_current_user_async)):
+        """Marca la asistencia del usuario autenticado a la reunión indicada (sesión async)."""
+        return await crud_async.mark_attendance(db, user_id=current_user.id, meeting_id=payload.meeting_id, status=payload.status or "present")
+else:
+    @app.post("/attendance/mark", response_model=schemas.Attendance)
+    def mark_attendance(payload: schemas.AttendanceCreate, db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
+        """Marca la asistencia del usuario autenticado a la reunión indicada.
+        Valida que la reunión esté en curso (ventana de tiempo) y actualiza o crea el registro.
+        """
+        return crud.mark_attendance(db, user_id=current_user.id, meeting_id=payload.meeting_id, status=payload.status or "present")
+
+
+@app.post("/attendance/heartbeat", response_model=schemas.AttendancePresence)
+def attendance_heartbeat(payload: schemas.AttendanceHeartbeat, db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
+    """Ping periódico del app mientras el usuario está en la reunión; extiende sus tramos de presencia."""
+    return crud.record_heartbeat(db, user_id=current_user.id, meeting_id=payload.meeting_id)
 
 
 @app.get("/attendance/my", response_model=List[schemas.Attendance])
-def my_attendance(db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
-    """Devuelve todas las asistencias del usuario autenticado."""
-    return crud.list_attendance_for_user(db, user_id=current_user.id)
+def my_attendance(
+    response: Response,
+    page: PageParams = Depends(),
+    status_filter: Optional[str] = Query(None, alias="status"),
+    meeting_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user=Depends(auth.get_current_user),
+):
+    """Devuelve las asistencias del usuario autenticado (paginadas, filtrables por status/meeting_id)."""
+    attendances = crud.list_attendance_for_user(
+        db, user_id=current_user.id, limit=page.limit, cursor=page.cursor, status=status_filter, meeting_id=meeting_id
+    )
+    return set_next_cursor(response, attendances, page.limit, key=lambda a: (a.id,))
 
 
 @app.post("/attendance", response_model=schemas.Attendance)
@@ -231,6 +399,29 @@ def add_attendance(payload: schemas.AttendanceAssign,
 
     return crud.add_attendance(db,user_id=payload.user_id,meeting_id=payload.meeting_id,status=payload.status or "absent")
 
+@app.post("/attendance/bulk", response_model=schemas.AttendanceBulkResult)
+def bulk_add_attendance(payload: schemas.AttendanceBulkInvite,
+                        db: Session = Depends(get_db),
+                        current_user=Depends(auth.get_current_user)):
+    """Invita a muchos usuarios (por id o email) a una reunión en una sola transacción.
+    Solo el coordinador puede agregar asistentes.
+    """
+    meeting = crud.get_meeting(db, payload.meeting_id)
+    if not meeting:
+        raise HTTPException(status_code=404, detail="Meeting not found")
+
+    if meeting.coordinator_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Only the coordinator can add assistants")
+
+    results = crud.bulk_add_attendance(
+        db,
+        meeting_id=payload.meeting_id,
+        user_ids=payload.user_ids,
+        emails=payload.emails,
+        status=payload.status or "absent",
+    )
+    return {"meeting_id": payload.meeting_id, "results": results}
+
 # Elimina la asistencia de un usuario a una reunión
 @app.delete("/attendance")
 def remove_attendance(
@@ -267,17 +458,20 @@ def remove_attendance(
 @app.get("/attendance/meeting/{meeting_id}", response_model=List[schemas.Attendance])
 def list_attendance_for_meeting(meeting_id: int, db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
     """Lista todas las asistencias registradas para la reunión indicada."""
-    return crud.list_attendance_for_meeting(db, meeting_id=meeting_id)
+    return serialization.json_response(crud.list_attendance_rows_for_meeting(db, meeting_id=meeting_id))
 
 
 
 @app.get("/attendance/meeting_named_user/{meeting_id}", response_model=List[schemas.AttendanceWithUser])
-def list_attendance_for_meeting_named_user(meeting_id: int, db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
+def list_attendance_for_meeting_named_user(meeting_id: int, request: Request, response: Response, db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
     """Lista todas las asistencias registradas para la reunión indicada, incluyendo el nombre de usuario.
 
     Esto permite al frontend obtener directamente la lista con `user_name` sin tener que solicitar
     todos los usuarios por separado.
     """
+    not_modified = etag.check(db, request, response, etag.attendance_with_users(meeting_id))
+    if not_modified:
+        return not_modified
     return crud.list_attendance_for_meeting_with_name_user(db, meeting_id=meeting_id)
 
 
@@ -285,18 +479,55 @@ def list_attendance_for_meeting_named_user(meeting_id: int, db: Session = Depend
 @app.get("/attendance/my/{meeting_id}", response_model=schemas.Attendance)
 def get_my_attendance(meeting_id: int, db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
     """Obtiene la asistencia del usuario autenticado a la reunión indicada."""
+    # Una marca aún en el buffer write-behind es más reciente que lo que hay en la BD
+    pending = attendance_buffer.get_pending(current_user.id, meeting_id)
+    if pending is not None:
+        return pending
     return crud.get_attendance_for_user(db, user_id=current_user.id, meeting_id=meeting_id)
 
 
 
+# ================= Sightings =================
+@app.post("/sightings", response_model=schemas.SightingIngestResult, status_code=status.HTTP_202_ACCEPTED)
+def ingest_sightings(batch: schemas.SightingBatch, db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
+    """Recibe un lote de muestras (rssi, timestamp) por beacon que el app vio del usuario autenticado."""
+    if sightings.count_samples(batch) > sightings.SIGHTINGS_MAX_SAMPLES:
+        raise HTTPException(status_code=413, detail="Too many samples in one batch")
+    return sightings.ingest(db, user_id=current_user.id, batch=batch)
+
+
+
 # ================= Beacon =================
 @app.post("/beacons", response_model=schemas.Beacon)
 def create_beacon(beacon: schemas.BeaconCreate, db: Session = Depends(get_db)):
     return crud.create_beacon(db, beacon)
 
 @app.get("/beacons", response_model=list[schemas.Beacon])
-def list_beacons(db: Session = Depends(get_db)):
-    return crud.get_beacons(db)
+def list_beacons(request: Request, response: Response, page: PageParams = Depends(), location: Optional[str] = None, db: Session = Depends(get_db)):
+    not_modified = etag.check(db, request, response, etag.BEACONS)
+    if not_modified:
+        return not_modified
+    beacons = crud.get_beacons(db, limit=page.limit, cursor=page.cursor, location=location)
+    return set_next_cursor(response, beacons, page.limit, key=lambda b: (b.id,))
+
+# Debe declararse antes de /beacons/{beacon_id}
+@app.get("/beacons/resolve", response_model=schemas.BeaconResolution)
+def resolve_beacon(major: int, minor: int, current_user=Depends(auth.get_current_user)):
+    """Devuelve la reunión en curso (o la siguiente) en el beacon detectado, desde el índice en memoria."""
+    resolved = beacon_index.resolve(major, minor)
+    if resolved is None:
+        raise HTTPException(status_code=404, detail=BEACON_NOT_FOUND)
+    beacon_id, interval, active = resolved
+    if interval is None:
+        return {"beacon_id": beacon_id}
+    return {
+        "beacon_id": beacon_id,
+        "active": active,
+        "meeting_id": interval.meeting_id,
+        "title": interval.title,
+        "start_time": interval.start_time.astimezone(crud.CHILE_TZ),
+        "end_time": interval.end_time.astimezone(crud.CHILE_TZ),
+    }
 
 @app.get("/beacons/{beacon_id}", response_model=schemas.Beacon)
 def get_beacon(beacon_id: str, db: Session = Depends(get_db)):
@@ -323,5 +554,6 @@ def delete_beacon(beacon_id: str, db: Session = Depends(get_db)):
 
 # Devuelve la lista de todos los beacons disponibles para asociar a una reunión.
 @app.get("/meetings/available-beacons", response_model=List[schemas.Beacon])
-def get_available_beacons(db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
-    return crud.get_beacons(db)
\ No newline at end of file
+def get_available_beacons(response: Response, page: PageParams = Depends(), db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
+    beacons = crud.get_beacons(db, limit=page.limit, cursor=page.cursor)
+    return set_next_cursor(response, beacons, page.limit, key=lambda b: (b.id,))
\ No newline at end of file
@@ -1,15 +1,26 @@
 from db import Base
+import report_triggers
+import etag
 from sqlalchemy import (
     Column,
     Integer,
+    BigInteger,
+    SmallInteger,
     String,
     ForeignKey,
     DateTime,
     Boolean,
+    Date,
     func,
     Float,
     UniqueConstraint,
+    Index,
+    text,
+    Computed,
+    DDL,
+    event,
 )
+from sqlalchemy.dialects.postgresql import ARRAY, TSTZRANGE, ExcludeConstraint
 from sqlalchemy.orm import relationship
 
 
@@ -22,6 +33,9 @@ class User(Base):
     hashed_password = Column(String)
     is_admin = Column(Boolean, default=False) #Boleano para saber si el usuario es admin
     onesignal_player_id = Column(String, nullable=True)  # Player ID de OneSignal para notificaciones
+    # Se incrementa al cambiar email/contraseña; invalida los JWT emitidos antes del cambio.
+    # create_all no agrega columnas a tablas existentes: ver "Migraciones" en el README
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Relationships
     attendances = relationship("Attendance", back_populates="user", cascade="all, delete-orphan")
@@ -39,13 +53,30 @@ class Meeting(Base):
     # Nuevos campos solicitados
     topics = Column(String, nullable=True)
     repeat_weekly = Column(Boolean, nullable=False, default=False)
+    # Serie semanal: última fecha en que puede empezar una ocurrencia (null = sin fin). Ver recurrence.py
+    repeat_until = Column(DateTime(timezone=True), nullable=True)
     note = Column(String, nullable=True)
 
+    # Ocurrencia materializada de una serie (se crea al marcar asistencia en ella)
+    series_id = Column(Integer, ForeignKey("meetings.id", ondelete="CASCADE"), index=True, nullable=True)
+    occurrence_start = Column(DateTime(timezone=True), nullable=True)  # inicio original de la ocurrencia
+
     # Coordinador (quien creó la reunión)
     coordinator_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), index=True, nullable=True)
 
     # Beacon asociado por id (ya no uuid/major/minor en la reunión)
     beacon_id = Column(String, ForeignKey("beacons.id", ondelete="SET NULL"), index=True, nullable=True)
+    # Sala (location) reservada: la del payload o la del beacon al momento de crear la reunión
+    room = Column(String, nullable=True)
+    # Intervalo [inicio, fin) calculado por la BD; respalda las restricciones de solapamiento
+    during = Column(
+        TSTZRANGE,
+        Computed(
+            "CASE WHEN start_time IS NOT NULL AND end_time IS NOT NULL "
+            "THEN tstzrange(start_time, end_time, '[)') END",
+            persisted=True,
+        ),
+    )
 
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
@@ -54,6 +85,48 @@ class Meeting(Base):
     coordinator = relationship("User", back_populates="coordinated_meetings", foreign_keys=[coordinator_id])
     beacon = relationship("Beacon", back_populates="meetings", foreign_keys=[beacon_id])
 
+    # Dos reuniones no pueden solaparse en el mismo beacon ni en la misma sala. Las valida la BD con
+    # índices GiST al insertar, así que dos reservas concurrentes no pueden pasar ambas.
+    # Las ocurrencias materializadas repiten un horario de su serie y quedan fuera.
+    __table_args__ = (
+        ExcludeConstraint(
+            ("beacon_id", "="), ("during", "&&"),
+            name="ex_meetings_beacon_during", using="gist", where=text("series_id IS NULL"),
+        ),
+        ExcludeConstraint(
+            ("room", "="), ("during", "&&"),
+            name="ex_meetings_room_during", using="gist", where=text("series_id IS NULL"),
+        ),
+        UniqueConstraint("series_id", "occurrence_start", name="uq_meetings_series_occurrence"),
+    )
+
+
+# El operador = de texto dentro de un índice GiST requiere btree_gist
+event.listen(
+    Meeting.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql"),
+)
+
+
+# Índice para las listas paginadas por keyset (ORDER BY start_time DESC NULLS LAST, id DESC)
+Index("ix_meetings_start_time_id", Meeting.start_time.desc().nullslast(), Meeting.id.desc())
+
+
+class MeetingException(Base):
+    """Excepción de una ocurrencia de una serie semanal (por ahora, solo cancelaciones)."""
+    __tablename__ = "meeting_exceptions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    series_id = Column(Integer, ForeignKey("meetings.id", ondelete="CASCADE"), nullable=False)
+    occurrence_start = Column(DateTime(timezone=True), nullable=False)
+    cancelled = Column(Boolean, nullable=False, default=True, server_default="true")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("series_id", "occurrence_start", name="uq_meeting_exceptions_occurrence"),
+    )
+
 
 class Attendance(Base):
     __tablename__ = "attendance"
@@ -63,16 +136,24 @@ class Attendance(Base):
     meeting_id = Column(Integer, ForeignKey("meetings.id", ondelete="CASCADE"), index=True, nullable=False)
     status = Column(String, nullable=False, default="absent")  # present | late | absent (default present)
     marked_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Tramos de presencia [entrada, salida) aplanados, en segundos desde el inicio (ver intervals.py)
+    presence_runs = Column(ARRAY(Integer), nullable=True)
+    seconds_present = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Constraints
     __table_args__ = (
         UniqueConstraint("user_id", "meeting_id", name="uq_attendance_user_meeting"),
+        Index("ix_attendance_user_id_id", "user_id", "id"),  # /attendance/my paginado por id
     )
 
     # Relationships
     user = relationship("User", back_populates="attendances")
     meeting = relationship("Meeting", back_populates="attendances")
 
+    @property
+    def minutes_present(self) -> float:
+        return round((self.seconds_present or 0) / 60, 1)
+
 
 class Beacon(Base):
     __tablename__ = "beacons"
@@ -111,6 +192,11 @@ class MeetingReport(Base):
     porcentaje_asistencias = Column(Float, nullable=False, default=0.0)
     porcentaje_ausencias = Column(Float, nullable=False, default=0.0)
     porcentaje_tarde = Column(Float, nullable=False, default=0.0)
+    # Promedio de minutos presentes entre quienes registraron presencia (beacon/heartbeat)
+    minutos_presencia_promedio = Column(Float, nullable=True)
+    # Suma y cantidad de permanencias > 0 detrás del promedio; el trigger de attendance las actualiza
+    segundos_presencia_total = Column(Integer, nullable=False, default=0, server_default="0")
+    registros_presencia = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Campos marcados con * (definir pero dejar sin uso por ahora)
     cantidad_asistencias = Column(Integer, nullable=True)
@@ -118,6 +204,11 @@ class MeetingReport(Base):
 
     meeting = relationship("Meeting")
 
+    __table_args__ = (
+        # Un reporte por reunión: el trigger de attendance lo actualiza por meeting_id
+        UniqueConstraint("meeting_id", name="uq_meeting_reports_meeting_id"),
+    )
+
 
 # Add reverse relationship for meetings coordinated by a user
 User.coordinated_meetings = relationship("Meeting", back_populates="coordinator", foreign_keys=[Meeting.coordinator_id])
@@ -130,8 +221,99 @@ class GeneralReport(Base):
 
     cantidad_asistencias = Column(Integer, nullable=False, default=0)
     cantidad_reuniones = Column(Integer, nullable=False, default=0)
+    cantidad_atrasados = Column(Integer, nullable=False, default=0, server_default="0")
+    cantidad_ausencias = Column(Integer, nullable=False, default=0, server_default="0")
+    segundos_presencia = Column(Integer, nullable=False, default=0, server_default="0")
     porcentaje_asistencias = Column(Float, nullable=False, default=0.0)
     porcentaje_ausencias = Column(Float, nullable=False, default=0.0)
     porcentaje_justificaciones = Column(Float, nullable=False, default=0.0)
 
     user = relationship("User")
+
+    __table_args__ = (
+        # Un reporte por usuario: el trigger de attendance lo actualiza por user_id
+        UniqueConstraint("user_id", name="uq_general_reports_user_id"),
+    )
+
+
+class AttendanceDailyCount(Base):
+    """Conteos de asistencia por usuario y día de la reunión (hora de Chile), para las ventanas
+    de /report/general. Los mantiene el trigger de attendance junto con general_reports."""
+    __tablename__ = "attendance_daily_counts"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    total = Column(Integer, nullable=False, default=0, server_default="0")
+    present = Column(Integer, nullable=False, default=0, server_default="0")
+    late = Column(Integer, nullable=False, default=0, server_default="0")
+    absent = Column(Integer, nullable=False, default=0, server_default="0")
+    seconds_present = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class NotificationOutbox(Base):
+    """Notificaciones pendientes/enviadas; la clave (reunión, ocurrencia, tipo, offset) evita envíos duplicados
+    entre reinicios y entre workers."""
+    __tablename__ = "notification_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    meeting_id = Column(Integer, ForeignKey("meetings.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String, nullable=False)  # meeting_starting
+    offset_minutes = Column(Integer, nullable=False)  # minutos antes del inicio
+    # Inicio de la ocurrencia notificada (una serie semanal tiene un recordatorio por ocurrencia)
+    occurrence_start = Column(DateTime(timezone=True), nullable=False)
+    status = Column(String, nullable=False, default="pending", server_default="pending")  # pending | sent | failed
+    scheduled_for = Column(DateTime(timezone=True), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(String, nullable=True)
+    # Destinatarios de los bloques que fallaron en un envío parcial; el reintento va solo a ellos
+    pending_player_ids = Column(ARRAY(String), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "meeting_id", "occurrence_start", "kind", "offset_minutes", name="uq_outbox_meeting_occurrence_kind_offset"
+        ),
+        # Solo las filas pendientes se consultan por fecha
+        Index("ix_outbox_pending_scheduled_for", "scheduled_for", postgresql_where=text("status = 'pending'")),
+    )
+
+    meeting = relationship("Meeting")
+
+
+class BeaconSighting(Base):
+    """Muestras RSSI que el teléfono vio de un beacon (solo inserción, cargadas en lote con COPY)."""
+    __tablename__ = "beacon_sightings"
+
+    id = Column(BigInteger, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    beacon_id = Column(String, ForeignKey("beacons.id", ondelete="CASCADE"), nullable=False)
+    # Reunión en curso en el beacon a la hora de la muestra (null si no había ninguna)
+    meeting_id = Column(Integer, ForeignKey("meetings.id", ondelete="CASCADE"), nullable=True)
+    rssi = Column(SmallInteger, nullable=False)
+    seen_at = Column(DateTime(timezone=True), nullable=False)  # hora del dispositivo
+    received_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        # El motor de presencia lee las muestras de una reunión por usuario y tiempo
+        Index("ix_sightings_meeting_user_seen", "meeting_id", "user_id", "seen_at"),
+        # Marca de agua del motor de presencia; BRIN porque received_at crece con cada inserción
+        Index("ix_sightings_received_at", "received_at", postgresql_using="brin"),
+    )
+
+
+class ResourceVersion(Base):
+    """Contador de cambios por tabla para los ETag de las lecturas (ver etag.py). Se reparte en varias
+    filas (slot) para que las escrituras concurrentes no esperen todas por la misma fila; la versión
+    de un recurso es la suma de sus slots."""
+    __tablename__ = "resource_versions"
+
+    resource = Column(String, primary_key=True)
+    slot = Column(SmallInteger, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+
+# Triggers que mantienen meeting_reports al día con cada cambio de attendance
+report_triggers.register(Base.metadata)
+# Triggers que incrementan resource_versions con cada escritura en las tablas cacheadas
+etag.register(Base.metadata)
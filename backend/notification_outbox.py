@@ -0,0 +1,169 @@
+"""
+Outbox persistente de notificaciones.
+Cada recordatorio es una fila única por (reunión, ocurrencia, tipo, offset). Los workers reclaman filas pendientes con
+SELECT ... FOR UPDATE SKIP LOCKED y las envían en lotes, así escalar la API no multiplica los push.
+"""
+import os
+from datetime import datetime, timezone, timedelta
+from typing import Iterable
+
+from sqlalchemy import and_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import Meeting, Attendance, User, NotificationOutbox
+import notification_service
+import log
+
+logger = log.get_logger(__name__)
+
+
+KIND_MEETING_STARTING = "meeting_starting"
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETRY_SECONDS = int(os.getenv("OUTBOX_RETRY_SECONDS", "30"))
+
+
+def enqueue(db: Session, rows: Iterable[tuple[int, datetime, datetime]], kind: str, offset_minutes: int) -> None:
+    """Inserta filas pendientes (meeting_id, occurrence_start, scheduled_for); si ya existen no hace nada."""
+    values = [
+        {
+            "meeting_id": meeting_id,
+            "occurrence_start": occurrence_start,
+            "kind": kind,
+            "offset_minutes": offset_minutes,
+            "status": "pending",
+            "scheduled_for": scheduled_for,
+        }
+        for meeting_id, occurrence_start, scheduled_for in rows
+    ]
+    if not values:
+        return
+    stmt = pg_insert(NotificationOutbox).values(values).on_conflict_do_nothing(
+        index_elements=["meeting_id", "occurrence_start", "kind", "offset_minutes"]
+    )
+    db.execute(stmt)
+
+
+def _claim_batch(db: Session, now: datetime, batch_size: int) -> list[NotificationOutbox]:
+    """Reclama filas pendientes vencidas; las que otro worker tiene bloqueadas se saltan."""
+    return (
+        db.query(NotificationOutbox)
+        .filter(NotificationOutbox.status == "pending", NotificationOutbox.scheduled_for <= now)
+        .order_by(NotificationOutbox.scheduled_for)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+
+
+def _resolve_recipients(db: Session, meeting_ids: list[int]) -> dict[int, tuple[str, datetime | None, list[str]]]:
+    """Devuelve {meeting_id: (title, start_time, player_ids)} para todo el lote con una sola consulta.
+
+    Los player_ids se deduplican por reunión, y reuniones con el mismo conjunto de destinatarios
+    comparten la misma lista.
+    """
+    rows = (
+        db.query(Meeting.id, Meeting.title, Meeting.start_time, User.onesignal_player_id)
+        .outerjoin(Attendance, Attendance.meeting_id == Meeting.id)
+        .outerjoin(User, and_(User.id == Attendance.user_id, User.onesignal_player_id.isnot(None)))
+        .filter(Meeting.id.in_(meeting_ids))
+        .all()
+    )
+    meetings: dict[int, tuple[str, datetime | None]] = {}
+    players: dict[int, dict[str, None]] = {}
+    for meeting_id, title, start_time, player_id in rows:
+        meetings[meeting_id] = (title, start_time)
+        bucket = players.setdefault(meeting_id, {})
+        if player_id:
+            bucket[player_id] = None  # dict como set ordenado
+
+    shared: dict[tuple[str, ...], list[str]] = {}
+    recipients = {}
+    for meeting_id, (title, start_time) in meetings.items():
+        key = tuple(sorted(players[meeting_id]))
+        recipients[meeting_id] = (title, start_time, shared.setdefault(key, list(key)))
+    return recipients
+
+
+def _record_failure(row: NotificationOutbox, error: str, now: datetime) -> None:
+    """Reintenta más tarde con espera creciente; al agotar los intentos la fila queda en failed."""
+    row.last_error = error
+    if row.attempts >= OUTBOX_MAX_ATTEMPTS:
+        row.status = "failed"
+    else:
+        row.scheduled_for = now + timedelta(seconds=OUTBOX_RETRY_SECONDS * row.attempts)
+
+
+def _send(row: NotificationOutbox, recipients: dict, now: datetime) -> None:
+    title, start_time, player_ids = recipients.get(row.meeting_id, (None, None, []))
+    if title is None or start_time is None or row.occurrence_start <= now:
+        # La reunión ya empezó (o se borró): el recordatorio dejó de tener sentido
+        row.status = "failed"
+        row.last_error = "Meeting already started"
+        return
+
+    if row.pending_player_ids:
+        # Envío parcial anterior: solo faltan los destinatarios de los bloques que fallaron
+        player_ids = list(row.pending_player_ids)
+    if not player_ids:
+        row.status = "sent"
+        row.sent_at = now
+        row.last_error = "No registered devices"
+        return
+
+    logger.info("Enviando notificacion para reunion '%s' a %s usuarios", title, len(player_ids))
+    result = notification_service.notify_meeting_starting(
+        player_ids=player_ids,
+        meeting_title=title,
+        minutes_before=row.offset_minutes,
+    )
+    row.attempts += 1
+    if isinstance(result, dict) and result.get("error"):
+        _record_failure(row, str(result["error"]), now)
+        return
+    failed = result.get("failed_player_ids") if isinstance(result, dict) else None
+    if failed:
+        row.pending_player_ids = failed
+        _record_failure(row, "; ".join(result.get("errors", [])), now)
+        return
+    row.status = "sent"
+    row.sent_at = now
+    row.last_error = None
+    row.pending_player_ids = None
+
+
+def dispatch_pending(batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """Envía las notificaciones vencidas en lotes; devuelve cuántas filas se procesaron.
+
+    Los bloqueos se mantienen hasta el commit del lote, así que dos workers nunca envían la misma fila.
+    """
+    processed = 0
+    while True:
+        db: Session = SessionLocal()
+        try:
+            now = datetime.now(timezone.utc)
+            batch = _claim_batch(db, now, batch_size)
+            if not batch:
+                db.commit()
+                return processed
+            recipients = _resolve_recipients(db, list({row.meeting_id for row in batch}))
+            for row in batch:
+                try:
+                    _send(row, recipients, now)
+                except Exception as e:
+                    logger.exception("Error enviando la notificacion %s: %s", row.id, e)
+                    row.attempts += 1
+                    _record_failure(row, str(e), now)
+            db.commit()
+            processed += len(batch)
+        except Exception as e:
+            db.rollback()
+            logger.exception("Error en dispatch_pending: %s", e)
+            return processed
+        finally:
+            db.close()
+        if len(batch) < batch_size:
+            return processed
@@ -1,12 +1,21 @@
 """
-Servicio de notificaciones usando OneSignal SDK.
+Servicio de notificaciones usando la API REST de OneSignal.
 Permite enviar notificaciones push a usuarios específicos.
+
+El envío es asíncrono (httpx) con un pool de conexiones keep-alive: las listas grandes de destinatarios
+se dividen en bloques, los bloques se envían con concurrencia acotada y los 429/5xx se reintentan con
+backoff exponencial con jitter. Los llamadores síncronos (scheduler, outbox) usan un event loop propio.
 """
+import asyncio
+import concurrent.futures
+import json
 import os
-from onesignal_sdk.client import Client
+import random
+import threading
+import httpx
 from typing import List, Optional
 from dotenv import load_dotenv
-import sys
+import log
 
 # Cargar variables de entorno
 load_dotenv()
@@ -14,21 +23,188 @@ load_dotenv()
 # Configuración de OneSignal desde variables de entorno
 ONESIGNAL_APP_ID = os.getenv("ONESIGNAL_APP_ID")
 ONESIGNAL_REST_API_KEY = os.getenv("ONESIGNAL_REST_API_KEY")
+ONESIGNAL_API_URL = os.getenv("ONESIGNAL_API_URL", "https://onesignal.com/api/v1/notifications")
+ONESIGNAL_AUTH_SCHEME = os.getenv("ONESIGNAL_AUTH_SCHEME", "Basic")  # "Key" para las API keys nuevas
+# OneSignal acepta como máximo 2000 include_player_ids por request
+ONESIGNAL_CHUNK_SIZE = int(os.getenv("ONESIGNAL_CHUNK_SIZE", "2000"))
+ONESIGNAL_MAX_CONCURRENCY = int(os.getenv("ONESIGNAL_MAX_CONCURRENCY", "8"))
+ONESIGNAL_MAX_RETRIES = int(os.getenv("ONESIGNAL_MAX_RETRIES", "4"))
+ONESIGNAL_TIMEOUT_SECONDS = float(os.getenv("ONESIGNAL_TIMEOUT_SECONDS", "10"))
+# Tiempo máximo que un llamador síncrono espera un envío completo (todos los bloques con sus reintentos)
+ONESIGNAL_SEND_TIMEOUT_SECONDS = float(os.getenv("ONESIGNAL_SEND_TIMEOUT_SECONDS", "120"))
+# Con ONESIGNAL_STUB=true no se llama a OneSignal: un transporte local responde 200 (desarrollo;
+# tests/test_notification_service.py usa el mismo transporte)
+ONESIGNAL_STUB = os.getenv("ONESIGNAL_STUB", "false").lower() in ("1", "true", "yes")
+
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+
+logger = log.get_logger(__name__)
+
+logger.info(
+    "Configuracion OneSignal: APP_ID=%s, REST_API_KEY=%s%s",
+    ONESIGNAL_APP_ID,
+    "Configurado" if ONESIGNAL_REST_API_KEY else "No encontrado",
+    " (modo stub: las notificaciones no salen del servidor)" if ONESIGNAL_STUB else "",
+)
+
+
+def stub_transport(status_code: int = 200, sent: Optional[list] = None) -> httpx.MockTransport:
+    """Transporte local que responde sin red; si se pasa `sent`, guarda ahí cada body recibido."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        if sent is not None:
+            sent.append(body)
+        if status_code >= 400:
+            return httpx.Response(status_code, json={"errors": ["stub error"]})
+        return httpx.Response(
+            status_code,
+            json={"id": "stub", "recipients": len(body.get("include_player_ids", []))},
+        )
+
+    return httpx.MockTransport(handler)
+
+
+class OneSignalDelivery:
+    """Cliente asíncrono de OneSignal con pool de conexiones, bloques, concurrencia acotada y reintentos."""
+
+    def __init__(
+        self,
+        app_id: str,
+        rest_api_key: str,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        chunk_size: int = ONESIGNAL_CHUNK_SIZE,
+        max_concurrency: int = ONESIGNAL_MAX_CONCURRENCY,
+        max_retries: int = ONESIGNAL_MAX_RETRIES,
+    ):
+        self.app_id = app_id
+        self.rest_api_key = rest_api_key
+        self.chunk_size = chunk_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                transport=self._transport,
+                timeout=ONESIGNAL_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+                headers={
+                    "Authorization": f"{ONESIGNAL_AUTH_SCHEME} {self.rest_api_key}",
+                    "Content-Type": "application/json; charset=utf-8",
+                },
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    @staticmethod
+    def _retry_delay(attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """Backoff exponencial con jitter completo; respeta Retry-After si OneSignal lo envía."""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), BACKOFF_MAX_SECONDS)
+        return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+    async def _send_chunk(self, body: dict) -> dict:
+        client = self._get_client()
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                async with self._semaphore:
+                    response = await client.post(ONESIGNAL_API_URL, json=body)
+                if response.status_code < 300:
+                    return response.json()
+                if response.status_code != 429 and response.status_code < 500:
+                    return {"error": f"HTTP {response.status_code}: {response.text}"}
+                error = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                error = str(e) or type(e).__name__
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._retry_delay(attempt, response))
+        return {"error": error}
+
+    async def send(
+        self,
+        player_ids: List[str],
+        title: str,
+        message: str,
+        data: Optional[dict] = None,
+        delivered: Optional[set] = None,
+    ) -> dict:
+        """Envía la notificación a todos los player_ids, en bloques de `chunk_size` en paralelo.
+
+        Si se pasa `delivered`, cada bloque que sale agrega ahí sus destinatarios apenas responde
+        OneSignal, así quien deja de esperar el envío sabe a quiénes ya les llegó.
+        """
+        base = {
+            "app_id": self.app_id,
+            "headings": {"en": title},
+            "contents": {"en": message},
+        }
+        if data:
+            base["data"] = data
+        chunks = [player_ids[i:i + self.chunk_size] for i in range(0, len(player_ids), self.chunk_size)]
+
+        async def send_chunk(chunk: List[str]) -> dict:
+            result = await self._send_chunk({**base, "include_player_ids": chunk})
+            if delivered is not None and "error" not in result:
+                delivered.update(chunk)
+            return result
+
+        results = await asyncio.gather(*(send_chunk(chunk) for chunk in chunks))
+
+        sent = [r for r in results if "error" not in r]
+        errors = [r["error"] for r in results if "error" in r]
+        summary = {
+            "id": [r.get("id") for r in sent],
+            "recipients": sum(r.get("recipients", 0) for r in sent),
+            "chunks": len(chunks),
+        }
+        if errors:
+            summary["errors"] = errors
+            # Destinatarios de los bloques que no salieron: el outbox reintenta solo a ellos,
+            # para no reenviar a quienes ya recibieron la notificación
+            summary["failed_player_ids"] = [
+                player_id for chunk, r in zip(chunks, results) if "error" in r for player_id in chunk
+            ]
+            if not sent:
+                summary["error"] = errors[0]
+        return summary
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
-print("=" * 60, flush=True)
-print(f"Configuracion OneSignal:", flush=True)
-print(f"   APP_ID: {ONESIGNAL_APP_ID}", flush=True)
-print(f"   REST_API_KEY: {'Configurado' if ONESIGNAL_REST_API_KEY else 'No encontrado'}", flush=True)
-print("=" * 60, flush=True)
 
 # Cliente de OneSignal
-onesignal_client = None
+delivery: Optional[OneSignalDelivery] = None
+
+if ONESIGNAL_STUB:
+    delivery = OneSignalDelivery(app_id=ONESIGNAL_APP_ID or "stub", rest_api_key="stub", transport=stub_transport())
+elif ONESIGNAL_APP_ID and ONESIGNAL_REST_API_KEY:
+    delivery = OneSignalDelivery(app_id=ONESIGNAL_APP_ID, rest_api_key=ONESIGNAL_REST_API_KEY)
+
+# Event loop dedicado para los llamadores síncronos; mantiene vivo el pool de conexiones entre envíos
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
 
-if ONESIGNAL_APP_ID and ONESIGNAL_REST_API_KEY:
-    onesignal_client = Client(
-        app_id=ONESIGNAL_APP_ID,
-        rest_api_key=ONESIGNAL_REST_API_KEY,
-    )
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="onesignal-delivery", daemon=True).start()
+        return _loop
 
 
 def send_notification_to_players(
@@ -39,51 +215,75 @@ def send_notification_to_players(
 ) -> dict:
     """
     Envía una notificación a una lista de player_ids específicos.
-    
+
     Args:
         player_ids: Lista de OneSignal player IDs
         title: Título de la notificación
         message: Cuerpo del mensaje
         data: Datos adicionales (opcional)
-    
+
     Returns:
-        Respuesta de OneSignal API
+        Resumen de las respuestas de OneSignal (ids, recipients, chunks y, si hubo errores, errors y
+        failed_player_ids con los destinatarios de los bloques que no salieron). Si se agota
+        ONESIGNAL_SEND_TIMEOUT_SECONDS, failed_player_ids son los destinatarios de los bloques que no
+        alcanzaron a confirmarse (los que estaban en vuelo pueden haber llegado igual).
     """
-    if not onesignal_client:
+    if not delivery:
         error_msg = "OneSignal no esta configurado. Verifica ONESIGNAL_APP_ID y ONESIGNAL_REST_API_KEY en .env"
-        print(error_msg, flush=True)
+        logger.error(error_msg)
         return {"error": "OneSignal not configured"}
-    
+
     if not player_ids:
         return {"error": "No player_ids provided"}
-    
-    notification_body = {
-        "include_player_ids": player_ids,
-        "headings": {"en": title},
-        "contents": {"en": message},
-    }
-    
-    if data:
-        notification_body["data"] = data
-    
+
+    delivered: set = set()
     try:
-        print(f"Enviando notificacion a OneSignal", flush=True)
-        print(f"   Body: {notification_body}", flush=True)
-        response = onesignal_client.send_notification(notification_body)
-        print(f"Notificacion enviada exitosamente", flush=True)
-        print(f"   Respuesta: {response.body}", flush=True)
-        return response.body
+        future = asyncio.run_coroutine_threadsafe(
+            delivery.send(player_ids, title, message, data, delivered), _get_loop()
+        )
+        try:
+            result = future.result(timeout=ONESIGNAL_SEND_TIMEOUT_SECONDS)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            logger.error("Envio de notificacion sin respuesta tras %ss", ONESIGNAL_SEND_TIMEOUT_SECONDS)
+            return _timeout_summary(player_ids, set(delivered))
+        logger.info("Notificacion enviada a %s destinatarios en %s bloques", len(player_ids), result["chunks"])
+        return result
     except Exception as e:
-        print(f"Error enviando notificacion: {e}", flush=True)
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error enviando notificacion: %s", e)
         return {"error": str(e)}
 
 
+def _timeout_summary(player_ids: List[str], delivered: set) -> dict:
+    """Resumen de un envío cortado por timeout, con la misma forma que OneSignalDelivery.send: el outbox
+    reintenta solo a failed_player_ids y no reenvía a quienes ya recibieron la notificación."""
+    error = "Timed out waiting for OneSignal"
+    summary = {
+        "recipients": len(delivered),
+        "errors": [error],
+        "failed_player_ids": [player_id for player_id in player_ids if player_id not in delivered],
+    }
+    if not delivered:
+        summary["error"] = error
+    return summary
+
+
+def shutdown():
+    """Cierra el pool de conexiones y el event loop de envíos."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            return
+        if delivery is not None:
+            asyncio.run_coroutine_threadsafe(delivery.aclose(), _loop).result(timeout=5)
+        _loop.call_soon_threadsafe(_loop.stop)
+        _loop = None
+
+
 def notify_meeting_starting(player_ids: List[str], meeting_title: str, minutes_before: int = 5):
     """
     Envía notificación de que una reunión está por comenzar.
-    
+
     Args:
         player_ids: Lista de OneSignal player IDs de los participantes
         meeting_title: Título de la reunión
@@ -91,11 +291,11 @@ def notify_meeting_starting(player_ids: List[str], meeting_title: str, minutes_b
     """
     title = f"Reunión próxima: {meeting_title}"
     message = f"La reunión comenzará en {minutes_before} minutos."
-    
+
     data = {
         "type": "meeting_starting",
         "meeting_title": meeting_title,
         "minutes_before": minutes_before
     }
-    
+
     return send_notification_to_players(player_ids, title, message, data)
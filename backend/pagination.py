@@ -0,0 +1,74 @@
+"""
+Paginación por cursor (keyset) para los endpoints de listas.
+El cursor es opaco para el cliente: codifica la clave de orden del último elemento entregado.
+El siguiente cursor se devuelve en el header X-Next-Cursor; el cuerpo sigue siendo una lista.
+Sin ?limit= la lista viene completa, como antes de paginar (el app aún no pagina).
+"""
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence
+
+from fastapi import HTTPException, Query, Response
+
+
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "500"))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams:
+    """Dependencia con los parámetros comunes ?limit=&cursor=."""
+
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX_LIMIT),
+        cursor: Optional[str] = Query(None),
+    ):
+        self.limit = limit
+        self.cursor = cursor
+
+
+def _encode_value(value: Any):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any):
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _has_type(value: Any, expected) -> bool:
+    # bool es subclase de int, pero nunca es un id válido
+    return isinstance(value, expected) and not isinstance(value, bool)
+
+
+def decode_cursor(cursor: str, *types) -> List[Any]:
+    """Decodifica un cursor con un valor por cada tipo de `types` (un tipo o una tupla de tipos).
+    Un cursor inválido o con valores de otro tipo responde 400."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError("unexpected cursor shape")
+        values = [_decode_value(v) for v in values]
+        if not all(_has_type(v, t) for v, t in zip(values, types)):
+            raise ValueError("unexpected cursor value")
+        return values
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def set_next_cursor(response: Response, items: Sequence[Any], limit: int, key: Callable[[Any], Sequence[Any]]):
+    """Si la página vino llena, publica el cursor del último elemento en X-Next-Cursor."""
+    if limit and len(items) >= limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(key(items[-1]))
+    return items
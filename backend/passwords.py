@@ -0,0 +1,75 @@
+"""
+Hashing y verificación de contraseñas (bcrypt) fuera del threadpool de requests.
+Usa un pool de procesos dedicado y acotado para que un pico de logins no bloquee al resto de endpoints.
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(2, os.cpu_count() or 1))))
+# Máximo de operaciones de hash en vuelo (ejecutándose o en cola del pool)
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 4)))
+
+# Hashes con un costo distinto a BCRYPT_ROUNDS quedan marcados para rehash al hacer login: passlib solo
+# marca un hash bcrypt (needs_update) si su costo cae fuera de [min_rounds, max_rounds], así que ambos
+# límites se fijan en BCRYPT_ROUNDS (un costo mayor también se rehashea, hacia abajo)
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def hash_password(plain_password: str) -> str:
+    return pwd_context.hash(plain_password)
+
+
+def verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verifica la contraseña; si el hash usa otro costo devuelve además el hash nuevo."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+    return _executor
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(PASSWORD_HASH_MAX_PENDING)
+    return _semaphore
+
+
+async def _run(func, *args):
+    async with _get_semaphore():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), func, *args)
+
+
+async def hash_password_async(plain_password: str) -> str:
+    return await _run(hash_password, plain_password)
+
+
+async def verify_and_update_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await _run(verify_and_update, plain_password, hashed_password)
+
+
+def shutdown():
+    """Cierra el pool de procesos (llamar al apagar la aplicación)."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
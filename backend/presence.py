@@ -0,0 +1,248 @@
+"""
+Motor de presencia: decide present/late a partir de las muestras RSSI de beacon_sightings.
+Todo el cálculo es vectorizado con NumPy sobre el lote completo de muestras (sin bucles por muestra):
+  1. se ordenan las muestras por (reunión, usuario, tiempo) y se delimitan los grupos;
+  2. el RSSI se suaviza con una media móvil por grupo (sumas acumuladas);
+  3. el RSSI suavizado se convierte en distancia con el modelo log-distance;
+  4. se acumula la permanencia cerca del beacon entre muestras consecutivas;
+  5. quien alcanza la permanencia mínima queda present o late según la regla de la mitad de la reunión.
+Cada reunión tiene un solo beacon, así que agrupar por (reunión, usuario) equivale a (usuario, beacon).
+
+Cada pasada solo reevalúa los pares (reunión, usuario) con muestras recibidas desde la pasada anterior
+(marca de agua sobre received_at), y solo actualiza a invitados de la reunión salvo PRESENCE_INSERT_UNINVITED.
+"""
+import math
+import os
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+from sqlalchemy import Float, and_, cast, func, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import Attendance, BeaconSighting, Meeting
+import crud
+import log
+import recurrence
+
+logger = log.get_logger(__name__)
+
+
+PRESENCE_ENABLED = os.getenv("PRESENCE_ENABLED", "false").lower() in ("1", "true", "yes")
+PRESENCE_INTERVAL_SECONDS = int(os.getenv("PRESENCE_INTERVAL_SECONDS", "30"))
+# Con false (por defecto) solo se decide la asistencia de quienes ya tienen fila en attendance (invitados)
+PRESENCE_INSERT_UNINVITED = os.getenv("PRESENCE_INSERT_UNINVITED", "false").lower() in ("1", "true", "yes")
+# Margen de la marca de agua: cubre los lotes de /sightings que hicieron commit después de la pasada
+# anterior con un received_at (hora de inicio de su transacción) previo a ella
+PRESENCE_WATERMARK_OVERLAP_SECONDS = int(os.getenv("PRESENCE_WATERMARK_OVERLAP_SECONDS", "60"))
+# Muestras promediadas por punto (media móvil hacia atrás)
+PRESENCE_SMOOTHING_WINDOW = int(os.getenv("PRESENCE_SMOOTHING_WINDOW", "5"))
+# Modelo log-distance: RSSI a 1 metro y exponente de pérdida del recinto
+PRESENCE_TX_POWER = float(os.getenv("PRESENCE_TX_POWER", "-59"))
+PRESENCE_PATH_LOSS_EXPONENT = float(os.getenv("PRESENCE_PATH_LOSS_EXPONENT", "2.5"))
+PRESENCE_MAX_DISTANCE_M = float(os.getenv("PRESENCE_MAX_DISTANCE_M", "8"))
+# RSSI mínimo equivalente a PRESENCE_MAX_DISTANCE_M (para filtrar muestras sueltas sin suavizar)
+PRESENCE_NEAR_RSSI = PRESENCE_TX_POWER - 10.0 * PRESENCE_PATH_LOSS_EXPONENT * math.log10(PRESENCE_MAX_DISTANCE_M)
+PRESENCE_MIN_DWELL_SECONDS = float(os.getenv("PRESENCE_MIN_DWELL_SECONDS", "120"))
+# Dos muestras cercanas separadas por más que esto no suman permanencia (el usuario pudo salir)
+PRESENCE_MAX_GAP_SECONDS = float(os.getenv("PRESENCE_MAX_GAP_SECONDS", "30"))
+
+# Inicio de la última pasada que hizo commit (por proceso; None = evaluar todas las muestras)
+_watermark: datetime | None = None
+
+STATUS_PRESENT = 1
+STATUS_LATE = 2
+_STATUS_NAMES = {STATUS_PRESENT: "present", STATUS_LATE: "late"}
+
+
+def decide(
+    meeting: np.ndarray,
+    user: np.ndarray,
+    ts: np.ndarray,
+    rssi: np.ndarray,
+    meeting_ids: np.ndarray,
+    meeting_half: np.ndarray,
+    meeting_end: np.ndarray,
+):
+    """Evalúa un lote de muestras y devuelve (meeting_id, user_id, status, llegada) de quienes están presentes.
+
+    `meeting`, `user`, `ts` (epoch en segundos) y `rssi` son arreglos paralelos de muestras;
+    `meeting_ids` (ordenado), `meeting_half` y `meeting_end` describen las reuniones del lote.
+    `status` usa STATUS_PRESENT / STATUS_LATE y la llegada es un epoch en segundos.
+    """
+    empty = (np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int8), np.empty(0, np.float64))
+    n = ts.shape[0]
+    if n == 0:
+        return empty
+
+    order = np.lexsort((ts, user, meeting))
+    meeting, user, ts, rssi = meeting[order], user[order], ts[order], rssi[order]
+
+    # Inicio de cada grupo (reunión, usuario) e índice de grupo de cada muestra
+    new_group = np.empty(n, dtype=bool)
+    new_group[0] = True
+    new_group[1:] = (meeting[1:] != meeting[:-1]) | (user[1:] != user[:-1])
+    group_start = np.flatnonzero(new_group)
+    group_of = np.cumsum(new_group) - 1
+
+    # Media móvil hacia atrás que no cruza el inicio del grupo
+    idx = np.arange(n)
+    csum = np.concatenate(([0.0], np.cumsum(rssi, dtype=np.float64)))
+    lo = np.maximum(idx - PRESENCE_SMOOTHING_WINDOW + 1, group_start[group_of])
+    smoothed = (csum[idx + 1] - csum[lo]) / (idx + 1 - lo)
+
+    distance = np.power(10.0, (PRESENCE_TX_POWER - smoothed) / (10.0 * PRESENCE_PATH_LOSS_EXPONENT))
+    near = distance <= PRESENCE_MAX_DISTANCE_M
+
+    # Permanencia: tramos entre muestras consecutivas del mismo grupo, ambas cerca y sin un hueco largo
+    dt = np.diff(ts)
+    step = ~new_group[1:] & near[1:] & near[:-1] & (dt <= PRESENCE_MAX_GAP_SECONDS)
+    contrib = np.where(step, dt, 0.0)
+    dwell = np.concatenate(([0.0], np.cumsum(contrib)))
+    dwell -= dwell[group_start][group_of]  # acumulado relativo al inicio del grupo
+
+    reached = np.flatnonzero(dwell >= PRESENCE_MIN_DWELL_SECONDS)
+    if reached.shape[0] == 0:
+        return empty
+    # Primera muestra de cada grupo que completa la permanencia mínima
+    groups, first = np.unique(group_of[reached], return_index=True)
+    hit = reached[first]
+    # Llegada estimada: cuando se completa la permanencia menos la permanencia acumulada
+    arrival = ts[hit] - dwell[hit]
+
+    hit_meeting = meeting[group_start[groups]]
+    pos = np.searchsorted(meeting_ids, hit_meeting)
+    half = meeting_half[pos]
+    end = meeting_end[pos]
+    status = np.where(arrival <= half, STATUS_PRESENT, STATUS_LATE).astype(np.int8)
+    inside = arrival <= end
+    return hit_meeting[inside], user[group_start[groups]][inside], status[inside], arrival[inside]
+
+
+def _materialize_running_occurrences(db: Session, now: datetime) -> None:
+    """Materializa la ocurrencia en curso de cada serie con beacon, así sus invitados tienen fila en
+    attendance y la ocurrencia entra en _active_meetings aunque nadie haya marcado todavía."""
+    series = (
+        db.query(Meeting.id, Meeting.start_time, Meeting.end_time, Meeting.repeat_until)
+        .filter(
+            Meeting.beacon_id.isnot(None),
+            Meeting.repeat_weekly.is_(True),
+            Meeting.series_id.is_(None),
+            Meeting.start_time <= now,
+            Meeting.end_time.isnot(None),
+            or_(Meeting.repeat_until.is_(None), Meeting.repeat_until + (Meeting.end_time - Meeting.start_time) >= now),
+        )
+        .all()
+    )
+    for s in series:
+        # Filtro barato en memoria; materialize_occurrence descarta además las ocurrencias canceladas
+        if recurrence.occurrence_at(s.start_time, s.end_time, s.repeat_until, now) is not None:
+            crud.materialize_occurrence(db, s.id, now)
+
+
+def _active_meetings(db: Session, now: datetime):
+    """Reuniones en curso o recién terminadas (para no perder las últimas muestras)."""
+    lookback = now - timedelta(seconds=2 * PRESENCE_INTERVAL_SECONDS)
+    _materialize_running_occurrences(db, now)
+    return (
+        db.query(Meeting.id, Meeting.start_time, Meeting.end_time)
+        .filter(
+            Meeting.beacon_id.isnot(None),
+            Meeting.start_time <= now,
+            Meeting.end_time >= lookback,
+            # Las series entran por sus ocurrencias materializadas
+            Meeting.repeat_weekly.is_(False),
+        )
+        .order_by(Meeting.id)
+        .all()
+    )
+
+
+def _load_samples(db: Session, meeting_ids: list[int], since: datetime | None = None):
+    """Muestras de las reuniones, salvo las de usuarios que ya están present (no hay nada que mejorar).
+
+    Con `since` solo se cargan los pares (reunión, usuario) que recibieron muestras después de esa hora,
+    pero con todas sus muestras: la permanencia se calcula sobre la historia completa del par.
+    """
+    membership = and_(Attendance.meeting_id == BeaconSighting.meeting_id, Attendance.user_id == BeaconSighting.user_id)
+    stmt = select(
+        BeaconSighting.meeting_id,
+        BeaconSighting.user_id,
+        cast(func.extract("epoch", BeaconSighting.seen_at), Float),
+        BeaconSighting.rssi,
+    )
+    if PRESENCE_INSERT_UNINVITED:
+        stmt = stmt.outerjoin(Attendance, membership).where(
+            BeaconSighting.meeting_id.in_(meeting_ids),
+            or_(Attendance.id.is_(None), Attendance.status != "present"),
+        )
+    else:
+        stmt = stmt.join(Attendance, membership).where(
+            BeaconSighting.meeting_id.in_(meeting_ids),
+            Attendance.status != "present",
+        )
+    if since is not None:
+        recent = (
+            select(BeaconSighting.meeting_id, BeaconSighting.user_id)
+            .where(BeaconSighting.meeting_id.in_(meeting_ids), BeaconSighting.received_at > since)
+            .distinct()
+        )
+        stmt = stmt.where(tuple_(BeaconSighting.meeting_id, BeaconSighting.user_id).in_(recent))
+    rows = db.execute(stmt).all()
+    if not rows:
+        return None
+    data = np.array(rows, dtype=np.float64)
+    return data[:, 0].astype(np.int64), data[:, 1].astype(np.int64), data[:, 2], data[:, 3]
+
+
+def _upsert_decisions(db: Session, meeting, user, status, arrival) -> int:
+    values = [
+        {
+            "user_id": int(u),
+            "meeting_id": int(m),
+            "status": _STATUS_NAMES[int(s)],
+            "marked_at": datetime.fromtimestamp(float(a), tz=timezone.utc),
+        }
+        for m, u, s, a in zip(meeting, user, status, arrival)
+    ]
+    if not values:
+        return 0
+    stmt = pg_insert(Attendance).values(values)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_attendance_user_meeting",
+        set_={"status": stmt.excluded.status, "marked_at": stmt.excluded.marked_at},
+        # Nunca empeorar: absent -> present/late y late -> present, nada más
+        where=or_(
+            Attendance.status == "absent",
+            and_(Attendance.status == "late", stmt.excluded.status == "present"),
+        ),
+    )
+    return db.execute(stmt).rowcount
+
+
+def evaluate_active_meetings() -> int:
+    """Job del scheduler: evalúa las muestras nuevas de las reuniones en curso y registra la asistencia."""
+    global _watermark
+    db: Session = SessionLocal()
+    try:
+        now = datetime.now(timezone.utc)
+        since = _watermark - timedelta(seconds=PRESENCE_WATERMARK_OVERLAP_SECONDS) if _watermark else None
+        meetings = _active_meetings(db, now)
+        samples = _load_samples(db, [m.id for m in meetings], since) if meetings else None
+        updated = 0
+        if samples is not None:
+            meeting_ids = np.array([m.id for m in meetings], dtype=np.int64)
+            starts = np.array([m.start_time.timestamp() for m in meetings], dtype=np.float64)
+            ends = np.array([m.end_time.timestamp() for m in meetings], dtype=np.float64)
+            decisions = decide(*samples, meeting_ids, (starts + ends) / 2, ends)
+            updated = _upsert_decisions(db, *decisions)
+        db.commit()
+        _watermark = now
+        return updated
+    except Exception as e:
+        db.rollback()
+        logger.exception("Error en evaluate_active_meetings: %s", e)
+        return 0
+    finally:
+        db.close()
@@ -0,0 +1,116 @@
+"""
+Series semanales (Meeting.repeat_weekly): se guarda una sola fila con la primera ocurrencia, la regla
+(cada semana hasta repeat_until, o sin fin) y las excepciones en meeting_exceptions. Las ocurrencias se
+expanden bajo demanda, solo dentro del rango pedido, con un generador.
+
+Una ocurrencia se identifica por su hora de inicio original (UTC). Solo se materializa como fila propia
+(Meeting.series_id = serie) cuando alguien marca asistencia en ella.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy.orm import Session
+
+from models import MeetingException
+
+
+CHILE_TZ = ZoneInfo("America/Santiago")
+WEEK = timedelta(weeks=1)
+# Las series sin repeat_until se validan contra solapamientos hasta este horizonte
+RECURRENCE_CHECK_WEEKS = int(os.getenv("RECURRENCE_CHECK_WEEKS", "52"))
+# /meetings/my sin rango expande las series desde ahora hasta este número de semanas
+RECURRENCE_DEFAULT_WEEKS = int(os.getenv("RECURRENCE_DEFAULT_WEEKS", "8"))
+
+
+def _as_utc(dt: datetime) -> datetime:
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def occurrences(
+    start_time: datetime,
+    end_time: datetime,
+    repeat_until: Optional[datetime],
+    range_start: datetime,
+    range_end: datetime,
+    skip: Iterable[datetime] = (),
+) -> Iterator[tuple[datetime, datetime]]:
+    """Genera (inicio, fin) en UTC de las ocurrencias que se cruzan con [range_start, range_end).
+
+    Se avanza de a una semana en hora local de Chile, así la reunión conserva su hora de reloj
+    cuando cambia el horario de verano. `skip` son inicios cancelados (excepciones).
+    """
+    skipped = {_as_utc(s) for s in skip}
+    range_start = _as_utc(range_start)
+    range_end = _as_utc(range_end)
+    until = _as_utc(repeat_until) if repeat_until is not None else None
+    local_start = _as_utc(start_time).astimezone(CHILE_TZ)
+    duration = _as_utc(end_time) - _as_utc(start_time)
+
+    # Saltar directo a la semana anterior al rango (un cambio de hora mueve a lo más una hora)
+    first = max(0, (range_start - duration - _as_utc(start_time)) // WEEK - 1)
+    k = first
+    while True:
+        occ_start = (local_start + k * WEEK).astimezone(timezone.utc)
+        k += 1
+        if occ_start >= range_end or (until is not None and occ_start > until):
+            return
+        occ_end = occ_start + duration
+        if occ_end <= range_start or occ_start in skipped:
+            continue
+        yield occ_start, occ_end
+
+
+def occurrence_at(
+    start_time: datetime,
+    end_time: datetime,
+    repeat_until: Optional[datetime],
+    at: datetime,
+    skip: Iterable[datetime] = (),
+) -> Optional[tuple[datetime, datetime]]:
+    """Ocurrencia en curso en el instante `at` (o None)."""
+    at = _as_utc(at)
+    for occ_start, occ_end in occurrences(start_time, end_time, repeat_until, at, at + timedelta(microseconds=1), skip):
+        if occ_start <= at <= occ_end:
+            return occ_start, occ_end
+    return None
+
+
+def series_end(start_time: datetime, repeat_until: Optional[datetime]) -> datetime:
+    """Hasta dónde se valida una serie: repeat_until o el horizonte RECURRENCE_CHECK_WEEKS."""
+    if repeat_until is not None:
+        return _as_utc(repeat_until) + WEEK
+    return _as_utc(start_time) + RECURRENCE_CHECK_WEEKS * WEEK
+
+
+def overlaps(a: Iterable[tuple[datetime, datetime]], b: Iterable[tuple[datetime, datetime]]) -> bool:
+    """True si algún intervalo [inicio, fin) de `a` se cruza con alguno de `b` (barrido sobre ambos ordenados)."""
+    a = sorted(a)
+    b = sorted(b)
+    i = j = 0
+    while i < len(a) and j < len(b):
+        if a[i][0] < b[j][1] and b[j][0] < a[i][1]:
+            return True
+        if a[i][1] <= b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return False
+
+
+def cancelled_occurrences(db: Session, series_ids: list[int]) -> dict[int, set[datetime]]:
+    """Inicios cancelados (meeting_exceptions) por serie, en UTC."""
+    cancelled: dict[int, set[datetime]] = {}
+    if not series_ids:
+        return cancelled
+    rows = (
+        db.query(MeetingException.series_id, MeetingException.occurrence_start)
+        .filter(MeetingException.series_id.in_(series_ids), MeetingException.cancelled.is_(True))
+        .all()
+    )
+    for series_id, occurrence_start in rows:
+        cancelled.setdefault(series_id, set()).add(_as_utc(occurrence_start))
+    return cancelled
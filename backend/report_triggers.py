@@ -0,0 +1,177 @@
+"""
+Triggers de PostgreSQL que mantienen los reportes al día en la misma transacción que cambia la asistencia.
+Cada INSERT/UPDATE/DELETE en attendance aplica un delta (+1/-1 por estado, más los segundos de permanencia) a:
+  - la fila de meeting_reports de la reunión, si el reporte ya fue generado (el promedio de permanencia
+    se recalcula desde la suma y la cantidad de registros con presencia que guarda la misma fila);
+  - la fila de general_reports del usuario y su contador diario en attendance_daily_counts (para las
+    ventanas de 30/90 días y semestre), si el reporte general del usuario ya fue generado.
+Así leer un reporte es una lectura por clave y nunca queda desactualizado. Se instalan con cada
+create_all (CREATE OR REPLACE / DROP TRIGGER IF EXISTS).
+
+Para no perder deltas mientras se genera un reporte, el trigger toma un advisory lock compartido por
+reunión/usuario y la generación toma el mismo lock en modo exclusivo antes de contar (ver crud.py).
+"""
+from sqlalchemy import DDL, event, func, select
+from sqlalchemy.orm import Session
+
+
+# Clases de los advisory locks de dos enteros (clase, meeting_id) y (clase, user_id)
+MEETING_REPORT_LOCK = 7201
+GENERAL_REPORT_LOCK = 7202
+
+_MEETING_REPORT_DELTA = DDL(f"""
+CREATE OR REPLACE FUNCTION meeting_report_apply_delta(
+    p_meeting_id integer, p_status text, p_sign integer, p_seconds integer, p_with_seconds integer
+)
+RETURNS void AS $$
+DECLARE
+    d_present integer := CASE WHEN p_status = 'present' THEN p_sign ELSE 0 END;
+    d_late integer := CASE WHEN p_status = 'late' THEN p_sign ELSE 0 END;
+    d_absent integer := CASE WHEN p_status = 'absent' THEN p_sign ELSE 0 END;
+BEGIN
+    PERFORM pg_advisory_xact_lock_shared({MEETING_REPORT_LOCK}, p_meeting_id);
+    -- asistentes_totales cuenta solo present, igual que crud._build_meeting_report
+    UPDATE meeting_reports SET
+        invitados_totales = invitados_totales + p_sign,
+        asistentes_totales = asistentes_totales + d_present,
+        llegadas_tarde = llegadas_tarde + d_late,
+        ausentes = ausentes + d_absent,
+        porcentaje_asistencias = CASE WHEN invitados_totales + p_sign > 0
+            THEN (asistentes_totales + d_present) * 100.0 / (invitados_totales + p_sign) ELSE 0 END,
+        porcentaje_ausencias = CASE WHEN invitados_totales + p_sign > 0
+            THEN (ausentes + d_absent) * 100.0 / (invitados_totales + p_sign) ELSE 0 END,
+        porcentaje_tarde = CASE WHEN invitados_totales + p_sign > 0
+            THEN (llegadas_tarde + d_late) * 100.0 / (invitados_totales + p_sign) ELSE 0 END,
+        segundos_presencia_total = segundos_presencia_total + p_seconds,
+        registros_presencia = registros_presencia + p_with_seconds,
+        -- Mismo redondeo que crud._build_meeting_report
+        minutos_presencia_promedio = CASE WHEN registros_presencia + p_with_seconds > 0
+            THEN round((segundos_presencia_total + p_seconds)::numeric
+                / (registros_presencia + p_with_seconds) / 60, 1) ELSE NULL END
+    WHERE meeting_id = p_meeting_id;
+END;
+$$ LANGUAGE plpgsql;
+""")
+
+# El día de un registro es el de inicio de la reunión en hora de Chile. Al borrar una reunión sus
+# asistencias se borran antes que ella (meetings_delete_attendance), así el día todavía se puede leer;
+# marked_at queda solo como respaldo.
+_GENERAL_REPORT_DELTA = DDL(f"""
+CREATE OR REPLACE FUNCTION general_report_apply_delta(
+    p_user_id integer, p_meeting_id integer, p_status text, p_sign integer, p_seconds integer,
+    p_marked_at timestamptz
+)
+RETURNS void AS $$
+DECLARE
+    d_present integer := CASE WHEN p_status = 'present' THEN p_sign ELSE 0 END;
+    d_late integer := CASE WHEN p_status = 'late' THEN p_sign ELSE 0 END;
+    d_absent integer := CASE WHEN p_status = 'absent' THEN p_sign ELSE 0 END;
+    v_day date;
+BEGIN
+    PERFORM pg_advisory_xact_lock_shared({GENERAL_REPORT_LOCK}, p_user_id);
+    UPDATE general_reports SET
+        cantidad_reuniones = cantidad_reuniones + p_sign,
+        cantidad_asistencias = cantidad_asistencias + d_present,
+        cantidad_atrasados = cantidad_atrasados + d_late,
+        cantidad_ausencias = cantidad_ausencias + d_absent,
+        segundos_presencia = segundos_presencia + p_seconds,
+        porcentaje_asistencias = CASE WHEN cantidad_reuniones + p_sign > 0
+            THEN (cantidad_asistencias + d_present) * 100.0 / (cantidad_reuniones + p_sign) ELSE 0 END,
+        porcentaje_ausencias = CASE WHEN cantidad_reuniones + p_sign > 0
+            THEN (cantidad_ausencias + d_absent) * 100.0 / (cantidad_reuniones + p_sign) ELSE 0 END
+    WHERE user_id = p_user_id;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    SELECT (COALESCE(start_time, created_at) AT TIME ZONE 'America/Santiago')::date INTO v_day
+    FROM meetings WHERE id = p_meeting_id;
+    IF v_day IS NULL THEN
+        v_day := (p_marked_at AT TIME ZONE 'America/Santiago')::date;
+    END IF;
+    INSERT INTO attendance_daily_counts AS c (user_id, day, total, present, late, absent, seconds_present)
+    VALUES (p_user_id, v_day, p_sign, d_present, d_late, d_absent, p_seconds)
+    ON CONFLICT (user_id, day) DO UPDATE SET
+        total = c.total + EXCLUDED.total,
+        present = c.present + EXCLUDED.present,
+        late = c.late + EXCLUDED.late,
+        absent = c.absent + EXCLUDED.absent,
+        seconds_present = c.seconds_present + EXCLUDED.seconds_present;
+END;
+$$ LANGUAGE plpgsql;
+""")
+
+_ATTENDANCE_REPORTS_TRIGGER = DDL("""
+CREATE OR REPLACE FUNCTION attendance_reports_trigger()
+RETURNS trigger AS $$
+DECLARE
+    counts_changed boolean := TG_OP <> 'UPDATE'
+        OR OLD.status IS DISTINCT FROM NEW.status
+        OR OLD.meeting_id <> NEW.meeting_id
+        OR OLD.user_id <> NEW.user_id;
+BEGIN
+    IF counts_changed THEN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM meeting_report_apply_delta(
+                OLD.meeting_id, OLD.status, -1, -OLD.seconds_present, -(OLD.seconds_present > 0)::integer);
+            PERFORM general_report_apply_delta(
+                OLD.user_id, OLD.meeting_id, OLD.status, -1, -OLD.seconds_present, OLD.marked_at);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM meeting_report_apply_delta(
+                NEW.meeting_id, NEW.status, 1, NEW.seconds_present, (NEW.seconds_present > 0)::integer);
+            PERFORM general_report_apply_delta(
+                NEW.user_id, NEW.meeting_id, NEW.status, 1, NEW.seconds_present, NEW.marked_at);
+        END IF;
+    ELSIF OLD.seconds_present IS DISTINCT FROM NEW.seconds_present THEN
+        -- Solo cambió la permanencia (heartbeat/avistamientos): los conteos no se tocan
+        PERFORM meeting_report_apply_delta(
+            NEW.meeting_id, NEW.status, 0, NEW.seconds_present - OLD.seconds_present,
+            (NEW.seconds_present > 0)::integer - (OLD.seconds_present > 0)::integer);
+        PERFORM general_report_apply_delta(
+            NEW.user_id, NEW.meeting_id, NEW.status, 0, NEW.seconds_present - OLD.seconds_present, NEW.marked_at);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS attendance_reports ON attendance;
+CREATE TRIGGER attendance_reports
+    AFTER INSERT OR DELETE OR UPDATE OF status, meeting_id, user_id, seconds_present ON attendance
+    FOR EACH ROW EXECUTE FUNCTION attendance_reports_trigger();
+""")
+
+# El ON DELETE CASCADE de attendance corre después de borrar la fila de meetings, cuando el trigger ya no
+# puede leer el día de la reunión y descontaría del día equivocado. Borrando las asistencias antes, en un
+# BEFORE DELETE, cada delta se aplica con la reunión todavía visible (y la cascada no encuentra nada).
+_MEETINGS_DELETE_TRIGGER = DDL("""
+CREATE OR REPLACE FUNCTION meetings_delete_attendance()
+RETURNS trigger AS $$
+BEGIN
+    DELETE FROM attendance WHERE meeting_id = OLD.id;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS meetings_delete_attendance ON meetings;
+CREATE TRIGGER meetings_delete_attendance
+    BEFORE DELETE ON meetings
+    FOR EACH ROW EXECUTE FUNCTION meetings_delete_attendance();
+""")
+
+
+def register(metadata):
+    """Instala las funciones y los triggers después de cada create_all (solo en PostgreSQL)."""
+    for ddl in (_MEETING_REPORT_DELTA, _GENERAL_REPORT_DELTA, _ATTENDANCE_REPORTS_TRIGGER, _MEETINGS_DELETE_TRIGGER):
+        event.listen(metadata, "after_create", ddl.execute_if(dialect="postgresql"))
+
+
+def lock_meeting_report(db: Session, meeting_id: int) -> None:
+    """Espera a que terminen las transacciones que están cambiando la asistencia de la reunión y bloquea
+    nuevas hasta el commit, para que el conteo inicial y los deltas del trigger no se crucen."""
+    db.execute(select(func.pg_advisory_xact_lock(MEETING_REPORT_LOCK, meeting_id)))
+
+
+def lock_general_report(db: Session, user_id: int) -> None:
+    """Igual que lock_meeting_report, para el reporte general de un usuario."""
+    db.execute(select(func.pg_advisory_xact_lock(GENERAL_REPORT_LOCK, user_id)))
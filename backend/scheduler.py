@@ -1,110 +1,242 @@
 """
 Scheduler para enviar notificaciones de reuniones próximas.
-Revisa periódicamente reuniones que comenzarán pronto y notifica a los participantes.
+Mantiene en memoria un heap (cola de prioridad) con la hora exacta de cada recordatorio;
+un hilo dedicado duerme hasta el próximo vencimiento en vez de escanear la tabla periódicamente.
+Al vencer, el recordatorio se registra en el outbox persistente (notification_outbox.py), que evita
+duplicados entre reinicios y entre workers.
 """
+import heapq
+import os
+import threading
 from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import datetime, timezone, timedelta
 from zoneinfo import ZoneInfo
 from sqlalchemy.orm import Session
 from db import SessionLocal
-from models import Meeting, Attendance, User
-import notification_service
+from models import Meeting
+import notification_outbox
+import recurrence
+import beacon_index
+import presence
+import log
+
+logger = log.get_logger(__name__)
 
 
 CHILE_TZ = ZoneInfo("America/Santiago")
 NOTIFICATION_MINUTES_BEFORE = 30  # Notificar 30 minutos antes
+# Tolerancia: un recordatorio vencido hace menos de esto todavía se envía (p. ej. tras un reinicio)
+REMINDER_GRACE = timedelta(minutes=1)
+# Cada cuánto se recarga desde la BD el tramo próximo (reuniones creadas por otros procesos)
+REMINDER_RESYNC_MINUTES = int(os.getenv("REMINDER_RESYNC_MINUTES", "10"))
+REMINDER_HORIZON_HOURS = int(os.getenv("REMINDER_HORIZON_HOURS", "24"))
+# Cada cuánto se reintentan las filas del outbox que quedaron pendientes
+OUTBOX_POLL_SECONDS = int(os.getenv("OUTBOX_POLL_SECONDS", "60"))
+
+
+def _as_utc(dt: datetime) -> datetime:
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
 
-# Cache para evitar enviar notificaciones duplicadas
-_notified_meetings = set()  # IDs de reuniones ya notificadas
 
+class ReminderQueue:
+    """Min-heap de (hora_de_envío, meeting_id) atendido por un hilo que duerme hasta el siguiente.
 
-def check_and_notify_upcoming_meetings():
+    Reprogramar o cancelar no busca dentro del heap: `_pending` guarda la hora vigente de cada
+    reunión y las entradas que ya no coinciden se descartan al llegar al tope (borrado perezoso).
     """
-    Revisa reuniones que están por comenzar y envía notificaciones a los participantes.
-    Se ejecuta cada minuto.
+
+    def __init__(self, on_due):
+        self._on_due = on_due
+        self._heap: list[tuple[datetime, int]] = []
+        self._pending: dict[int, datetime] = {}
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._stopped = False
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def schedule(self, meeting_id: int, fire_at: datetime):
+        with self._cond:
+            if self._pending.get(meeting_id) == fire_at:
+                return
+            self._pending[meeting_id] = fire_at
+            heapq.heappush(self._heap, (fire_at, meeting_id))
+            # Despertar al hilo por si este recordatorio es ahora el más próximo
+            self._cond.notify()
+
+    def cancel(self, meeting_id: int):
+        with self._cond:
+            self._pending.pop(meeting_id, None)
+
+    def start(self):
+        if self.running:
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="reminder-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _pop_due(self) -> list[int] | None:
+        """Espera hasta que venza al menos un recordatorio y devuelve todos los vencidos."""
+        with self._cond:
+            while not self._stopped:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                fire_at, meeting_id = self._heap[0]
+                if self._pending.get(meeting_id) != fire_at:
+                    heapq.heappop(self._heap)  # entrada obsoleta (reprogramada o cancelada)
+                    continue
+                delay = (fire_at - datetime.now(timezone.utc)).total_seconds()
+                if delay > 0:
+                    self._cond.wait(timeout=delay)
+                    continue
+                now = datetime.now(timezone.utc)
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    fire_at, meeting_id = heapq.heappop(self._heap)
+                    if self._pending.get(meeting_id) == fire_at:
+                        del self._pending[meeting_id]
+                        due.append(meeting_id)
+                return due
+            return None
+
+    def _run(self):
+        while True:
+            due = self._pop_due()
+            if due is None:
+                return
+            if due:
+                try:
+                    self._on_due(due)
+                except Exception as e:
+                    logger.exception("Error enviando recordatorios %s: %s", due, e)
+
+
+def _reminder_time(start_time: datetime) -> datetime:
+    return _as_utc(start_time) - timedelta(minutes=NOTIFICATION_MINUTES_BEFORE)
+
+
+def _next_start(row, cancelled: dict[int, set[datetime]], after: datetime) -> datetime | None:
+    """Inicio de la reunión, o de la próxima ocurrencia de la serie que empieza desde `after`."""
+    if row.start_time is None:
+        return None
+    if not row.repeat_weekly or row.end_time is None:
+        return _as_utc(row.start_time)
+    for occ_start, _ in recurrence.occurrences(
+        row.start_time, row.end_time, row.repeat_until, after, after + timedelta(weeks=8), cancelled.get(row.id, ())
+    ):
+        if occ_start >= after:
+            return occ_start
+    return None
+
+
+def _send_meeting_reminders(meeting_ids: list[int]):
+    """Registra en el outbox los recordatorios vencidos y despacha los pendientes."""
+    db: Session = SessionLocal()
+    try:
+        now = datetime.now(timezone.utc)
+        rows = (
+            db.query(Meeting.id, Meeting.start_time, Meeting.end_time, Meeting.repeat_weekly, Meeting.repeat_until)
+            .filter(Meeting.id.in_(meeting_ids))
+            .all()
+        )
+        cancelled = recurrence.cancelled_occurrences(db, [r.id for r in rows if r.repeat_weekly])
+        due = []
+        for row in rows:
+            # La reunión pudo moverse o borrarse desde que se programó (p. ej. desde otro proceso)
+            start = _next_start(row, cancelled, now + timedelta(minutes=NOTIFICATION_MINUTES_BEFORE) - REMINDER_GRACE)
+            if start is not None and _reminder_time(start) <= now + REMINDER_GRACE:
+                due.append((row.id, start, _reminder_time(start)))
+        notification_outbox.enqueue(
+            db, due, kind=notification_outbox.KIND_MEETING_STARTING, offset_minutes=NOTIFICATION_MINUTES_BEFORE
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.exception("Error en _send_meeting_reminders: %s", e)
+    finally:
+        db.close()
+    notification_outbox.dispatch_pending()
+
+
+_reminders = ReminderQueue(on_due=_send_meeting_reminders)
+
+
+def schedule_meeting(meeting_id: int, start_time: datetime | None):
+    """Programa (o reprograma) el recordatorio de una reunión; llamar al crear o mover su inicio."""
+    if not _reminders.running:
+        return
+    if start_time is None:
+        _reminders.cancel(meeting_id)
+        return
+    fire_at = _reminder_time(start_time)
+    if fire_at < datetime.now(timezone.utc) - REMINDER_GRACE:
+        _reminders.cancel(meeting_id)
+        return
+    _reminders.schedule(meeting_id, fire_at)
+
+
+def cancel_meeting(meeting_id: int):
+    """Quita el recordatorio pendiente de una reunión (p. ej. al eliminarla)."""
+    _reminders.cancel(meeting_id)
+
+
+def load_upcoming_meetings():
+    """Carga en el heap las reuniones cuyo recordatorio cae entre ahora y el horizonte.
+
+    Las reuniones simples salen de un range scan sobre meetings.start_time (índice ix_meetings_start_time_id);
+    las series semanales vigentes se expanden para encontrar su próxima ocurrencia dentro del horizonte.
     """
     db: Session = SessionLocal()
     try:
         now = datetime.now(timezone.utc)
-        notification_window_start = now + timedelta(minutes=NOTIFICATION_MINUTES_BEFORE - 1)
-        notification_window_end = now + timedelta(minutes=NOTIFICATION_MINUTES_BEFORE + 1)
-        
-        print(f"\n{'='*60}", flush=True)
-        print(f"SCHEDULER EJECUTANDOSE - {now}", flush=True)
-        print(f"Buscando reuniones entre:", flush=True)
-        print(f"   Inicio: {notification_window_start}", flush=True)
-        print(f"   Fin: {notification_window_end}", flush=True)
-        
-        # Ver TODAS las reuniones futuras para debugging
-        all_future_meetings = db.query(Meeting).filter(Meeting.start_time > now).all()
-        print(f"Total reuniones futuras en BD: {len(all_future_meetings)}", flush=True)
-        for m in all_future_meetings:
-            print(f"   - '{m.title}' inicia en: {m.start_time} (ID: {m.id})", flush=True)
-        
-        # Buscar reuniones que iniciarán
-        upcoming_meetings = db.query(Meeting).filter(
-            Meeting.start_time >= notification_window_start,
-            Meeting.start_time < notification_window_end
-        ).all()
-        
-        print(f"Reuniones en ventana de notificacion: {len(upcoming_meetings)}", flush=True)
-        print(f"{'='*60}\n", flush=True)
-        
-        for meeting in upcoming_meetings:
-            print(f"Procesando reunion: '{meeting.title}' (ID: {meeting.id})", flush=True)
-            
-            # Verificar si ya se notificó esta reunión
-            if meeting.id in _notified_meetings:
-                print(f"   Reunion ya notificada anteriormente, saltando", flush=True)
-                continue
-            
-            # Obtener todos los participantes (asistencias registradas)
-            attendances = db.query(Attendance).filter(
-                Attendance.meeting_id == meeting.id
-            ).all()
-            
-            print(f"   Participantes registrados: {len(attendances)}", flush=True)
-            
-            if not attendances:
-                print(f"   Sin participantes, saltando", flush=True)
-                continue
-            
-            # Obtener player_ids de los usuarios que tienen dispositivo registrado
-            user_ids = [att.user_id for att in attendances]
-            print(f"   User IDs: {user_ids}", flush=True)
-            
-            users = db.query(User).filter(
-                User.id.in_(user_ids),
-                User.onesignal_player_id.isnot(None)
-            ).all()
-            
-            print(f"   Usuarios con dispositivo: {len(users)}", flush=True)
-            
-            player_ids = [user.onesignal_player_id for user in users if user.onesignal_player_id]
-            
-            if player_ids:
-                print(f"Enviando notificacion para reunion '{meeting.title}' a {len(player_ids)} usuarios", flush=True)
-                print(f"   Player IDs: {player_ids}", flush=True)
-                result = notification_service.notify_meeting_starting(
-                    player_ids=player_ids,
-                    meeting_title=meeting.title,
-                    minutes_before=NOTIFICATION_MINUTES_BEFORE
-                )
-                print(f"   Resultado: {result}", flush=True)
-                
-                # Marcar como notificada para evitar spam
-                _notified_meetings.add(meeting.id)
-                print(f"   Reunion marcada como notificada", flush=True)
-            else:
-                print(f"No hay dispositivos registrados para la reunion '{meeting.title}'", flush=True)
-        
-        # Limpiar reuniones pasadas del cache (para liberar memoria)
-        past_meetings = db.query(Meeting).filter(Meeting.end_time < now).all()
-        for m in past_meetings:
-            _notified_meetings.discard(m.id)
-    
+        window_start = now + timedelta(minutes=NOTIFICATION_MINUTES_BEFORE) - REMINDER_GRACE
+        window_end = now + timedelta(hours=REMINDER_HORIZON_HOURS)
+        rows = (
+            db.query(Meeting.id, Meeting.start_time)
+            .filter(
+                Meeting.repeat_weekly.is_(False),
+                Meeting.start_time >= window_start,
+                Meeting.start_time < window_end,
+            )
+            .all()
+        )
+        for meeting_id, start_time in rows:
+            _reminders.schedule(meeting_id, _reminder_time(start_time))
+
+        series = (
+            db.query(Meeting.id, Meeting.start_time, Meeting.end_time, Meeting.repeat_weekly, Meeting.repeat_until)
+            .filter(
+                Meeting.repeat_weekly.is_(True),
+                Meeting.start_time < window_end,
+                Meeting.end_time.isnot(None),
+                (Meeting.repeat_until.is_(None)) | (Meeting.repeat_until >= window_start),
+            )
+            .all()
+        )
+        cancelled = recurrence.cancelled_occurrences(db, [row.id for row in series])
+        for row in series:
+            start = _next_start(row, cancelled, window_start)
+            if start is not None and start < window_end:
+                _reminders.schedule(row.id, _reminder_time(start))
+        logger.debug("Recordatorios programados: %s", len(_reminders))
     except Exception as e:
-        print(f"Error en check_and_notify_upcoming_meetings: {e}", flush=True)
+        logger.exception("Error en load_upcoming_meetings: %s", e)
     finally:
         db.close()
 
@@ -114,30 +246,54 @@ scheduler = BackgroundScheduler()
 
 
 def start_scheduler():
-    """Inicia el scheduler que revisa reuniones cada minuto."""
-    print("start_scheduler() llamado", flush=True)
+    """Inicia la cola de recordatorios y la recarga periódica del horizonte."""
+    logger.debug("start_scheduler() llamado")
     if not scheduler.running:
-        print("Scheduler no esta corriendo, iniciandolo", flush=True)
-        # Ejecutar cada minuto
+        _reminders.start()
+        load_upcoming_meetings()
+        scheduler.add_job(
+            load_upcoming_meetings,
+            'interval',
+            minutes=REMINDER_RESYNC_MINUTES,
+            id='load_upcoming_meetings',
+            replace_existing=True
+        )
+        beacon_index.reload()
         scheduler.add_job(
-            check_and_notify_upcoming_meetings,
+            beacon_index.reload,
             'interval',
-            seconds=30,
-            id='check_meetings',
+            seconds=beacon_index.BEACON_INDEX_REFRESH_SECONDS,
+            id='reload_beacon_index',
+            replace_existing=True
+        )
+        if presence.PRESENCE_ENABLED:
+            scheduler.add_job(
+                presence.evaluate_active_meetings,
+                'interval',
+                seconds=presence.PRESENCE_INTERVAL_SECONDS,
+                id='evaluate_presence',
+                replace_existing=True
+            )
+        scheduler.add_job(
+            notification_outbox.dispatch_pending,
+            'interval',
+            seconds=OUTBOX_POLL_SECONDS,
+            id='dispatch_outbox',
             replace_existing=True
         )
         scheduler.start()
-        print(f"Scheduler de notificaciones iniciado (revisa cada 30 segundos, notifica {NOTIFICATION_MINUTES_BEFORE} minutos antes)", flush=True)
-        
-        # Ejecutar inmediatamente la primera vez para testing
-        print("Ejecutando primera verificacion inmediatamente", flush=True)
-        check_and_notify_upcoming_meetings()
+        logger.info(
+            "Scheduler de notificaciones iniciado (notifica %s minutos antes, recarga cada %s minutos)",
+            NOTIFICATION_MINUTES_BEFORE,
+            REMINDER_RESYNC_MINUTES,
+        )
     else:
-        print("Scheduler ya esta corriendo", flush=True)
+        logger.info("Scheduler ya esta corriendo")
 
 
 def stop_scheduler():
     """Detiene el scheduler."""
     if scheduler.running:
         scheduler.shutdown()
-        print("Scheduler detenido", flush=True)
+        logger.info("Scheduler detenido")
+    _reminders.stop()
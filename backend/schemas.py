@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional, Tuple
 
 
 
@@ -37,6 +37,8 @@ class MeetingBase(BaseModel):
     # end_time is computed server-side for create; included in Meeting response only
     topics: Optional[str] = None
     repeat_weekly: Optional[bool] = False
+    # Última fecha de inicio de la serie semanal (null = sin fin); solo aplica si repeat_weekly
+    repeat_until: Optional[datetime] = None
     note: Optional[str] = None
     location: Optional[str] = None
     beacon_id: Optional[str] = None
@@ -55,6 +57,9 @@ class Meeting(MeetingBase):
     created_at: datetime
     end_time: Optional[datetime] = None
     coordinator_id: Optional[int] = None
+    # Ocurrencia de una serie semanal (expandida o materializada): id de la serie e inicio original
+    series_id: Optional[int] = None
+    occurrence_start: Optional[datetime] = None
 
     model_config = {"from_attributes": True}
 
@@ -72,13 +77,31 @@ class MeetingDetail(MeetingBase):
     model_config = {"from_attributes": True}
 
 
+# Ventana del reporte general: todo el historial, últimos 30/90 días o semestre académico actual
+ReportWindow = Literal["all", "30d", "90d", "semester"]
+
+
 class GeneralReport(BaseModel):
     cantidad_asistencias: int
     cantidad_reuniones: int
     cantidad_atrasados: int
+    cantidad_ausencias: int = 0
     porcentaje_asistencias: float
     porcentaje_ausencias: float
     porcentaje_atrasados: float
+    minutos_presencia_total: float = 0.0
+    window: ReportWindow = "all"
+
+
+class GeneralReportBatch(BaseModel):
+    """Payload to compute general reports for many users at once."""
+    user_ids: List[int]
+    window: ReportWindow = "all"
+
+
+class UserGeneralReport(GeneralReport):
+    """General report of one user in a batch response."""
+    user_id: int
 
 
 # ========= Attendance =========
@@ -100,6 +123,27 @@ class AttendanceAssign(BaseModel):
     status: Optional[str] = "absent"
 
 
+class AttendanceBulkInvite(BaseModel):
+    """Payload to invite many users (by id and/or email) to a meeting in one request."""
+    meeting_id: int
+    user_ids: List[int] = []
+    emails: List[str] = []
+    status: Optional[str] = "absent"
+
+
+class AttendanceBulkItem(BaseModel):
+    """Per-user outcome of a bulk invite: invited | updated | not_found."""
+    user_id: Optional[int] = None
+    email: Optional[str] = None
+    result: str
+
+
+class AttendanceBulkResult(BaseModel):
+    """Response of the bulk invite endpoint."""
+    meeting_id: int
+    results: List[AttendanceBulkItem]
+
+
 class Attendance(BaseModel):
     """Attendance record returned by the API."""
     id: int
@@ -107,10 +151,23 @@ class Attendance(BaseModel):
     meeting_id: int
     status: str
     marked_at: datetime
+    minutes_present: float = 0.0
     
     model_config = {"from_attributes": True}
 
 
+class AttendanceHeartbeat(BaseModel):
+    """Periodic ping from the app while the user is inside the meeting."""
+    meeting_id: int
+
+
+class AttendancePresence(BaseModel):
+    """Presence runs of the user in a meeting, as [enter, exit) seconds from the meeting start."""
+    meeting_id: int
+    minutes_present: float
+    runs: List[Tuple[int, int]]
+
+
 class AttendanceWithUser(Attendance):
     """Attendance record including the user's name to simplify frontend lookups."""
     user_name: str
@@ -148,7 +205,42 @@ class Beacon(BeaconBase):
     model_config = {"from_attributes": True}
 
 
+class BeaconResolution(BaseModel):
+    """Meeting currently active (or next) at the beacon identified by major/minor."""
+    beacon_id: str
+    active: bool = False
+    meeting_id: Optional[int] = None
+    title: Optional[str] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+
+
+# ========= Sightings =========
+class SightingGroup(BaseModel):
+    """Samples of one beacon, identified by id or by major/minor; each sample is (rssi, unix_ts)."""
+    beacon_id: Optional[str] = None
+    major: Optional[int] = None
+    minor: Optional[int] = None
+    samples: List[Tuple[int, float]]
+
+
+class SightingBatch(BaseModel):
+    """Compact batch of beacon sightings uploaded by the app."""
+    groups: List[SightingGroup]
+
+
+class SightingIngestResult(BaseModel):
+    """How many samples were stored and how many were dropped (unknown beacon, bad timestamp or rssi)."""
+    accepted: int
+    dropped: int
+
+
 # ========= Meeting Report =========
+class MeetingReportBatch(BaseModel):
+    """Payload to generate (or fetch) the reports of many meetings at once."""
+    meeting_ids: List[int]
+
+
 class MeetingReport(BaseModel):
     """Reporte de una reunión específica."""
     id: int
@@ -162,6 +254,7 @@ class MeetingReport(BaseModel):
     porcentaje_asistencias: float
     porcentaje_ausencias: float
     porcentaje_tarde: float
+    minutos_presencia_promedio: float | None = None
 
     # Campos marcados con * (definidos pero sin lógica todavía)
     cantidad_asistencias: int | None = None
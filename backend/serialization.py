@@ -0,0 +1,84 @@
+"""
+Serialización JSON rápida y compresión de respuestas.
+  - ORJSONResponse es la clase de respuesta por defecto de la app (orjson en vez del json de la stdlib).
+  - Las listas grandes y de confianza (/meetings, /users, /attendance/meeting/{id}) no pasan por Pydantic:
+    crud entrega solo las columnas del schema (dicts o registros) y se codifican de una vez a bytes.
+    El response_model del endpoint se mantiene para la documentación OpenAPI.
+  - Las respuestas de más de COMPRESS_MIN_BYTES se comprimen con gzip si el cliente lo acepta.
+  - Las reuniones se leen como registros de solo lectura (crud.MeetingRecord) con horarios en UTC; la hora
+    de Chile se aplica aquí, al armar la respuesta, para toda la lista de una vez.
+El efecto de cada paso se mide con bench_serialization.py.
+"""
+import os
+from datetime import datetime, timezone
+from typing import Any, Iterable
+from zoneinfo import ZoneInfo
+
+import orjson
+from fastapi import FastAPI, Response
+from fastapi.middleware.gzip import GZipMiddleware
+
+import schemas
+
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "5"))
+# Mismo formato que Pydantic: las fechas UTC se escriben con "Z"
+ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+CHILE_TZ = ZoneInfo("America/Santiago")
+# Campos de las reuniones que se muestran en hora de Chile
+CHILE_FIELDS = ("start_time", "end_time", "created_at", "occurrence_start")
+# Campos de cada respuesta, en el orden de los schemas
+MEETING_FIELDS = tuple(schemas.Meeting.model_fields)
+MEETING_DETAIL_FIELDS = tuple(f for f in schemas.MeetingDetail.model_fields if f != "coordinator")
+USER_FIELDS = tuple(schemas.User.model_fields)
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+def json_response(content: Any, response: Response | None = None) -> Response:
+    """Respuesta JSON ya codificada. Copia los headers puestos en `response` (p. ej. X-Next-Cursor, ETag),
+    que FastAPI no agrega cuando el endpoint devuelve su propia Response."""
+    headers = dict(response.headers) if response is not None else None
+    return Response(content=dumps(content), media_type="application/json", headers=headers)
+
+
+def to_chile(dt: datetime | None) -> datetime | None:
+    """Hora de America/Santiago de una fecha guardada (naive se interpreta como UTC)."""
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(CHILE_TZ)
+
+
+def meeting_dict(meeting, fields: Iterable[str] = MEETING_FIELDS) -> dict:
+    """Campos de respuesta de una reunión (registro u objeto ORM, sin modificarlo) con horarios de Chile."""
+    data = {field: getattr(meeting, field, None) for field in fields}
+    for field in CHILE_FIELDS:
+        if field in data:
+            data[field] = to_chile(data[field])
+    return data
+
+
+def meetings_response(meetings: Iterable, response: Response | None = None) -> Response:
+    return json_response([meeting_dict(m) for m in meetings], response)
+
+
+def meeting_response(meeting, response: Response | None = None) -> Response:
+    return json_response(meeting_dict(meeting), response)
+
+
+def meeting_detail_response(meeting, response: Response | None = None) -> Response:
+    data = meeting_dict(meeting, MEETING_DETAIL_FIELDS)
+    coordinator = getattr(meeting, "coordinator", None)
+    data["coordinator"] = {f: getattr(coordinator, f) for f in USER_FIELDS} if coordinator is not None else None
+    return json_response(data, response)
+
+
+def add_compression(app: FastAPI) -> None:
+    """Comprime las respuestas grandes; los clientes sin Accept-Encoding las reciben sin comprimir."""
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_BYTES, compresslevel=min(COMPRESS_LEVEL, 9))
@@ -0,0 +1,120 @@
+"""
+Ingesta en lote de avistamientos de beacons (POST /sightings).
+El app sube cada pocos segundos las muestras (rssi, timestamp) que vio de cada beacon. Se resuelven a
+beacon y reunión con el índice en memoria (beacon_index.py) y se cargan en beacon_sightings con un solo
+COPY por request, sin crear objetos ORM por muestra. Si el driver no es psycopg2 se usa un INSERT de
+varias filas.
+"""
+import io
+import os
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from models import BeaconSighting
+import beacon_index
+import crud
+import intervals
+import presence
+import schemas
+
+
+SIGHTINGS_USE_COPY = os.getenv("SIGHTINGS_USE_COPY", "true").lower() in ("1", "true", "yes")
+SIGHTINGS_MAX_SAMPLES = int(os.getenv("SIGHTINGS_MAX_SAMPLES", "20000"))
+# Muestras más viejas que esto (p. ej. un lote que quedó sin subir) o con hora futura se descartan
+SIGHTINGS_MAX_AGE_SECONDS = int(os.getenv("SIGHTINGS_MAX_AGE_SECONDS", "3600"))
+SIGHTINGS_MAX_SKEW_SECONDS = int(os.getenv("SIGHTINGS_MAX_SKEW_SECONDS", "60"))
+# Rango válido de RSSI en dBm (beacon_sightings.rssi es smallint); fuera de él la muestra se descarta
+RSSI_MIN = -128
+RSSI_MAX = 20
+
+_COPY_SQL = "COPY beacon_sightings (user_id, beacon_id, meeting_id, rssi, seen_at) FROM STDIN"
+_COPY_NULL = "\\N"
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def count_samples(batch: schemas.SightingBatch) -> int:
+    return sum(len(group.samples) for group in batch.groups)
+
+
+def _resolve_rows(db: Session, user_id: int, batch: schemas.SightingBatch) -> tuple[list[tuple], int]:
+    """Convierte el lote en filas (user_id, beacon_id, meeting_id, rssi, seen_at); devuelve (filas, descartadas).
+
+    Las muestras de una ocurrencia no materializada de una serie la materializan (sin commit), para
+    guardarlas con el id de su fila igual que las de una reunión simple.
+    """
+    beacon_index.ensure_loaded()
+    now = time.time()
+    oldest = now - SIGHTINGS_MAX_AGE_SECONDS
+    newest = now + SIGHTINGS_MAX_SKEW_SECONDS
+    rows = []
+    dropped = 0
+    # (serie, inicio de la ocurrencia) -> id de la fila materializada
+    occurrences: dict[tuple[int, datetime], int | None] = {}
+    for group in batch.groups:
+        beacon_id = beacon_index.index.beacon_id_for(group.beacon_id, group.major, group.minor)
+        if beacon_id is None:
+            dropped += len(group.samples)
+            continue
+        starts, intervals = beacon_index.index.snapshot(beacon_id)
+        for rssi, ts in group.samples:
+            if not oldest <= ts <= newest or not RSSI_MIN <= rssi <= RSSI_MAX:
+                dropped += 1
+                continue
+            seen_at = datetime.fromtimestamp(ts, tz=timezone.utc)
+            # La reunión se resuelve por la hora de la muestra: el índice conserva las reuniones que
+            # terminaron hace menos de BEACON_INDEX_RETENTION_SECONDS para los lotes que llegan tarde
+            interval = beacon_index.interval_at(starts, intervals, seen_at) if intervals else None
+            meeting_id = interval.meeting_id if interval is not None else None
+            if interval is not None and interval.series:
+                key = (interval.meeting_id, interval.start_time)
+                if key not in occurrences:
+                    occurrences[key] = crud.materialize_occurrence(db, interval.meeting_id, interval.start_time)
+                meeting_id = occurrences[key]
+            rows.append((user_id, beacon_id, meeting_id, rssi, seen_at))
+    return rows, dropped
+
+
+def _copy_rows(db: Session, rows: list[tuple]) -> None:
+    buf = io.StringIO()
+    write = buf.write
+    for user_id, beacon_id, meeting_id, rssi, seen_at in rows:
+        write(
+            f"{user_id}\t{beacon_id.translate(_COPY_ESCAPES)}\t"
+            f"{_COPY_NULL if meeting_id is None else meeting_id}\t{rssi}\t{seen_at.isoformat()}\n"
+        )
+    buf.seek(0)
+    # La conexión es la de la sesión: el COPY queda dentro de su transacción
+    raw = db.connection().connection.dbapi_connection
+    with raw.cursor() as cursor:
+        cursor.copy_expert(_COPY_SQL, buf)
+
+
+def _insert_rows(db: Session, rows: list[tuple]) -> None:
+    db.execute(
+        insert(BeaconSighting),
+        [
+            {"user_id": u, "beacon_id": b, "meeting_id": m, "rssi": r, "seen_at": s}
+            for u, b, m, r, s in rows
+        ],
+    )
+
+
+def ingest(db: Session, user_id: int, batch: schemas.SightingBatch) -> dict:
+    """Guarda las muestras del lote y devuelve cuántas se aceptaron y cuántas se descartaron."""
+    rows, dropped = _resolve_rows(db, user_id, batch)
+    if rows:
+        if SIGHTINGS_USE_COPY and db.get_bind().dialect.driver == "psycopg2":
+            _copy_rows(db, rows)
+        else:
+            _insert_rows(db, rows)
+        # Las muestras cercanas de una reunión alimentan los tramos de permanencia de la asistencia
+        pings: dict[int, list[datetime]] = {}
+        for _, _, meeting_id, rssi, seen_at in rows:
+            if meeting_id is not None and rssi >= presence.PRESENCE_NEAR_RSSI:
+                pings.setdefault(meeting_id, []).append(seen_at)
+        intervals.record_presence(db, user_id, pings)
+        db.commit()
+    return {"accepted": len(rows), "dropped": dropped}
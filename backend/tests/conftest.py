@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Los módulos del backend se importan como en producción (desde backend/); importar db solo crea el
+# engine, no se conecta
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "postgresql+psycopg2://postgres@localhost:5432/beassistant_test")
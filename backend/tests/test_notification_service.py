@@ -0,0 +1,62 @@
+"""Envío en bloques a OneSignal: división de destinatarios, fallas parciales y timeout (sin red)."""
+import asyncio
+import json
+
+import httpx
+
+import notification_service
+from notification_service import OneSignalDelivery, stub_transport
+
+
+def _delivery(transport, chunk_size=2):
+    return OneSignalDelivery(app_id="app", rest_api_key="key", transport=transport, chunk_size=chunk_size, max_retries=0)
+
+
+def test_send_splits_recipients_in_chunks():
+    sent = []
+    delivery = _delivery(stub_transport(sent=sent))
+
+    result = asyncio.run(delivery.send(["a", "b", "c", "d", "e"], "t", "m", {"k": 1}))
+
+    assert sorted(body["include_player_ids"] for body in sent) == [["a", "b"], ["c", "d"], ["e"]]
+    assert all(body["data"] == {"k": 1} for body in sent)
+    assert result["chunks"] == 3
+    assert result["recipients"] == 5
+    assert "errors" not in result
+
+
+def test_partial_failure_reports_only_the_failed_chunk():
+    def handler(request: httpx.Request) -> httpx.Response:
+        ids = json.loads(request.content)["include_player_ids"]
+        if "c" in ids:
+            return httpx.Response(400, json={"errors": ["invalid"]})
+        return httpx.Response(200, json={"id": "ok", "recipients": len(ids)})
+
+    delivered = set()
+    delivery = _delivery(httpx.MockTransport(handler))
+    result = asyncio.run(delivery.send(["a", "b", "c", "d", "e"], "t", "m", delivered=delivered))
+
+    assert result["failed_player_ids"] == ["c", "d"]
+    assert result["recipients"] == 3
+    assert delivered == {"a", "b", "e"}
+    # Salió parte del envío: no es un error total, el outbox reintenta solo a failed_player_ids
+    assert "error" not in result
+
+
+def test_timeout_returns_the_unconfirmed_recipients(monkeypatch):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        ids = json.loads(request.content)["include_player_ids"]
+        if "c" in ids:
+            await asyncio.sleep(5)
+        return httpx.Response(200, json={"id": "ok", "recipients": len(ids)})
+
+    monkeypatch.setattr(notification_service, "delivery", _delivery(httpx.MockTransport(handler)))
+    monkeypatch.setattr(notification_service, "ONESIGNAL_SEND_TIMEOUT_SECONDS", 0.5)
+    try:
+        result = notification_service.send_notification_to_players(["a", "b", "c", "d", "e"], "t", "m")
+    finally:
+        notification_service.shutdown()
+
+    assert result["failed_player_ids"] == ["c", "d"]
+    assert result["recipients"] == 3
+    assert "error" not in result
@@ -0,0 +1,78 @@
+"""
+Cache en memoria de identidades de usuario para el modo JWT sin estado.
+Guarda una copia liviana (no ORM) de cada usuario, acotada en tamaño y en tiempo de vida.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "4096"))
+# invalidate() solo limpia el cache de este proceso: los demás workers ven un cambio de usuario (is_admin,
+# token_version) recién cuando su copia expira, así que el TTL es el máximo de ese desfase
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "10"))
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """Snapshot de solo lectura de un usuario; compatible con schemas.User (from_attributes)."""
+    id: int
+    name: str
+    email: str
+    is_admin: bool
+    onesignal_player_id: Optional[str]
+    token_version: int
+
+    @classmethod
+    def from_orm_user(cls, user) -> "CachedUser":
+        return cls(
+            id=user.id,
+            name=user.name,
+            email=user.email,
+            is_admin=bool(user.is_admin),
+            onesignal_player_id=user.onesignal_player_id,
+            token_version=user.token_version or 0,
+        )
+
+
+_lock = threading.Lock()
+_entries: "OrderedDict[int, tuple[float, CachedUser]]" = OrderedDict()
+
+
+def get(user_id: int) -> Optional[CachedUser]:
+    """Devuelve el usuario cacheado si existe y no expiró."""
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del _entries[user_id]
+            return None
+        _entries.move_to_end(user_id)
+        return user
+
+
+def put(user) -> CachedUser:
+    """Guarda (o reemplaza) la copia de un usuario y la devuelve."""
+    cached = user if isinstance(user, CachedUser) else CachedUser.from_orm_user(user)
+    with _lock:
+        _entries[cached.id] = (time.monotonic() + USER_CACHE_TTL_SECONDS, cached)
+        _entries.move_to_end(cached.id)
+        while len(_entries) > USER_CACHE_SIZE:
+            _entries.popitem(last=False)
+    return cached
+
+
+def invalidate(user_id: int) -> None:
+    """Elimina un usuario del cache (llamar tras cualquier cambio del usuario)."""
+    with _lock:
+        _entries.pop(user_id, None)
+
+
+def clear() -> None:
+    with _lock:
+        _entries.clear()